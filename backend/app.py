@@ -1,98 +1,342 @@
-import os
+"""
+The JochiesLeague API.
+
+create_app() builds the app from the environment; `flask --app app` and
+gunicorn ('app:create_app()') call it. Startup does no I/O and stays clear
+of the heavy packages: the schema is managed by `flask --app app db ...`
+(Flask-Migrate is only imported for those commands), the Google OAuth
+client is set up on the first login and morph rendering imports numpy and
+scipy on the first morph request.
+"""
+
 import math
-import secrets
+import os
 from datetime import datetime, date, timedelta
 from functools import wraps
 
-from flask import Flask, redirect, url_for, session, request, jsonify
+import click
+from flask import (Blueprint, Flask, Response, current_app, redirect, url_for, session, request, jsonify,
+                   send_file, abort)
+from flask.cli import AppGroup
 from flask_cors import CORS
 from flask_login import LoginManager, login_user, logout_user, current_user, login_required
-from authlib.integrations.flask_client import OAuth
+from sqlalchemy import update
 from dotenv import load_dotenv
 
-from models import db, User, CheckIn, Reaction, UserSecret
+from models import db, User, CheckIn, Reaction, insert_unless_exists
+from leaderboard import (ReactionConflict, iter_leaderboard, iter_history, check_consistency, set_reaction,
+                         checkin_event, reaction_event)
+from standings import STANDINGS_ORDERS, claim_rank, record_checkin, iter_standings, rebuild_standings
+from events import LEADERBOARD_CHANNEL, create_pubsub, event_stream
+from http_cache import ResponseCache
+from compression import Compression
+from json_stream import json_response
+from tokens import create_token_store
+from identity import IdentityCache
+from geofence import create_venue_index
+from metrics import Metrics
+from db_pool import DatabasePool
+from blobstore import create_blob_store, guess_image_mimetype, is_valid_key
+from concurrency import make_cooperative
+from morph_service import (FORMATS as MORPH_FORMATS, InvalidMorph, MorphService, MorphServiceBusy, MorphSpec,
+                           morph_urls)
+from secret_codes import (ALL_SECRETS, SECRET_BITS, found_count, record_secrets, rebuild_secret_progress,
+                          secret_progress, secret_stats, unknown_secrets, user_secrets_mask)
+from photos import (InvalidPhoto, PhotoPipeline, PhotoPipelineBusy, THUMBNAIL_SIZES,
+                    decode_data_url, ingest_photo_sync, photo_blob_key, store_photo, blob_store)
 
 load_dotenv()
 
-# Science Park Amsterdam coordinates
-SCIENCE_PARK_LAT = 52.3547
-SCIENCE_PARK_LNG = 4.9543
-# Haarlemmerstraat 58 Amsterdam coordinates (TESTING)
-# SCIENCE_PARK_LAT = 52.3803
-# SCIENCE_PARK_LNG = 4.8882
-ALLOWED_RADIUS_METERS = 10000
-
-app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-
-# Database config
-database_url = os.environ.get('DATABASE_URL', 'sqlite:///jochiesleague.db')
-# Render uses postgres:// but SQLAlchemy needs postgresql://
-if database_url.startswith('postgres://'):
-    database_url = database_url.replace('postgres://', 'postgresql://', 1)
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Session config for cross-origin
-app.config['SESSION_COOKIE_SAMESITE'] = 'None'
-app.config['SESSION_COOKIE_SECURE'] = True
-
-# Initialize extensions
-db.init_app(app)
-
-# CORS - allow frontend origin
-frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
-CORS(app, 
-     supports_credentials=True, 
-     origins=[frontend_url, 'http://localhost:3000'],
-     allow_headers=['Content-Type', 'Authorization'],
-     methods=['GET', 'POST', 'OPTIONS'])
-
-# Login manager
+# Under the gevent worker class, Postgres queries must yield to other requests
+make_cooperative()
+
+# Extensions, set up for an app by create_app()
+db_pool = DatabasePool()
+photo_pipeline = PhotoPipeline()
+morph_service = MorphService()
+identity_cache = IdentityCache()
+response_cache = ResponseCache()
+metrics = Metrics()
+compression = Compression()
 login_manager = LoginManager()
-login_manager.init_app(app)
+
+# Every route and command; commands are top level (`flask --app app sweep-tokens`)
+api = Blueprint('api', __name__, cli_group=None)
+
+
+def configure(app):
+    """Read the settings from the environment."""
+    app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+    app.config['FRONTEND_URL'] = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
+    app.config['GOOGLE_CLIENT_ID'] = os.environ.get('GOOGLE_CLIENT_ID')
+    app.config['GOOGLE_CLIENT_SECRET'] = os.environ.get('GOOGLE_CLIENT_SECRET')
+
+    # Database config
+    database_url = os.environ.get('DATABASE_URL', 'sqlite:///jochiesleague.db')
+    # Render uses postgres:// but SQLAlchemy needs postgresql://
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Connection pool per worker, see db_pool.py: 'queue' or 'null' (behind PgBouncer)
+    app.config['DB_POOL_MODE'] = os.environ.get('DB_POOL_MODE', 'queue')
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    # Milliseconds SQLite waits for a lock (local runs)
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+
+    # Photo storage: 'database' or 'local' (files under PHOTO_STORAGE_DIR,
+    # only where that directory survives deploys)
+    app.config['BLOB_STORE'] = os.environ.get('BLOB_STORE', 'database')
+    app.config['PHOTO_STORAGE_DIR'] = os.environ.get(
+        'PHOTO_STORAGE_DIR', os.path.join(app.instance_path, 'photos'))
+    # Photo ingest: decoded size cap and bounded worker pool
+    app.config['MAX_PHOTO_BYTES'] = int(os.environ.get('MAX_PHOTO_BYTES', 8 * 1024 * 1024))
+    app.config['PHOTO_WORKERS'] = int(os.environ.get('PHOTO_WORKERS', 2))
+    app.config['PHOTO_QUEUE_SIZE'] = int(os.environ.get('PHOTO_QUEUE_SIZE', 8))
+    # Seconds an upload waits for a place in a full queue before a 503
+    app.config['PHOTO_SUBMIT_TIMEOUT'] = float(os.environ.get('PHOTO_SUBMIT_TIMEOUT', 10))
+    app.config['PHOTO_INGEST_TIMEOUT'] = 30
+    # Base64 adds a third on top of the photo; reject anything bigger before parsing
+    app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_PHOTO_BYTES'] * 4 // 3 + 64 * 1024
+
+    # Bearer tokens: lifetime and the in-process read-through cache (TTL 0 disables it)
+    app.config['AUTH_TOKEN_TTL'] = timedelta(days=30)
+    app.config['TOKEN_CACHE_SIZE'] = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+    app.config['TOKEN_CACHE_TTL'] = int(os.environ.get('TOKEN_CACHE_TTL', 60))
+
+    # User identity and today's check-in caches (TTLs in seconds)
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 2048))
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 300))
+    app.config['CHECKIN_CACHE_TTL'] = int(os.environ.get('CHECKIN_CACHE_TTL', 3600))
+
+    # Live leaderboard events: 'inprocess' (single worker) or 'redis' (REDIS_URL)
+    app.config['PUBSUB_BACKEND'] = os.environ.get('PUBSUB_BACKEND', 'inprocess')
+    app.config['REDIS_URL'] = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    # Streams end after this many seconds and the browser reconnects
+    app.config['SSE_MAX_DURATION'] = int(os.environ.get('SSE_MAX_DURATION', 300))
+
+    # Cached bodies of read endpoints, keyed by revision (TTL bounds staleness
+    # when several workers run without a shared pub/sub backend)
+    app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+    app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+    # JSON responses from this many bytes on are compressed (gzip, or brotli
+    # with the brotli package)
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+    # Request instrumentation (/metrics): log requests issuing more SQL statements
+    # than this, and optionally report timings in a Server-Timing header
+    app.config['QUERY_WARNING_THRESHOLD'] = int(os.environ.get('QUERY_WARNING_THRESHOLD', 20))
+    app.config['SERVER_TIMING'] = os.environ.get('SERVER_TIMING', 'false').lower() == 'true'
+
+    # Check-in venues: a JSON list or the path of a JSON file (see geofence.py),
+    # Science Park by default. The grid size is in degrees.
+    app.config['VENUES'] = os.environ.get('VENUES')
+    app.config['VENUE_GRID_SIZE'] = float(os.environ.get('VENUE_GRID_SIZE', 0.05))
+
+    # On-demand photo morphs: disk cache (LRU beyond the byte budget), bounded
+    # render pool and request limits
+    app.config['MORPH_CACHE_DIR'] = os.environ.get(
+        'MORPH_CACHE_DIR', os.path.join(app.instance_path, 'morphs'))
+    app.config['MORPH_CACHE_MAX_BYTES'] = int(os.environ.get('MORPH_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    app.config['MORPH_WORKERS'] = int(os.environ.get('MORPH_WORKERS', 1))
+    app.config['MORPH_QUEUE_SIZE'] = int(os.environ.get('MORPH_QUEUE_SIZE', 4))
+    app.config['MORPH_MAX_FRAMES'] = int(os.environ.get('MORPH_MAX_FRAMES', 60))
+    app.config['MORPH_MAX_SIZE'] = int(os.environ.get('MORPH_MAX_SIZE', 800))
+
+    # Session config for cross-origin
+    app.config['SESSION_COOKIE_SAMESITE'] = 'None'
+    app.config['SESSION_COOKIE_SECURE'] = True
+
+
+def create_app(config=None):
+    """Create the app. `config` overrides settings read from the environment."""
+    app = Flask(__name__)
+    configure(app)
+    if config:
+        app.config.update(config)
+
+    db_pool.init_app(app)
+    db.init_app(app)
+    app.extensions['blob_store'] = create_blob_store(app)
+    photo_pipeline.init_app(app)
+    morph_service.init_app(app)
+    app.extensions['token_store'] = create_token_store(app)
+    identity_cache.init_app(app)
+    app.extensions['pubsub'] = create_pubsub(app)
+    response_cache.init_app(app, app.extensions['pubsub'])
+    metrics.init_app(app)
+    # after_request hooks run last registered first: metrics see the compressed body
+    compression.init_app(app)
+    app.extensions['venues'] = create_venue_index(app)
+    login_manager.init_app(app)
+
+    # CORS - allow frontend origin
+    CORS(app,
+         supports_credentials=True,
+         origins=[app.config['FRONTEND_URL'], 'http://localhost:3000'],
+         allow_headers=['Content-Type', 'Authorization'],
+         methods=['GET', 'POST', 'OPTIONS'])
+
+    app.register_blueprint(api)
+    app.cli.add_command(migrations)
+    return app
+
+
+def token_store():
+    """The app's auth token store (see tokens.py)."""
+    return current_app.extensions['token_store']
+
+
+def pubsub():
+    """The app's pub/sub backend for live leaderboard events."""
+    return current_app.extensions['pubsub']
+
+
+def venues():
+    """The app's check-in venues (see geofence.py)."""
+    return current_app.extensions['venues']
+
+
+def all_cache_stats():
+    """Stats of this worker's in-process caches, by cache name."""
+    stats = identity_cache.stats()
+    if hasattr(token_store(), 'cache'):
+        stats['tokens'] = token_store().cache.stats()
+    stats['responses'] = response_cache.stats()
+    stats['morphs'] = morph_service.cache.stats()
+    return stats
+
+
+def _cache_metric(field):
+    return lambda: {(('cache', name),): s[field] for name, s in all_cache_stats().items()}
+
+
+def _pool_metric(read):
+    def collect():
+        value = read(db_pool.stats)
+        return {(('mode', db_pool.mode),): value} if value is not None else {}
+    return collect
+
+
+metrics.register('cache_hits_total', 'counter', 'In-process cache hits.', _cache_metric('hits'))
+metrics.register('cache_misses_total', 'counter', 'In-process cache misses.', _cache_metric('misses'))
+metrics.register('cache_entries', 'gauge', 'Entries held by in-process caches.', _cache_metric('size'))
+metrics.register('db_pool_checkout_seconds', 'histogram',
+                 'Time to get a database connection: waiting for a free one or opening one.',
+                 _pool_metric(lambda stats: stats.checkout_time))
+metrics.register('db_pool_checkout_timeouts_total', 'counter',
+                 'Checkouts that gave up after DB_POOL_TIMEOUT.', _pool_metric(lambda stats: stats.timeouts))
+metrics.register('db_pool_connections_in_use', 'gauge', 'Database connections checked out.',
+                 _pool_metric(lambda stats: stats.in_use))
+metrics.register('db_pool_saturation', 'gauge', 'Share of the pool (size plus overflow) in use.',
+                 _pool_metric(lambda stats: stats.saturation()))
+
+# ============ SCHEMA ============
+
+def init_migrate(app):
+    """Set up Flask-Migrate for the app (once), for the `db` commands and upgrade()."""
+    if 'migrate' not in app.extensions:
+        from flask_migrate import Migrate
+        # Schema changes live in migrations/
+        Migrate(app, db, render_as_batch=True)
+
+
+class MigrationsGroup(AppGroup):
+    """
+    `flask --app app db ...`: Flask-Migrate's commands.
+
+    Alembic takes a third of a second to import, so it is only loaded when
+    one of these commands runs, not by every worker on startup.
+    """
+
+    def _commands(self, ctx):
+        init_migrate(current_app._get_current_object())
+        from flask_migrate.cli import db as commands
+        return commands
+
+    def list_commands(self, ctx):
+        return self._commands(ctx).list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._commands(ctx).get_command(ctx, name)
+
+
+migrations = MigrationsGroup('db', help='Perform database migrations.')
+
+# ============ LOGIN ============
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(user_id)
+    return identity_cache.get_user(user_id)
 
-# Simple token store (in production, use Redis or database)
-# Maps token -> {user_id, expires}
-auth_tokens = {}
 
-# OAuth setup
-oauth = OAuth(app)
-google = oauth.register(
-    name='google',
-    client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-    client_secret=os.environ.get('GOOGLE_CLIENT_SECRET'),
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={'scope': 'openid email profile'},
-)
+def google_oauth():
+    """
+    The Google OAuth client, registered on the first login.
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two coordinates in meters using Haversine formula."""
-    R = 6371000  # Earth's radius in meters
-    
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_phi / 2) ** 2 + \
-        math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    return R * c
+    Authlib fetches Google's OpenID configuration on first use and keeps it
+    on the client, so each worker fetches it once.
+    """
+    client = current_app.extensions.get('google_oauth')
+    if client is None:
+        from authlib.integrations.flask_client import OAuth
+        oauth = OAuth(current_app._get_current_object())
+        client = current_app.extensions['google_oauth'] = oauth.register(
+            name='google',
+            client_id=current_app.config['GOOGLE_CLIENT_ID'],
+            client_secret=current_app.config['GOOGLE_CLIENT_SECRET'],
+            server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+            client_kwargs={'scope': 'openid email profile'},
+        )
+    return client
+
+def read_coordinates(data):
+    """(lat, lng) from a request body, or None if missing or invalid."""
+    try:
+        lat, lng = float(data['latitude']), float(data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    # float() also accepts NaN, inf and 1e400
+    if not (math.isfinite(lat) and math.isfinite(lng)) or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+def too_far_response(lat, lng):
+    """400 naming the nearest venue and how far away it is."""
+    venue, distance = venues().nearest(lat, lng)
+    return jsonify({
+        'error': f'Too far from {venue.name}',
+        'venue': venue.to_dict(),
+        'distance': round(distance, 1),
+        'allowed_radius': venue.radius
+    }), 400
+
+def leaderboard_scope(day=None):
+    """Revision scope of a day's leaderboard."""
+    return f'leaderboard:{(day or date.today()).isoformat()}'
+
+def standings_scope(day=None):
+    """Revision scope of the standings as of a day (streaks lapse at midnight)."""
+    return f'standings:{(day or date.today()).isoformat()}'
+
+def publish_event(message):
+    """Publish a leaderboard delta. Live updates are best effort."""
+    try:
+        pubsub().publish(LEADERBOARD_CHANNEL, message)
+    except Exception as e:
+        print(f"Publish error: {e}")
 
 def get_user_from_token():
     """Get user from Bearer token in Authorization header."""
     auth_header = request.headers.get('Authorization', '')
     if auth_header.startswith('Bearer '):
-        token = auth_header[7:]
-        token_data = auth_tokens.get(token)
-        if token_data and token_data['expires'] > datetime.utcnow():
-            return User.query.get(token_data['user_id'])
+        token_data = token_store().lookup(auth_header[7:])
+        if token_data:
+            return identity_cache.get_user(token_data[0])
     return None
 
 def api_login_required(f):
@@ -103,6 +347,11 @@ def api_login_required(f):
         user = current_user if current_user.is_authenticated else get_user_from_token()
         if not user:
             return jsonify({'error': 'Not authenticated'}), 401
+        # The user is a detached snapshot (see identity.py). Give the token
+        # lookup's connection back to the pool before reading the body, so
+        # slow uploads don't hold one each
+        if request.content_length:
+            db.session.close()
         # Store user for the request
         request.api_user = user
         return f(*args, **kwargs)
@@ -110,21 +359,21 @@ def api_login_required(f):
 
 # ============ AUTH ROUTES ============
 
-@app.route('/auth/login')
+@api.route('/auth/login')
 def login():
     """Redirect to Google OAuth."""
-    redirect_uri = url_for('auth_callback', _external=True)
-    return google.authorize_redirect(redirect_uri)
+    redirect_uri = url_for('api.auth_callback', _external=True)
+    return google_oauth().authorize_redirect(redirect_uri)
 
-@app.route('/auth/callback')
+@api.route('/auth/callback')
 def auth_callback():
     """Handle Google OAuth callback."""
     try:
-        token = google.authorize_access_token()
+        token = google_oauth().authorize_access_token()
         user_info = token.get('userinfo')
         
         if not user_info:
-            return redirect(f"{frontend_url}?error=auth_failed")
+            return redirect(f"{current_app.config['FRONTEND_URL']}?error=auth_failed")
         
         # Find or create user
         user = User.query.get(user_info['sub'])
@@ -137,41 +386,42 @@ def auth_callback():
             )
             db.session.add(user)
             db.session.commit()
+            # One more player: total_players and the percentages change
+            response_cache.bump('secret_stats')
         else:
             # Update user info
             user.name = user_info['name']
             user.picture = user_info.get('picture')
             db.session.commit()
+            identity_cache.invalidate_user(user.id)
+            # Names and pictures show up in every cached leaderboard
+            response_cache.invalidate_all()
         
         login_user(user)
         
         # Generate auth token for mobile/cross-origin support
-        auth_token = secrets.token_urlsafe(32)
-        auth_tokens[auth_token] = {
-            'user_id': user.id,
-            'expires': datetime.utcnow() + timedelta(days=30)
-        }
-        
-        # Clean up expired tokens
-        now = datetime.utcnow()
-        expired = [t for t, data in auth_tokens.items() if data['expires'] < now]
-        for t in expired:
-            del auth_tokens[t]
+        # (the store also sweeps a batch of expired tokens now and then)
+        auth_token = token_store().issue(user.id, current_app.config['AUTH_TOKEN_TTL'])
         
-        return redirect(f"{frontend_url}?auth_token={auth_token}")
+        return redirect(f"{current_app.config['FRONTEND_URL']}?auth_token={auth_token}")
     
     except Exception as e:
         # Log the error and redirect to frontend with error
         print(f"Auth callback error: {e}")
-        return redirect(f"{frontend_url}?error=auth_error")
+        return redirect(f"{current_app.config['FRONTEND_URL']}?error=auth_error")
 
-@app.route('/auth/logout')
+@api.route('/auth/logout', methods=['GET', 'POST'])
 def logout():
-    """Log out the current user."""
+    """Log out the current user, revoking the bearer token sent along (POST from the frontend)."""
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        token_store().revoke(auth_header[7:])
     logout_user()
-    return redirect(frontend_url)
+    if request.method == 'POST':
+        return jsonify({'success': True})
+    return redirect(current_app.config['FRONTEND_URL'])
 
-@app.route('/auth/user')
+@api.route('/auth/user')
 def get_current_user():
     """Get current logged-in user info."""
     # Try session auth first, then token auth
@@ -188,37 +438,40 @@ def get_current_user():
         })
     return jsonify({'authenticated': False})
 
+@api.cli.command('sweep-tokens')
+@click.option('--batch-size', default=500, help='Tokens to delete per batch.')
+def sweep_tokens(batch_size):
+    """Delete all expired auth tokens, in batches."""
+    total = 0
+    while True:
+        deleted = token_store().sweep_expired(batch_size)
+        total += deleted
+        if deleted < batch_size:
+            break
+    click.echo(f'Deleted {total} expired tokens.')
+
 # ============ CHECK-IN ROUTES ============
 
-@app.route('/api/verify-location', methods=['POST'])
+@api.route('/api/verify-location', methods=['POST'])
 @api_login_required
 def verify_location():
-    """Verify user is at Science Park (step 1 of check-in)."""
+    """Verify user is at one of the venues (step 1 of check-in)."""
     user = request.api_user
     data = request.get_json()
     
-    if not data or 'latitude' not in data or 'longitude' not in data:
+    coordinates = read_coordinates(data or {})
+    if coordinates is None:
         return jsonify({'error': 'Missing coordinates'}), 400
+    lat, lng = coordinates
     
-    lat = data['latitude']
-    lng = data['longitude']
-    
-    # Calculate distance to Science Park
-    distance = haversine_distance(lat, lng, SCIENCE_PARK_LAT, SCIENCE_PARK_LNG)
-    
-    if distance > ALLOWED_RADIUS_METERS:
-        return jsonify({
-            'error': 'Too far from Science Park',
-            'distance': round(distance, 1),
-            'allowed_radius': ALLOWED_RADIUS_METERS
-        }), 400
+    match = venues().match(lat, lng)
+    if match is None:
+        return too_far_response(lat, lng)
+    venue, distance = match
     
     # Check if already checked in today
     today = date.today()
-    existing = CheckIn.query.filter_by(
-        user_id=user.id,
-        check_in_date=today
-    ).first()
+    existing = identity_cache.get_today_checkin(user.id, today)
     
     if existing:
         return jsonify({
@@ -229,45 +482,38 @@ def verify_location():
     return jsonify({
         'success': True,
         'message': 'Location verified! Take a photo to complete check-in.',
+        'venue': venue.to_dict(),
         'distance': round(distance, 1),
         'latitude': lat,
         'longitude': lng
     })
 
 
-@app.route('/api/checkin', methods=['POST'])
+@api.route('/api/checkin', methods=['POST'])
 @api_login_required
 def checkin():
     """Complete check-in with photo (step 2)."""
     user = request.api_user
     data = request.get_json()
     
-    if not data or 'latitude' not in data or 'longitude' not in data:
+    coordinates = read_coordinates(data or {})
+    if coordinates is None:
         return jsonify({'error': 'Missing coordinates'}), 400
     
     if not data.get('photo'):
         return jsonify({'error': 'Photo is required'}), 400
     
-    lat = data['latitude']
-    lng = data['longitude']
-    photo_data = data['photo']
+    lat, lng = coordinates
     
     # Verify location again (in case of tampering)
-    distance = haversine_distance(lat, lng, SCIENCE_PARK_LAT, SCIENCE_PARK_LNG)
-    
-    if distance > ALLOWED_RADIUS_METERS:
-        return jsonify({
-            'error': 'Too far from Science Park',
-            'distance': round(distance, 1),
-            'allowed_radius': ALLOWED_RADIUS_METERS
-        }), 400
+    match = venues().match(lat, lng)
+    if match is None:
+        return too_far_response(lat, lng)
+    venue, distance = match
     
     # Check if already checked in today
     today = date.today()
-    existing = CheckIn.query.filter_by(
-        user_id=user.id,
-        check_in_date=today
-    ).first()
+    existing = identity_cache.get_today_checkin(user.id, today)
     
     if existing:
         return jsonify({
@@ -275,35 +521,61 @@ def checkin():
             'check_in_time': existing.check_in_time.isoformat()
         }), 400
     
-    # Create check-in with photo
-    checkin = CheckIn(
+    # Store the photo in the blob store, the check-in only keeps its key.
+    # The photo workers may write to the database (BLOB_STORE=database), so
+    # don't hold a pooled connection while waiting for them
+    db.session.close()
+    try:
+        photo_id = store_photo(data['photo'])
+    except InvalidPhoto as e:
+        return jsonify({'error': str(e)}), 400
+    except PhotoPipelineBusy as e:
+        return jsonify({'error': str(e)}), 503
+    
+    # Take the day's next rank first; it holds concurrent check-ins until
+    # this one commits, so its check-in time comes after theirs
+    rank = claim_rank(today)
+    
+    # Create check-in with photo; a concurrent check-in of the same user
+    # makes this a no-op instead of an IntegrityError
+    checkin = insert_unless_exists(
+        CheckIn, ['user_id', 'check_in_date'],
         user_id=user.id,
         check_in_date=today,
         check_in_time=datetime.utcnow(),
         latitude=lat,
         longitude=lng,
-        photo_data=photo_data
+        venue=venue.id,
+        photo_id=photo_id
     )
-    db.session.add(checkin)
+    if checkin is None:
+        db.session.rollback()
+        existing = identity_cache.get_today_checkin(user.id, today)
+        return jsonify({
+            'error': 'Already checked in today',
+            'check_in_time': existing.check_in_time.isoformat()
+        }), 400
+    record_checkin(user.id, today, rank)
     db.session.commit()
+    identity_cache.remember_checkin(checkin)
+    response_cache.bump(leaderboard_scope(today), 'history', standings_scope(today))
+    publish_event(checkin_event(checkin, user, rank))
     
     return jsonify({
         'success': True,
         'message': 'Checked in successfully!',
         'check_in_time': checkin.check_in_time.isoformat(),
+        'venue': venue.to_dict(),
         'distance': round(distance, 1)
     })
 
-@app.route('/api/status')
+@api.route('/api/status')
 @api_login_required
 def get_status():
     """Get current user's check-in status for today."""
     user = request.api_user
     today = date.today()
-    checkin = CheckIn.query.filter_by(
-        user_id=user.id,
-        check_in_date=today
-    ).first()
+    checkin = identity_cache.get_today_checkin(user.id, today)
     
     if checkin:
         return jsonify({
@@ -314,21 +586,26 @@ def get_status():
 
 # ============ REACTION ROUTES ============
 
-@app.route('/api/react', methods=['POST'])
+@api.route('/api/react', methods=['POST'])
 @api_login_required
 def give_reaction():
     """Give a like or dislike to a check-in."""
     user = request.api_user
     data = request.get_json()
     
-    if not data or 'checkin_id' not in data or 'reaction_type' not in data:
+    if not isinstance(data, dict) or 'checkin_id' not in data or 'reaction_type' not in data:
         return jsonify({'error': 'Missing checkin_id or reaction_type'}), 400
     
     checkin_id = data['checkin_id']
-    reaction_type = data['reaction_type'].lower()
+    reaction_type = data['reaction_type']
     
-    if reaction_type not in ['like', 'dislike']:
+    # bool is an int too, but true/false are not check-in ids
+    if not isinstance(checkin_id, int) or isinstance(checkin_id, bool):
+        return jsonify({'error': 'checkin_id must be an integer'}), 400
+    
+    if not isinstance(reaction_type, str) or reaction_type.lower() not in ['like', 'dislike']:
         return jsonify({'error': 'reaction_type must be "like" or "dislike"'}), 400
+    reaction_type = reaction_type.lower()
     
     # Get the check-in
     checkin = CheckIn.query.get(checkin_id)
@@ -346,47 +623,33 @@ def give_reaction():
         return jsonify({'error': 'Cannot react to your own check-in'}), 400
     
     # Rule: Must have checked in today to give reactions
-    user_checkin = CheckIn.query.filter_by(
-        user_id=user.id,
-        check_in_date=today
-    ).first()
+    user_checkin = identity_cache.get_today_checkin(user.id, today)
     
     if not user_checkin:
         return jsonify({'error': 'Must check in today before giving reactions'}), 400
     
-    # Check if user already reacted today
-    existing_reaction = Reaction.query.filter_by(
-        user_id=user.id,
-        reaction_date=today
-    ).first()
+    # Insert or change the user's reaction of the day in place
+    try:
+        old = set_reaction(user.id, today, checkin_id, reaction_type)
+    except ReactionConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
     
-    if existing_reaction:
-        # Update existing reaction
-        existing_reaction.checkin_id = checkin_id
-        existing_reaction.reaction_type = reaction_type
-        db.session.commit()
-        return jsonify({
-            'success': True,
-            'message': f'Changed reaction to {reaction_type}',
-            'reaction_type': reaction_type
-        })
+    response_cache.bump(leaderboard_scope(today), standings_scope(today))
+    if old is None:
+        publish_event(reaction_event(today, [checkin_id]))
+        message = f'Gave {reaction_type} successfully'
     else:
-        # Create new reaction
-        reaction = Reaction(
-            user_id=user.id,
-            checkin_id=checkin_id,
-            reaction_type=reaction_type,
-            reaction_date=today
-        )
-        db.session.add(reaction)
-        db.session.commit()
-        return jsonify({
-            'success': True,
-            'message': f'Gave {reaction_type} successfully',
-            'reaction_type': reaction_type
-        })
+        publish_event(reaction_event(today, [old[0], checkin_id]))
+        message = f'Changed reaction to {reaction_type}'
+    return jsonify({
+        'success': True,
+        'message': message,
+        'reaction_type': reaction_type
+    })
 
-@app.route('/api/my-reaction')
+@api.route('/api/my-reaction')
 @api_login_required
 def get_my_reaction():
     """Get current user's reaction for today."""
@@ -408,138 +671,160 @@ def get_my_reaction():
 
 # ============ LEADERBOARD ROUTES ============
 
-@app.route('/api/leaderboard')
+@api.route('/api/leaderboard')
+@response_cache.cached(leaderboard_scope)
 def get_leaderboard():
     """Get today's leaderboard with reaction counts."""
     today = date.today()
-    checkins = CheckIn.query.filter_by(check_in_date=today)\
-        .order_by(CheckIn.check_in_time.asc())\
-        .all()
-    
-    leaderboard = []
-    for i, checkin in enumerate(checkins):
-        # Count likes and dislikes for this check-in
-        likes = Reaction.query.filter_by(
-            checkin_id=checkin.id,
-            reaction_type='like'
-        ).count()
-        
-        dislikes = Reaction.query.filter_by(
-            checkin_id=checkin.id,
-            reaction_type='dislike'
-        ).count()
-        
-        leaderboard.append({
-            'rank': i + 1,
-            'checkin_id': checkin.id,
-            'name': checkin.user.name,
-            'picture': checkin.user.picture,
-            'check_in_time': checkin.check_in_time.isoformat(),
-            'photo': checkin.photo_data,
-            'likes': likes,
-            'dislikes': dislikes
-        })
-    
-    return jsonify({
+    return json_response({
         'date': today.isoformat(),
-        'leaderboard': leaderboard
+        'leaderboard': iter_leaderboard(today)
     })
 
-@app.route('/api/history')
-def get_history():
-    """Get all-time check-in history (last 30 days)."""
-    from sqlalchemy import func
-    
-    # Get unique dates with check-ins, ordered by date desc
-    dates_with_checkins = db.session.query(CheckIn.check_in_date)\
-        .distinct()\
-        .order_by(CheckIn.check_in_date.desc())\
-        .limit(30)\
-        .all()
-    
-    history = []
-    for (check_date,) in dates_with_checkins:
-        checkins = CheckIn.query.filter_by(check_in_date=check_date)\
-            .order_by(CheckIn.check_in_time.asc())\
+@api.route('/api/leaderboard/stream')
+def leaderboard_stream():
+    """Server-Sent Events with live leaderboard deltas (new check-ins, reaction tallies)."""
+    stream = event_stream(pubsub(), LEADERBOARD_CHANNEL, max_duration=current_app.config['SSE_MAX_DURATION'])
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@api.cli.command('check-leaderboard')
+@click.option('--date', 'day', type=click.DateTime(formats=['%Y-%m-%d']), help='Day to check (default today).')
+@click.option('--all-dates', is_flag=True, help='Check every day with check-ins.')
+@click.option('--fix', is_flag=True, help='Overwrite drifted tallies with the recomputed ones.')
+def check_leaderboard(day, all_dates, fix):
+    """Compare materialized like/dislike tallies against a full recompute."""
+    if all_dates:
+        days = [d for (d,) in db.session.query(CheckIn.check_in_date).distinct().order_by(CheckIn.check_in_date)]
+    else:
+        days = [day.date() if day else date.today()]
+    total = 0
+    for d in days:
+        for checkin_id, stored, recomputed in check_consistency(d, fix=fix):
+            click.echo(f'{d} check-in {checkin_id}: stored {stored}, recomputed {recomputed}')
+            total += 1
+    if total:
+        click.echo(f'{total} mismatches' + (' fixed.' if fix else '.'))
+    else:
+        click.echo('Leaderboard tallies are consistent.')
+    if total and not fix:
+        raise SystemExit(1)
+
+@api.cli.command('check-venues')
+@click.option('--batch-size', default=10000, help='Check-ins to check per batch.')
+@click.option('--fix', is_flag=True, help='Store the matched venue on check-ins that have none.')
+def check_venues(batch_size, fix):
+    """Match every check-in's coordinates against the configured venues."""
+    import numpy as np
+    counts = {venue.id: 0 for venue in venues().venues}
+    outside = filled = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(CheckIn.id, CheckIn.latitude, CheckIn.longitude, CheckIn.venue)\
+            .filter(CheckIn.id > last_id)\
+            .order_by(CheckIn.id)\
+            .limit(batch_size)\
             .all()
-        
-        day_data = {
-            'date': check_date.isoformat(),
-            'entries': [{
-                'rank': i + 1,
-                'name': c.user.name,
-                'picture': c.user.picture,
-                'check_in_time': c.check_in_time.isoformat()
-            } for i, c in enumerate(checkins)]
-        }
-        history.append(day_data)
-    
-    return jsonify({'history': history})
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        ids, lats, lngs, stored = zip(*rows)
+        matched = venues().match_many(np.array(lats), np.array(lngs))
+        updates = []
+        for checkin_id, position, current in zip(ids, matched.tolist(), stored):
+            if position < 0:
+                outside += 1
+                click.echo(f'Check-in {checkin_id} is outside every venue')
+                continue
+            venue_id = venues().venues[position].id
+            counts[venue_id] += 1
+            if current is None:
+                updates.append({'id': checkin_id, 'venue': venue_id})
+        if fix and updates:
+            # Bulk UPDATE by primary key, one executemany per batch
+            db.session.execute(update(CheckIn), updates)
+            db.session.commit()
+        filled += len(updates)
+    for venue_id, count in counts.items():
+        click.echo(f'{venue_id}: {count} check-ins')
+    click.echo(f'{outside} outside every venue, {filled} without a stored venue' + (' (filled in).' if fix else '.'))
+
+@api.route('/api/history')
+@response_cache.cached(lambda: 'history')
+def get_history():
+    """Get check-in history, 30 days per page (newest first)."""
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), 90)
+        before = request.args.get('before')
+        before = date.fromisoformat(before) if before else None
+    except ValueError:
+        return jsonify({'error': 'Invalid days or before'}), 400
+    user_id = request.args.get('user_id') or None
+    
+    page = {}
+    return json_response({
+        'history': iter_history(page, days, before, user_id),
+        # Known once the days have been sent
+        'next_cursor': lambda: page['next_cursor']
+    })
+
+@api.route('/api/standings')
+@response_cache.cached(standings_scope)
+def get_standings():
+    """All-time standings: check-ins, average rank, streaks and net likes per user."""
+    order = request.args.get('sort', 'checkins')
+    if order not in STANDINGS_ORDERS:
+        return jsonify({'error': f'sort must be one of {", ".join(STANDINGS_ORDERS)}'}), 400
+    today = date.today()
+    # One row per user from user_stats (see standings.py)
+    return json_response({
+        'date': today.isoformat(),
+        'sort': order,
+        'standings': iter_standings(order, today)
+    })
+
+@api.cli.command('rebuild-standings')
+def rebuild_standings_command():
+    """Recompute the standings from checkins and reactions."""
+    users, days = rebuild_standings()
+    click.echo(f'Done, fixed the stats of {users} users and the count of {days} days.')
 
 # ============ SECRETS TRACKING ============
 
-# List of all available secrets
-ALL_SECRETS = [
-    'b_drag',          # Dragging B to make "Job" in title
-    'job_spawn',       # Typing "job" to spawn flying Job
-    'job_click',       # Clicking flying Job
-    'chess',           # Playing chess
-    'chess_victory',   # Beating the chess AI (unlocks Chess Jobje theme)
-    'ian',             # Ian flashbang
-    'smiling_friends', # Any smiling friends character
-    'ranking',         # Ranking game
-    'brainrot',        # Brainrot videos
-    'fnaf',            # FNAF jumpscare
-    'six_seven',       # 67 tilt
-    'monkey_cursor',   # Triggered monkey cursor punishment
-    'counter',         # Finding the secret counter
-    'theme_kabouter',  # Unlocking Kabouter theme
-    'bar_explosion',   # Shaking the progress bar until it explodes
-    'hollow_knight',   # Playing Hollow Knight game
-    'tweak_game',      # Playing IWBTC (tweak game)
-    'simo_peek',       # SIMO peeking up from bottom
-    'sacha_names',     # Sacha names ramping sequence with applause
-    'fortnite',        # Nickeh30 fortnite video easter egg
-    'legendary_theme'  # Unlocking legendary theme (100% completion)
-]
-
-@app.route('/api/secret/discover', methods=['POST'])
+def discover_secrets(user, codes):
+    """Record discoveries and invalidate the cached progress and stats if any were new."""
+    new_codes, mask = record_secrets(user.id, codes)
+    if new_codes:
+        response_cache.bump(f'secret_progress:{user.id}', 'secret_stats')
+    return new_codes, mask
+
+@api.route('/api/secret/discover', methods=['POST'])
 @api_login_required
 def discover_secret():
     """Record that a user discovered a secret."""
     user = request.api_user
     data = request.get_json()
     
-    if not data or 'secret_code' not in data:
+    if not isinstance(data, dict) or 'secret_code' not in data:
         return jsonify({'error': 'Missing secret_code'}), 400
     
     secret_code = data['secret_code']
     
-    if secret_code not in ALL_SECRETS:
+    # Lists and objects aren't hashable, check the type before the lookup
+    if not isinstance(secret_code, str) or secret_code not in SECRET_BITS:
         return jsonify({'error': 'Invalid secret_code'}), 400
     
-    # Check if already discovered
-    existing = UserSecret.query.filter_by(
-        user_id=user.id,
-        secret_code=secret_code
-    ).first()
+    new_codes, mask = discover_secrets(user, [secret_code])
     
-    if existing:
+    if not new_codes:
         return jsonify({
             'already_found': True,
             'message': 'You already found this secret!'
         })
     
-    # Record the discovery
-    secret = UserSecret(
-        user_id=user.id,
-        secret_code=secret_code
-    )
-    db.session.add(secret)
-    db.session.commit()
-    
-    # Calculate progress
-    total_found = UserSecret.query.filter_by(user_id=user.id).count()
+    total_found = found_count(mask)
     percentage = round((total_found / len(ALL_SECRETS)) * 100)
     
     return jsonify({
@@ -550,42 +835,227 @@ def discover_secret():
         'percentage': percentage
     })
 
-@app.route('/api/secret/progress')
+@api.route('/api/secret/discover/batch', methods=['POST'])
 @api_login_required
-def get_secret_progress():
-    """Get user's secret discovery progress."""
+def discover_secrets_batch():
+    """Record several discoveries at once; answers with the updated progress."""
     user = request.api_user
+    data = request.get_json(silent=True)
+    secret_codes = data.get('secret_codes') if isinstance(data, dict) else None
     
-    found_secrets = UserSecret.query.filter_by(user_id=user.id).all()
-    found_codes = [s.secret_code for s in found_secrets]
+    if not isinstance(secret_codes, list) or not secret_codes or \
+            not all(isinstance(code, str) for code in secret_codes):
+        return jsonify({'error': 'secret_codes must be a list of secret codes'}), 400
+    if len(secret_codes) > len(ALL_SECRETS):
+        return jsonify({'error': 'Too many secret_codes'}), 400
     
-    # Calculate percentage excluding legendary_theme (it's a reward, not a requirement)
-    secrets_for_completion = [s for s in ALL_SECRETS if s != 'legendary_theme']
-    found_for_completion = [s for s in found_codes if s != 'legendary_theme']
+    unknown = unknown_secrets(secret_codes)
+    if unknown:
+        return jsonify({'error': 'Invalid secret_code', 'invalid': unknown}), 400
     
-    total_found = len(found_for_completion)
-    percentage = round((total_found / len(secrets_for_completion)) * 100)
+    new_codes, mask = discover_secrets(user, secret_codes)
     
-    return jsonify({
-        'total_found': total_found,
-        'total_secrets': len(secrets_for_completion),
-        'percentage': percentage,
-        'found_secrets': found_codes,
-        'all_secrets': ALL_SECRETS
-    })
+    return jsonify(dict(secret_progress(mask), new_secrets=new_codes))
+
+@api.route('/api/secret/progress')
+@api_login_required
+@response_cache.cached(lambda: f'secret_progress:{request.api_user.id}', private=True)
+def get_secret_progress():
+    """Get user's secret discovery progress."""
+    # legendary_theme is a reward, not a requirement, so it doesn't count
+    # towards the percentage (see secret_codes.py)
+    return jsonify(secret_progress(user_secrets_mask(request.api_user.id)))
+
+@api.route('/api/secret/stats')
+@response_cache.cached(lambda: 'secret_stats')
+def get_secret_stats():
+    """League-wide secret statistics: how many found each secret, and who found the most."""
+    # Served from the counters kept by discover_secrets (see secret_codes.py)
+    return jsonify(secret_stats())
+
+@api.cli.command('rebuild-secrets')
+def rebuild_secrets():
+    """Recompute secret progress and statistics from user_secrets."""
+    users, secrets = rebuild_secret_progress()
+    click.echo(f'Done, fixed the progress of {users} users and the count of {secrets} secrets.')
+
+# ============ PHOTOS ============
+
+def _set_photo_cache_headers(response, key, immutable):
+    """Cache headers shared by photo responses and their 304s."""
+    # Photos are content-addressed, so the key is a strong ETag and the
+    # response never changes
+    response.set_etag(key)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000 if immutable else 0
+    response.cache_control.immutable = immutable
+
+@api.route('/api/photos/<photo_id>')
+def get_photo(photo_id):
+    """Stream a check-in photo (or one of its thumbnails) from the blob store."""
+    size = request.args.get('size')
+    if not is_valid_key(photo_id) or (size is not None and size not in THUMBNAIL_SIZES):
+        abort(404)
+    store = blob_store()
+    candidates = [(photo_blob_key(photo_id, size), True)]
+    if size is not None:
+        # Thumbnail still being generated, serve the full-size photo for now
+        candidates.append((photo_id, False))
+    for key, immutable in candidates:
+        # The key is the ETag, so a cached copy is confirmed without reading
+        # the blob
+        if request.if_none_match.contains_weak(key):
+            response = Response(status=304)
+            _set_photo_cache_headers(response, key, immutable)
+            return response
+        try:
+            f = store.open(key)
+            break
+        except FileNotFoundError:
+            continue
+    else:
+        abort(404)
+    # Measure the blob already opened rather than asking the store again
+    length = f.seek(0, os.SEEK_END)
+    f.seek(0)
+    mimetype = guess_image_mimetype(f.read(16))
+    f.seek(0)
+    response = send_file(f, mimetype=mimetype, conditional=False, max_age=31536000 if immutable else 0)
+    _set_photo_cache_headers(response, key, immutable)
+    # Answers If-None-Match with 304 and Range requests with 206
+    response.make_conditional(request, accept_ranges=True, complete_length=length)
+    return response
+
+@api.cli.command('migrate-photos')
+@click.option('--batch-size', default=50, help='Check-ins to move per commit.')
+@click.option('--i-have-a-persistent-disk', 'persistent_disk', is_flag=True,
+              help='Allow BLOB_STORE=local; PHOTO_STORAGE_DIR must survive deploys.')
+def migrate_photos(batch_size, persistent_disk):
+    """Move base64 photos from checkins.photo_data into the blob store."""
+    # The base64 copy is dropped once moved, so the blob store must outlive deploys
+    if current_app.config['BLOB_STORE'] == 'local' and not persistent_disk:
+        raise click.UsageError(
+            'BLOB_STORE=local writes photos to this machine\'s disk, which Render wipes on every deploy. '
+            'Use BLOB_STORE=database, or pass --i-have-a-persistent-disk if PHOTO_STORAGE_DIR is on one.')
+    store = blob_store()
+    moved = skipped = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(CheckIn.id, CheckIn.photo_data)\
+            .filter(CheckIn.id > last_id, CheckIn.photo_data.isnot(None), CheckIn.photo_id.is_(None))\
+            .order_by(CheckIn.id)\
+            .limit(batch_size)\
+            .all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        for checkin_id, photo_data in rows:
+            try:
+                photo_id = ingest_photo_sync(decode_data_url(photo_data), store)
+            except InvalidPhoto as e:
+                click.echo(f'Skipping check-in {checkin_id}, its photo_data is kept: {e}')
+                skipped += 1
+                continue
+            # Only drop the original once the stored copy reads back
+            if not store.verify(photo_id):
+                click.echo(f'Skipping check-in {checkin_id}, photo {photo_id} did not read back')
+                skipped += 1
+                continue
+            CheckIn.query.filter_by(id=checkin_id).update({'photo_id': photo_id, 'photo_data': None})
+            moved += 1
+        db.session.commit()
+        click.echo(f'Moved {moved} photos...')
+    click.echo(f'Done, moved {moved} photos, skipped {skipped}.')
+
+# ============ MORPHS ============
+
+def morph_status_response(key, status, error=None):
+    body = {'id': key, 'status': status}
+    if status == 'ready':
+        body['urls'] = morph_urls(key)
+    if error:
+        body['error'] = error
+    code = {'ready': 200, 'pending': 202, 'failed': 422}[status]
+    response = jsonify(body)
+    response.status_code = code
+    # The status changes while rendering and when the morph is evicted
+    response.headers['Cache-Control'] = 'no-store'
+    if status == 'pending':
+        response.headers['Location'] = url_for('api.get_morph', key=key)
+        response.headers['Retry-After'] = '2'
+    return response
+
+@api.route('/api/morphs', methods=['POST'])
+@api_login_required
+def create_morph():
+    """Render a morph between two photos, or return it from the cache."""
+    data = request.get_json(silent=True) or {}
+    try:
+        spec = MorphSpec.from_json(data, current_app.config, blob_store())
+        key, status = morph_service.request(spec)
+    except InvalidMorph as e:
+        return jsonify({'error': str(e)}), 400
+    except MorphServiceBusy as e:
+        return jsonify({'error': str(e)}), 503
+    return morph_status_response(key, status)
+
+@api.route('/api/morphs/<key>')
+def get_morph(key):
+    """Rendering status of a morph, with the URLs of its files once ready."""
+    if not is_valid_key(key):
+        abort(404)
+    status, error = morph_service.status(key)
+    if status is None:
+        abort(404)
+    return morph_status_response(key, status, error)
+
+@api.route('/api/morphs/<key>.<fmt>')
+def get_morph_file(key, fmt):
+    """Serve a rendered morph as GIF or WebP."""
+    if not is_valid_key(key) or fmt not in MORPH_FORMATS:
+        abort(404)
+    path = morph_service.cache.get(key, fmt)
+    if path is None:
+        status, error = morph_service.status(key)
+        if status is None:
+            abort(404)
+        return morph_status_response(key, status, error)
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        # Evicted since the lookup
+        abort(404)
+    # The key covers the inputs and the settings, so a morph never changes
+    response = send_file(f, mimetype=MORPH_FORMATS[fmt], conditional=False, max_age=31536000)
+    response.set_etag(f'{key}.{fmt}')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.make_conditional(request, accept_ranges=True, complete_length=os.fstat(f.fileno()).st_size)
+    return response
 
 # ============ HEALTH CHECK ============
 
-@app.route('/health')
+@api.route('/health')
 def health():
     """Health check endpoint for Render."""
     return jsonify({'status': 'healthy'})
 
-# ============ CREATE TABLES ============
+@api.route('/health/caches')
+def cache_stats():
+    """Hit/miss counters of this worker's in-process caches."""
+    return jsonify(all_cache_stats())
 
-with app.app_context():
-    db.create_all()
+@api.route('/health/db')
+def db_pool_stats():
+    """This worker's database connection pool: connections in use and checkout times."""
+    return jsonify(db_pool.status())
 
 if __name__ == '__main__':
+    app = create_app()
+    # Keep the local database up to date for development
+    with app.app_context():
+        init_migrate(app)
+        from flask_migrate import upgrade
+        upgrade()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
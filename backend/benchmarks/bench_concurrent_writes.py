@@ -0,0 +1,179 @@
+"""
+Concurrent check-in and reaction writes for the same user and day.
+
+Fires hundreds of simultaneous requests over HTTP at a threaded server and
+checks the outcome:
+
+1. one user checks in N times at once: exactly one 200, the rest 400, and
+   a single check-in row;
+2. one user changes their reaction N times at once between a few targets:
+   no errors, a single reaction row;
+3. N users react to the same check-in at once;
+4. one user reports overlapping batches of secrets N times at once: each
+   secret is reported new exactly once, and the progress mask, the user's
+   secret count and the per-secret stats match the user_secrets rows;
+5. N other users check in at once: all 200, and the day's check-ins are
+   ranked 1..N+1 in check-in time order;
+
+and after each reaction round the materialized tallies must match a
+recompute from the raw reactions, and at the end the standings (ranks,
+streaks, net likes) must match a recompute from checkins and reactions.
+Any 5xx fails the run. Run from the backend folder:
+
+    python benchmarks/bench_concurrent_writes.py --requests 300
+"""
+
+import argparse
+import io
+import base64
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from common import use_scratch_database, reset_database, seed_day
+
+use_scratch_database()
+
+import requests
+from PIL import Image
+from werkzeug.serving import make_server
+
+import app as backend
+from models import db, User, CheckIn, Reaction, UserSecret
+from leaderboard import check_consistency
+from secret_codes import ALL_SECRETS, rebuild_secret_progress, secrets_mask
+from standings import rebuild_standings
+
+
+def tiny_photo():
+    out = io.BytesIO()
+    Image.new('RGB', (64, 48), (200, 120, 40)).save(out, 'JPEG')
+    return 'data:image/jpeg;base64,' + base64.b64encode(out.getvalue()).decode()
+
+
+def fire(base_url, requests_spec, concurrency):
+    """Send all requests at once (per batch of `concurrency`); return status counts, wall time and the responses."""
+    barrier = threading.Barrier(min(concurrency, len(requests_spec)))
+
+    def send(spec):
+        token, path, body = spec
+        session = requests.Session()
+        session.headers['Authorization'] = f'Bearer {token}'
+        try:
+            barrier.wait(timeout=10)
+        except threading.BrokenBarrierError:
+            pass
+        return session.post(f'{base_url}{path}', json=body)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        responses = list(pool.map(send, requests_spec))
+    seconds = time.perf_counter() - start
+    return Counter(response.status_code for response in responses), seconds, responses
+
+
+def report(name, statuses, seconds, ok):
+    codes = ', '.join(f'{code}: {count}' for code, count in sorted(statuses.items()))
+    print(f"{'ok' if ok else 'FAIL':<5}{name:<36} {codes:<28} {seconds * 1000:>8.0f} ms")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300, help='Simultaneous requests per round.')
+    parser.add_argument('--concurrency', type=int, default=100, help='Client threads.')
+    args = parser.parse_args()
+    n = args.requests
+
+    app = backend.create_app()
+    today = date.today()
+    with app.app_context():
+        location = dict(zip(('latitude', 'longitude'), backend.venues().venues[0].center))
+        reset_database(db)
+        # Users 0..n-1 have checked in; the racer has not yet
+        users = seed_day(db, n, reactions=False)
+        # and neither have the latecomers
+        db.session.execute(User.__table__.insert(), [{
+            'id': 'racer', 'email': 'racer@example.com', 'name': 'Racer', 'picture': None
+        }] + [{
+            'id': f'late{i}', 'email': f'late{i}@example.com', 'name': f'Late {i}', 'picture': None
+        } for i in range(n)])
+        db.session.commit()
+        # Standings of the seeded check-ins
+        rebuild_standings()
+        racer = backend.token_store().issue('racer', timedelta(hours=1))
+        tokens = [backend.token_store().issue(u['id'], timedelta(hours=1)) for u in users]
+        latecomers = [backend.token_store().issue(f'late{i}', timedelta(hours=1)) for i in range(n)]
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    results = []
+    photo = tiny_photo()
+
+    statuses, seconds, _ = fire(base_url, [(racer, '/api/checkin', dict(location, photo=photo))] * n,
+                             args.concurrency)
+    with app.app_context():
+        rows = CheckIn.query.filter_by(user_id='racer', check_in_date=today).count()
+    results.append(report('same user checks in N times', statuses, seconds,
+                          statuses[200] == 1 and statuses[400] == n - 1 and rows == 1))
+
+    rng = random.Random(n)
+    targets = [1, 2, 3]
+    statuses, seconds, _ = fire(base_url, [
+        (racer, '/api/react', {'checkin_id': rng.choice(targets), 'reaction_type': rng.choice(['like', 'dislike'])})
+        for _ in range(n)
+    ], args.concurrency)
+    with app.app_context():
+        rows = Reaction.query.filter_by(user_id='racer', reaction_date=today).count()
+        drift = check_consistency(today)
+    results.append(report('same user changes reaction N times', statuses, seconds,
+                          not any(code >= 500 for code in statuses) and rows == 1 and not drift))
+
+    statuses, seconds, _ = fire(base_url, [
+        (token, '/api/react', {'checkin_id': n, 'reaction_type': 'like'}) for token in tokens[:-1]
+    ], args.concurrency)
+    with app.app_context():
+        likes = db.session.get(CheckIn, n).like_count
+        drift = check_consistency(today)
+    results.append(report('N users like the same check-in', statuses, seconds,
+                          statuses[200] == n - 1 and not drift and likes >= n - 1))
+
+    statuses, seconds, responses = fire(base_url, [
+        (racer, '/api/secret/discover/batch', {'secret_codes': rng.sample(ALL_SECRETS, 4)}) for _ in range(n)
+    ], args.concurrency)
+    reported = Counter(code for response in responses if response.status_code == 200
+                       for code in response.json()['new_secrets'])
+    with app.app_context():
+        codes = [s.secret_code for s in UserSecret.query.filter_by(user_id='racer')]
+        mask = db.session.get(User, 'racer').secrets_mask
+        # Nothing to fix if the user's counters and the secret stats match user_secrets
+        drift = rebuild_secret_progress() != (0, 0)
+    results.append(report('same user reports secrets N times', statuses, seconds,
+                          statuses[200] == n and set(reported.values()) == {1}
+                          and sorted(reported) == sorted(codes) and mask == secrets_mask(codes)
+                          and not drift))
+
+    statuses, seconds, _ = fire(base_url, [
+        (token, '/api/checkin', dict(location, photo=photo)) for token in latecomers
+    ], args.concurrency)
+    with app.app_context():
+        late = CheckIn.query.filter(CheckIn.user_id.like('late%'), CheckIn.check_in_date == today).count()
+        # Nothing to fix if every rank, streak and net like count matches the raw tables
+        drift = rebuild_standings() != (0, 0)
+    results.append(report('N users check in at once', statuses, seconds,
+                          statuses[200] == n and late == n and not drift))
+
+    server.shutdown()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Geofence lookups: grid index vs. checking every venue, and the NumPy batch API.
+
+Generates random circle and polygon venues over the Netherlands and random
+points around them, checks that all three ways of matching agree, and
+reports the time per lookup. Run from the backend folder:
+
+    python benchmarks/bench_geofence.py --venues 1000 --points 100000
+"""
+
+import argparse
+import math
+import random
+
+from common import timed
+
+import numpy as np
+
+from geofence import CircleVenue, PolygonVenue, VenueIndex, METERS_PER_DEGREE
+
+# Rough bounding box of the Netherlands
+MIN_LAT, MAX_LAT = 50.8, 53.5
+MIN_LNG, MAX_LNG = 3.4, 7.2
+
+
+def random_venues(n, rng):
+    venues = []
+    for i in range(n):
+        lat, lng = rng.uniform(MIN_LAT, MAX_LAT), rng.uniform(MIN_LNG, MAX_LNG)
+        if i % 2:
+            venues.append(CircleVenue(f'circle-{i}', f'Circle {i}', lat, lng, rng.uniform(50, 2000)))
+        else:
+            # A random star-shaped polygon up to ~1 km across
+            sides = rng.randrange(4, 12)
+            points = []
+            for k in range(sides):
+                angle = 2 * math.pi * k / sides
+                r = rng.uniform(100, 1000) / METERS_PER_DEGREE
+                points.append((lat + r * math.sin(angle), lng + r * math.cos(angle) / math.cos(math.radians(lat))))
+            venues.append(PolygonVenue(f'polygon-{i}', f'Polygon {i}', points))
+    return venues
+
+
+def linear_match(venues, lat, lng):
+    for venue in venues:
+        if venue.contains(lat, lng):
+            return venue
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    venues = random_venues(args.venues, rng)
+    with timed() as build:
+        index = VenueIndex(venues)
+    build_ms = build['seconds'] * 1000
+
+    # Half the points near a venue, half anywhere
+    points = []
+    for i in range(args.points):
+        if i % 2:
+            lat, lng = rng.choice(venues).center
+            points.append((lat + rng.gauss(0, 0.005), lng + rng.gauss(0, 0.008)))
+        else:
+            points.append((rng.uniform(MIN_LAT, MAX_LAT), rng.uniform(MIN_LNG, MAX_LNG)))
+
+    with timed() as run:
+        indexed = [index.match(lat, lng) for lat, lng in points]
+    indexed_s = run['seconds']
+
+    sample = points[:min(len(points), 5000)]
+    with timed() as run:
+        linear = [linear_match(venues, lat, lng) for lat, lng in sample]
+    linear_s = run['seconds'] * len(points) / len(sample)
+
+    lats = np.array([p[0] for p in points])
+    lngs = np.array([p[1] for p in points])
+    with timed() as run:
+        batch = index.match_many(lats, lngs)
+    batch_s = run['seconds']
+
+    assert [m and m[0].id for m in indexed[:len(sample)]] == [v and v.id for v in linear]
+    assert [m[0].id if m else None for m in indexed] == [venues[i].id if i >= 0 else None for i in batch.tolist()]
+
+    matched = sum(1 for m in indexed if m)
+    print(f'{args.venues} venues, index built in {build_ms:.1f} ms ({len(index.grid)} grid cells)')
+    print(f'{args.points} points, {matched} inside a venue\n')
+    print(f"{'method':<24} {'total s':>9} {'us/point':>10}")
+    for name, seconds in [('every venue (est.)', linear_s), ('grid index', indexed_s), ('numpy batch', batch_s)]:
+        print(f'{name:<24} {seconds:>9.3f} {seconds / len(points) * 1e6:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark /api/history against the previous per-date query loop.
+
+Seeds DAYS days of check-ins, checks that the windowed query returns the
+same history as the old implementation and compares query counts and
+latency. Point DATABASE_URL at a local Postgres to check that both
+databases give identical output. Run from the backend folder:
+
+    python benchmarks/bench_history.py
+"""
+
+from common import use_scratch_database, reset_database, seed_day, QueryCounter, timed
+
+use_scratch_database()
+
+from datetime import datetime, date, timedelta
+
+from app import create_app
+from models import db, CheckIn
+
+DAYS = 60
+PARTICIPANTS = [5, 50, 200]
+
+
+def legacy_history():
+    """The original implementation: one query per date plus a lazy user load per entry."""
+    dates_with_checkins = db.session.query(CheckIn.check_in_date)\
+        .distinct()\
+        .order_by(CheckIn.check_in_date.desc())\
+        .limit(30)\
+        .all()
+    history = []
+    for (check_date,) in dates_with_checkins:
+        checkins = CheckIn.query.filter_by(check_in_date=check_date)\
+            .order_by(CheckIn.check_in_time.asc())\
+            .all()
+        history.append({
+            'date': check_date.isoformat(),
+            'entries': [{
+                'rank': i + 1,
+                'name': c.user.name,
+                'picture': c.user.picture,
+                'check_in_time': c.check_in_time.isoformat()
+            } for i, c in enumerate(checkins)]
+        })
+    return history
+
+
+def seed_days(n):
+    """Seed DAYS days where the same n users check in every day."""
+    users = seed_day(db, n, day=date.today(), reactions=False)
+    next_id = n + 1
+    for offset in range(1, DAYS):
+        day = date.today() - timedelta(days=offset)
+        start = datetime.combine(day, datetime.min.time()) + timedelta(hours=8)
+        rows = []
+        for i, user in enumerate(users):
+            rows.append({
+                'id': next_id,
+                'user_id': user['id'],
+                'check_in_date': day,
+                # Reverse order on odd days so ranks differ from day to day
+                'check_in_time': start + timedelta(seconds=n - i if offset % 2 else i),
+                'latitude': 52.3547,
+                'longitude': 4.9543
+            })
+            next_id += 1
+        db.session.execute(CheckIn.__table__.insert(), rows)
+    db.session.commit()
+    return users
+
+
+def main():
+    app = create_app()
+    client = app.test_client()
+    print(f"{'users':>6} {'legacy queries':>15} {'legacy ms':>10} {'queries':>8} {'ms':>8} {'pages':>6}")
+    with app.app_context():
+        for n in PARTICIPANTS:
+            reset_database(db)
+            users = seed_days(n)
+            db.session.remove()
+
+            with QueryCounter(db.engine) as legacy_counter, timed() as legacy_time:
+                expected = legacy_history()
+            db.session.remove()
+
+            with QueryCounter(db.engine) as counter, timed() as new_time:
+                response = client.get('/api/history')
+            body = response.get_json()
+            assert response.status_code == 200
+            assert body['history'] == expected
+
+            # Walk every page and check the per-user filter keeps global ranks
+            pages, cursor, seen = 1, body['next_cursor'], len(body['history'])
+            while cursor:
+                page = client.get(f'/api/history?before={cursor}').get_json()
+                pages += 1
+                seen += len(page['history'])
+                cursor = page['next_cursor']
+            assert seen == DAYS
+            mine = client.get(f"/api/history?user_id={users[-1]['id']}").get_json()['history']
+            assert all(len(day['entries']) == 1 for day in mine)
+            assert [day['entries'][0]['rank'] for day in mine[:2]] == [n, 1]
+
+            print(f"{n:>6} {legacy_counter.count:>15} {legacy_time['seconds'] * 1000:>10.1f} "
+                  f"{counter.count:>8} {new_time['seconds'] * 1000:>8.1f} {pages:>6}")
+
+
+if __name__ == '__main__':
+    main()
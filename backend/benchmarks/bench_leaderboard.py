@@ -0,0 +1,71 @@
+"""
+Benchmark /api/leaderboard query count and latency as the day grows.
+
+Compares the previous per-check-in reaction count loop with the aggregated
+leaderboard query. Run from the backend folder:
+
+    python benchmarks/bench_leaderboard.py
+"""
+
+from common import use_scratch_database, reset_database, seed_day, QueryCounter, timed
+
+use_scratch_database()
+
+from datetime import date
+
+from app import create_app
+from models import db, CheckIn, Reaction
+
+SIZES = [10, 100, 1000, 3000]
+
+
+def legacy_leaderboard(today):
+    """The original implementation: two counts and a user load per check-in."""
+    checkins = CheckIn.query.filter_by(check_in_date=today)\
+        .order_by(CheckIn.check_in_time.asc())\
+        .all()
+    leaderboard = []
+    for i, checkin in enumerate(checkins):
+        likes = Reaction.query.filter_by(checkin_id=checkin.id, reaction_type='like').count()
+        dislikes = Reaction.query.filter_by(checkin_id=checkin.id, reaction_type='dislike').count()
+        leaderboard.append({
+            'rank': i + 1,
+            'checkin_id': checkin.id,
+            'name': checkin.user.name,
+            'picture': checkin.user.picture,
+            'check_in_time': checkin.check_in_time.isoformat(),
+            'photo': checkin.photo_data,
+            'likes': likes,
+            'dislikes': dislikes
+        })
+    return leaderboard
+
+
+def main():
+    app = create_app()
+    client = app.test_client()
+    print(f"{'check-ins':>10} {'legacy queries':>15} {'legacy ms':>10} {'queries':>8} {'ms':>8}")
+    with app.app_context():
+        for n in SIZES:
+            reset_database(db)
+            seed_day(db, n)
+            db.session.remove()
+
+            with QueryCounter(db.engine) as legacy_counter, timed() as legacy_time:
+                expected = legacy_leaderboard(date.today())
+            db.session.remove()
+
+            with QueryCounter(db.engine) as counter, timed() as new_time:
+                response = client.get('/api/leaderboard')
+            assert response.status_code == 200
+            compared = ('rank', 'checkin_id', 'name', 'likes', 'dislikes')
+            actual = response.get_json()['leaderboard']
+            assert [{k: e[k] for k in compared} for e in actual] == \
+                [{k: e[k] for k in compared} for e in expected]
+
+            print(f"{n:>10} {legacy_counter.count:>15} {legacy_time['seconds'] * 1000:>10.1f} "
+                  f"{counter.count:>8} {new_time['seconds'] * 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Morph frame rendering: the original generate_morph.py vs. MorphEngine (morph.py).
+
+Renders a few frames both ways from the ianmorph images and node mapping,
+and reports the time per frame, the projected time for a full morph, and
+how far the new frames are from the original ones (mean absolute
+difference and PSNR). Run from the backend folder:
+
+    python benchmarks/bench_morph.py [--frames 40] [--samples 3] [--field-step 4]
+"""
+
+import argparse
+
+from common import timed
+
+import numpy as np
+from PIL import Image
+from scipy.interpolate import griddata
+from scipy.ndimage import map_coordinates
+
+from generate_morph import IMG1_PATH, IMG2_PATH, NODES_PATH
+from morph import OUTPUT_SIZE, ZOOM_FACTOR, MorphEngine, load_nodes
+
+
+# ---- The original implementation ----
+
+def legacy_warp_image_bilinear(img, nodes, size):
+    """Two cubic griddata calls over the full grid and one map_coordinates per channel."""
+    h, w = size
+    y_coords, x_coords = np.mgrid[0:h, 0:w]
+    grid_points = np.column_stack([(x_coords / w).ravel(), (y_coords / h).ravel()])
+    points = np.array([[n['u'], n['v']] for n in nodes])
+    dest = np.array([[n['x'], n['y']] for n in nodes])
+    source_x = griddata(dest, points[:, 0], grid_points, method='cubic', fill_value=0.5).reshape(h, w)
+    source_y = griddata(dest, points[:, 1], grid_points, method='cubic', fill_value=0.5).reshape(h, w)
+    img_h, img_w = img.shape[:2]
+    sample_x = np.clip(source_x * (img_w - 1), 0, img_w - 1)
+    sample_y = np.clip(source_y * (img_h - 1), 0, img_h - 1)
+    warped = np.zeros((h, w, 3), dtype=np.uint8)
+    for c in range(3):
+        warped[:, :, c] = map_coordinates(img[:, :, c].astype(np.float64), [sample_y, sample_x],
+                                          order=1, mode='nearest').astype(np.uint8)
+    return warped
+
+
+def legacy_interpolate_nodes(nodes1, nodes2, t):
+    return [{'x': n1['x'] * (1 - t) + n2['x'] * t, 'y': n1['y'] * (1 - t) + n2['y'] * t,
+             'u': n1['u'], 'v': n1['v']} for n1, n2 in zip(nodes1, nodes2)]
+
+
+def legacy_crop_center_zoom(img, zoom_factor):
+    h, w = img.shape[:2]
+    crop_h, crop_w = int(h / zoom_factor), int(w / zoom_factor)
+    start_y, start_x = (h - crop_h) // 2, (w - crop_w) // 2
+    cropped = Image.fromarray(img[start_y:start_y + crop_h, start_x:start_x + crop_w])
+    return np.array(cropped.resize((w, h), Image.Resampling.LANCZOS))
+
+
+def legacy_frame(img1_np, img2_np, nodes1, nodes2, t):
+    warped1 = legacy_warp_image_bilinear(img1_np, legacy_interpolate_nodes(nodes1, nodes2, t), OUTPUT_SIZE)
+    warped2 = legacy_warp_image_bilinear(img2_np, legacy_interpolate_nodes(nodes2, nodes1, 1 - t), OUTPUT_SIZE)
+    blended = (warped1.astype(np.float64) * (1 - t) + warped2.astype(np.float64) * t).astype(np.uint8)
+    return legacy_crop_center_zoom(blended, ZOOM_FACTOR)
+
+
+# ----
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=40, help='Frames in a full morph.')
+    parser.add_argument('--samples', type=int, default=3, help='Frames to render with the original code.')
+    parser.add_argument('--field-step', type=int, default=4)
+    args = parser.parse_args()
+
+    img1 = Image.open(IMG1_PATH).convert('RGB')
+    img2 = Image.open(IMG2_PATH).convert('RGB')
+    nodes1, nodes2 = load_nodes(NODES_PATH)
+    img1_np = np.array(img1.resize(OUTPUT_SIZE, Image.Resampling.LANCZOS))
+    img2_np = np.array(img2.resize(OUTPUT_SIZE, Image.Resampling.LANCZOS))
+
+    with timed() as run:
+        engine = MorphEngine(img1, img2, nodes1, nodes2, field_step=args.field_step)
+    setup = run['seconds']
+
+    # Frames are counted, not kept, so a long run does not hold them all
+    with timed() as run:
+        rendered = sum(1 for _ in engine.frames(args.frames))
+    engine_per_frame = run['seconds'] / rendered
+
+    ts = np.linspace(0, 1, args.samples + 2)[1:-1]
+    legacy_seconds = 0
+    print(f"{'t':>6} {'mean abs diff':>14} {'PSNR dB':>8}")
+    for t in ts:
+        with timed() as run:
+            expected = legacy_frame(img1_np, img2_np, nodes1, nodes2, t)
+        legacy_seconds += run['seconds']
+        actual = engine.frame(t)
+        print(f"{t:>6.2f} {np.abs(actual.astype(int) - expected).mean():>14.2f} {psnr(actual, expected):>8.1f}")
+    legacy_per_frame = legacy_seconds / len(ts)
+
+    print(f"\n{'':<12} {'ms/frame':>10} {f'{args.frames} frames s':>14}")
+    print(f"{'original':<12} {legacy_per_frame * 1000:>10.0f} {legacy_per_frame * args.frames:>14.1f}")
+    print(f"{'engine':<12} {engine_per_frame * 1000:>10.0f} {engine_per_frame * args.frames + setup:>14.1f}"
+          f"   (setup {setup * 1000:.0f} ms)")
+    print(f"\nSpeedup: {legacy_per_frame / engine_per_frame:.1f}x per frame")
+
+
+if __name__ == '__main__':
+    main()
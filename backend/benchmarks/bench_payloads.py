@@ -0,0 +1,135 @@
+"""
+Memory and bytes on the wire of the large JSON responses.
+
+Seeds a day with 200 check-ins and DAYS days of history for the same 200
+users, then requests today's leaderboard and a DAYS-day page of history:
+
+- jsonify: the previous implementation, the whole payload built as a list
+  and encoded in one go (cached the same way, not compressed);
+- stream: json_stream.json_response() sent as is, with gzip and with brotli.
+
+Every request runs in a fresh process, so the growth of its peak RSS over
+a warmed up app (imported, created, one /health served) is that request's
+alone. Reports the median over --runs of peak RSS growth and latency, and
+the bytes sent. Run from the backend folder:
+
+    python benchmarks/bench_payloads.py [--runs 3]
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+from common import use_scratch_database, reset_database
+
+use_scratch_database()
+
+from datetime import date
+
+PAYLOADS = {
+    'leaderboard': '/api/leaderboard',
+    'history': None,  # set from DAYS below
+}
+VARIANTS = {
+    'jsonify': None,
+    'stream': 'identity',
+    'stream gzip': 'gzip',
+    'stream br': 'br',
+}
+USERS = 200
+
+
+def add_legacy_routes(app, backend):
+    """The leaderboard and history views as they were: built as lists, then jsonify()."""
+    from flask import jsonify, request
+    from leaderboard import iter_leaderboard, iter_history
+
+    @backend.response_cache.cached(backend.leaderboard_scope)
+    def legacy_leaderboard():
+        today = date.today()
+        return jsonify({'date': today.isoformat(), 'leaderboard': list(iter_leaderboard(today))})
+
+    @backend.response_cache.cached(lambda: 'history')
+    def legacy_history():
+        page = {}
+        history = list(iter_history(page, int(request.args['days'])))
+        return jsonify({'history': history, 'next_cursor': page['next_cursor']})
+
+    app.add_url_rule('/legacy/leaderboard', 'legacy_leaderboard', legacy_leaderboard)
+    app.add_url_rule('/legacy/history', 'legacy_history', legacy_history)
+
+
+def peak_rss_kb():
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(path, variant):
+    """Serve one request in this process and print its numbers."""
+    import app as backend
+    app = backend.create_app()
+    add_legacy_routes(app, backend)
+    client = app.test_client()
+    client.get('/health')
+    if VARIANTS[variant] is None:
+        path = '/legacy' + path[len('/api'):]
+        headers = {}
+    else:
+        headers = {'Accept-Encoding': VARIANTS[variant]}
+
+    before = peak_rss_kb()
+    start = time.perf_counter()
+    response = client.get(path, headers=headers, buffered=False)
+    # Count the body as it arrives instead of holding it
+    sent = sum(len(chunk) for chunk in response.response)
+    response.close()
+    seconds = time.perf_counter() - start
+    print(json.dumps({'status': response.status_code, 'bytes': sent, 'seconds': seconds,
+                      'rss_growth': peak_rss_kb() - before}))
+
+
+def run_child(path, variant):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', path, variant],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='Fresh processes per measurement.')
+    parser.add_argument('--child', nargs=2, metavar=('PATH', 'VARIANT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    from app import create_app
+    from models import db
+    from bench_history import DAYS, seed_days
+    PAYLOADS['history'] = f'/api/history?days={DAYS}'
+
+    app = create_app()
+    with app.app_context():
+        reset_database(db)
+        seed_days(USERS)
+
+    print(f'{USERS} check-ins today, {DAYS} days of history; median of {args.runs} fresh processes\n')
+    print(f"{'payload':<12} {'variant':<12} {'status':>6} {'KB sent':>9} {'peak RSS +KB':>13} {'ms':>7}")
+    for payload, path in PAYLOADS.items():
+        for variant in VARIANTS:
+            samples = [run_child(path, variant) for _ in range(args.runs)]
+            print(f"{payload:<12} {variant:<12} {samples[0]['status']:>6} {samples[0]['bytes'] / 1024:>9.1f} "
+                  f"{statistics.median(s['rss_growth'] for s in samples):>13.0f} "
+                  f"{statistics.median(s['seconds'] for s in samples) * 1000:>7.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Slow uploaders against gunicorn's worker classes.
+
+Starts gunicorn (with gunicorn.conf.py) once per worker class on a scratch
+database. Each time, --slow clients trickle a check-in photo upload over
+--upload-seconds while --readers clients poll the leaderboard as fast as
+they can. Reports the readers' latency while the uploads are in flight and
+whether every upload got through:
+
+- gthread: every slow upload holds one of the worker's GUNICORN_THREADS, so
+  with more uploaders than threads the readers queue behind them;
+- gevent: uploads and reads are greenlets, readers are not held up.
+
+The photo pipeline runs with the deployed settings (PHOTO_WORKERS,
+PHOTO_QUEUE_SIZE and PHOTO_SUBMIT_TIMEOUT from the environment, else the
+defaults), so a failed upload is one production would fail too. The run
+exits non-zero if any upload fails.
+
+Classes whose packages are not installed are skipped. Run from the backend
+folder:
+
+    python benchmarks/bench_slow_clients.py [--slow 16] [--readers 4] [--classes gthread gevent]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from common import BACKEND_DIR, use_scratch_database, reset_database
+
+use_scratch_database()
+
+import requests
+
+import app as backend
+from models import db
+from loadtest import make_photo, percentile, seed_users
+
+CHUNK = 4096
+# Packages each worker class needs besides gunicorn
+CLASS_PACKAGES = {
+    'sync': [],
+    'gthread': [],
+    'gevent': ['gevent', 'psycogreen'],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(worker_class, port, threads):
+    env = dict(os.environ, PORT=str(port), GUNICORN_WORKER_CLASS=worker_class, WEB_CONCURRENCY='1',
+               GUNICORN_THREADS=str(threads))
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:create_app()', '--bind', f'127.0.0.1:{port}'],
+                               cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/health', timeout=5).ok:
+                return process
+        except requests.RequestException:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.2)
+    process.kill()
+    raise SystemExit(f'gunicorn ({worker_class}) did not start')
+
+
+def slow_upload(port, token, body, seconds, results):
+    """POST /api/checkin over a link that takes `seconds` to carry the body."""
+    start = time.perf_counter()
+    chunks = range(0, len(body), CHUNK)
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=seconds + 60) as s:
+            # Keep the unsent body on the client, like a slow link would,
+            # instead of in the kernel's loopback buffers
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, CHUNK)
+            s.sendall((
+                'POST /api/checkin HTTP/1.1\r\n'
+                'Host: localhost\r\n'
+                f'Authorization: Bearer {token}\r\n'
+                'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                'Connection: close\r\n\r\n'
+            ).encode())
+            for offset in chunks:
+                s.sendall(body[offset:offset + CHUNK])
+                time.sleep(seconds / len(chunks))
+            status = s.makefile('rb').readline().split()[1].decode()
+    except (OSError, IndexError) as e:
+        status = type(e).__name__
+    results.append((status, time.perf_counter() - start))
+
+
+def read_leaderboard(port, stop, latencies, errors):
+    session = requests.Session()
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            ok = session.get(f'http://127.0.0.1:{port}/api/leaderboard', timeout=60).ok
+        except requests.RequestException:
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors.append(1)
+
+
+def run(app, worker_class, args, photo, location):
+    with app.app_context():
+        reset_database(db, migrate=True)
+        tokens = seed_users(args.slow)
+    port = free_port()
+    # gunicorn quietly turns sync into gthread when given more than one thread
+    process = start_gunicorn(worker_class, port, args.threads if worker_class == 'gthread' else 1)
+    try:
+        uploads, latencies, errors = [], [], []
+        stop = threading.Event()
+        readers = [threading.Thread(target=read_leaderboard, args=(port, stop, latencies, errors))
+                   for _ in range(args.readers)]
+        uploaders = [threading.Thread(target=slow_upload, args=(
+            port, token, json.dumps(dict(location, photo=photo)).encode(), args.upload_seconds, uploads))
+            for token in tokens]
+        start = time.perf_counter()
+        for thread in uploaders + readers:
+            thread.start()
+        for thread in uploaders:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+        seconds = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+    succeeded = sum(1 for status, _ in uploads if status == '200')
+    print(f"{worker_class:<9} {len(latencies):>6} {len(errors):>6} {percentile(latencies, 50) * 1000:>8.0f} "
+          f"{percentile(latencies, 95) * 1000:>8.0f} {max(latencies) * 1000:>8.0f} "
+          f"{succeeded:>5}/{len(uploads):<5} {max(t for _, t in uploads):>9.1f} {seconds:>7.1f}")
+    failed = Counter(status for status, _ in uploads if status != '200')
+    if failed:
+        print(f"{'':<9} failed uploads: {', '.join(f'{status} x{n}' for status, n in sorted(failed.items()))}")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--slow', type=int, default=16, help='Clients uploading a photo slowly.')
+    parser.add_argument('--readers', type=int, default=4, help='Clients polling the leaderboard.')
+    parser.add_argument('--upload-seconds', type=float, default=5.0, help='How long each upload takes.')
+    parser.add_argument('--threads', type=int, default=8, help='GUNICORN_THREADS for gthread.')
+    parser.add_argument('--classes', nargs='+', default=['gthread', 'gevent'], choices=sorted(CLASS_PACKAGES))
+    args = parser.parse_args()
+
+    app = backend.create_app()
+    with app.app_context():
+        location = dict(zip(('latitude', 'longitude'), backend.venues().venues[0].center))
+    photo = make_photo(0)
+    print(f'{args.slow} uploads of {len(photo) / 1024:.0f} KB over {args.upload_seconds:.0f}s each, '
+          f'{args.readers} leaderboard readers, gthread with {args.threads} threads; photo pipeline '
+          f"{app.config['PHOTO_WORKERS']} workers + {app.config['PHOTO_QUEUE_SIZE']} queued, "
+          f"{app.config['PHOTO_SUBMIT_TIMEOUT']:g}s wait\n")
+    print(f"{'class':<9} {'reads':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} "
+          f"{'uploads ok':<11} {'slowest s':>9} {'total s':>7}")
+    results = []
+    for worker_class in args.classes:
+        missing = [name for name in CLASS_PACKAGES[worker_class] if importlib.util.find_spec(name) is None]
+        if missing:
+            print(f"{worker_class:<9} skipped, needs {', '.join(missing)}")
+            continue
+        results.append(run(app, worker_class, args, photo, location))
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
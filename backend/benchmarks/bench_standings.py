@@ -0,0 +1,67 @@
+"""
+Benchmark /api/standings against computing the standings from the raw tables.
+
+Seeds USERS users and a growing number of days on which a random half of
+them checked in and reacted, then times:
+
+- recompute: standings.compute_standings(), the ranks, streaks and net likes
+  worked out from checkins and reactions (what a read would cost without
+  user_stats);
+- /api/standings: the endpoint with its response cache emptied, reading the
+  materialized user_stats.
+
+The recompute grows with the check-ins, the endpoint only with the users.
+Run from the backend folder:
+
+    python benchmarks/bench_standings.py
+"""
+
+from common import use_scratch_database, reset_database, seed_day, QueryCounter, timed
+
+use_scratch_database()
+
+import statistics
+from datetime import date
+
+from app import create_app
+from models import db
+from standings import compute_standings, rebuild_standings
+from check_query_plans import seed_history
+
+USERS = 200
+DAYS = [30, 365, 1095]
+RUNS = 5
+
+
+def main():
+    app = create_app()
+    client = app.test_client()
+    response_cache = app.extensions['response_cache']
+    print(f"{'days':>6} {'check-ins':>10} {'recompute ms':>13} {'standings ms':>13} {'queries':>8} {'KB':>6}")
+    with app.app_context():
+        for days in DAYS:
+            reset_database(db)
+            users = seed_day(db, USERS)
+            seed_history(users, days)
+            rebuild_standings()
+            checkins = sum(stats['total_checkins'] for stats in compute_standings()[0].values())
+
+            recomputes, reads = [], []
+            for _ in range(RUNS):
+                with timed() as t:
+                    compute_standings()
+                recomputes.append(t['seconds'])
+                response_cache.invalidate_all()
+                with QueryCounter(db.engine) as counter, timed() as t:
+                    response = client.get('/api/standings', buffered=True)
+                reads.append(t['seconds'])
+            assert response.status_code == 200
+            assert len(response.json['standings']) == USERS
+
+            print(f"{days:>6} {checkins:>10} {statistics.median(recomputes) * 1000:>13.1f} "
+                  f"{statistics.median(reads) * 1000:>13.1f} {counter.count:>8} {len(response.data) / 1024:>6.1f}")
+    print(f'\n{USERS} users; median of {RUNS} runs; standings as of {date.today().isoformat()}')
+
+
+if __name__ == '__main__':
+    main()
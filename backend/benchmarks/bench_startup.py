@@ -0,0 +1,141 @@
+"""
+Cold start of a worker: importing the app, creating it and its first requests.
+
+Every gunicorn worker (and every Render deploy or restart) pays this before
+it serves anything. Each run is a fresh Python process on a scratch
+database that is already migrated, timing:
+
+- import: `import app`;
+- create: create_app();
+- the first GET of each --paths, through the test client.
+
+Reports the median of --runs. --ref also measures another commit (checked
+out in a temporary git worktree, e.g. --ref HEAD~1) to compare against, and
+--imports lists what app.py imports, slowest first. Run from the
+backend folder:
+
+    python benchmarks/bench_startup.py [--runs 7] [--ref HEAD~1] [--imports 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import BACKEND_DIR, use_scratch_database, reset_database
+
+use_scratch_database()
+
+# Runs in the child process; older trees have a module-level app instead of create_app()
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import app as backend
+imported = time.perf_counter()
+app = backend.create_app() if hasattr(backend, 'create_app') else backend.app
+created = time.perf_counter()
+client = app.test_client()
+requests = []
+for path in sys.argv[1:]:
+    before = time.perf_counter()
+    status = client.get(path).status_code
+    requests.append([path, status, time.perf_counter() - before])
+print(json.dumps({'import': imported - start, 'create': created - imported, 'requests': requests}))
+'''
+
+
+def probe(backend_dir, paths):
+    result = subprocess.run([sys.executable, '-c', PROBE, *paths], cwd=backend_dir,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f'Startup failed in {backend_dir}:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(backend_dir, paths, runs):
+    """Median seconds of each step over `runs` fresh processes, and the request statuses."""
+    samples = [probe(backend_dir, paths) for _ in range(runs)]
+    steps = {
+        'import': statistics.median(s['import'] for s in samples),
+        'create': statistics.median(s['create'] for s in samples),
+    }
+    statuses = {}
+    for i, path in enumerate(paths):
+        steps[f'GET {path}'] = statistics.median(s['requests'][i][2] for s in samples)
+        statuses[path] = samples[0]['requests'][i][1]
+    return steps, statuses
+
+
+def slowest_imports(backend_dir, n):
+    """Modules imported by app.py itself, by cumulative import time."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=backend_dir,
+                            capture_output=True, text=True)
+    packages = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # Two spaces of indent per level below the module that imported it
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            packages.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(packages, reverse=True)[:n]
+
+
+def worktree(ref):
+    path = tempfile.mkdtemp(prefix='jochies-startup-')
+    subprocess.run(['git', 'worktree', 'add', '--detach', path, ref], cwd=BACKEND_DIR, check=True,
+                   capture_output=True)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7, help='Fresh processes per tree.')
+    parser.add_argument('--paths', nargs='+', default=['/health', '/api/leaderboard'],
+                        help='Requests made after startup, in order.')
+    parser.add_argument('--ref', help='Also measure this commit, to compare against.')
+    parser.add_argument('--imports', type=int, default=0, help='List the N slowest imports of app.py.')
+    args = parser.parse_args()
+
+    import app as backend
+    from models import db
+    app = backend.create_app()
+    with app.app_context():
+        reset_database(db, migrate=True)
+
+    trees = {'current': BACKEND_DIR}
+    if args.ref:
+        trees[args.ref] = os.path.join(worktree(args.ref), 'backend')
+    try:
+        results = {name: measure(path, args.paths, args.runs) for name, path in trees.items()}
+        imports = {name: slowest_imports(path, args.imports) for name, path in trees.items()} if args.imports else {}
+    finally:
+        if args.ref:
+            subprocess.run(['git', 'worktree', 'remove', '--force', os.path.dirname(trees[args.ref])],
+                           cwd=BACKEND_DIR, capture_output=True)
+
+    names = list(trees)
+    print(f'Median of {args.runs} fresh processes, ms\n')
+    print(f"{'step':<24}" + ''.join(f'{name:>12}' for name in names))
+    steps = list(results['current'][0])
+    for step in steps:
+        print(f'{step:<24}' + ''.join(f'{results[name][0][step] * 1000:>12.0f}' for name in names))
+    totals = {name: sum(results[name][0].values()) for name in names}
+    print(f"{'total':<24}" + ''.join(f'{totals[name] * 1000:>12.0f}' for name in names))
+    for name in names:
+        failed = {path: status for path, status in results[name][1].items() if status >= 400}
+        if failed:
+            print(f'{name}: ' + ', '.join(f'{path} answered {status}' for path, status in failed.items()))
+
+    for name, packages in imports.items():
+        print(f'\nSlowest imports ({name}):')
+        for seconds, package in packages:
+            print(f'  {package:<40} {seconds * 1000:>6.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
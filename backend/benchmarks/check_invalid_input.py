@@ -0,0 +1,58 @@
+"""
+Check that malformed request bodies are answered with a 400, not a 500.
+
+Posts JSON values of the wrong type (numbers, lists, objects where the API
+expects strings or ids) to the write endpoints through the Flask test client
+and expects the endpoint's usual 400 {'error': ...} for each. Run from the
+backend folder:
+
+    python benchmarks/check_invalid_input.py
+"""
+
+import sys
+from datetime import timedelta
+
+from common import use_scratch_database, reset_database
+
+use_scratch_database()
+
+import app as backend
+from models import db, User
+
+
+def main():
+    app = backend.create_app()
+    with app.app_context():
+        location = dict(zip(('latitude', 'longitude'), backend.venues().venues[0].center))
+        reset_database(db)
+        db.session.execute(User.__table__.insert(), [
+            {'id': 'u0', 'email': 'u0@example.com', 'name': 'User 0', 'picture': None},
+        ])
+        db.session.commit()
+        token = backend.token_store().issue('u0', timedelta(hours=1))
+
+    cases = [
+        ('/api/checkin', dict(location, photo=123)),
+        ('/api/checkin', dict(location, photo=['a'])),
+        ('/api/checkin', dict(location, photo={'data': 'a'})),
+        ('/api/react', {'checkin_id': 1, 'reaction_type': 1}),
+        ('/api/react', {'checkin_id': 1, 'reaction_type': ['like']}),
+        ('/api/react', {'checkin_id': [1], 'reaction_type': 'like'}),
+        ('/api/react', {'checkin_id': {'id': 1}, 'reaction_type': 'like'}),
+        ('/api/react', {'checkin_id': '1', 'reaction_type': 'like'}),
+        ('/api/react', {'checkin_id': True, 'reaction_type': 'like'}),
+        ('/api/react', ['like']),
+    ]
+    client = app.test_client()
+    ok = True
+    for path, body in cases:
+        response = client.post(path, json=body, headers={'Authorization': f'Bearer {token}'})
+        passed = response.status_code == 400 and 'error' in (response.get_json(silent=True) or {})
+        ok &= passed
+        shown = {key: value for key, value in body.items() if key not in location} if isinstance(body, dict) else body
+        print(f"{'ok' if passed else 'FAIL':<5}{path} {shown}: {response.status_code}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
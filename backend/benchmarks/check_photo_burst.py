@@ -0,0 +1,95 @@
+"""
+Check that a burst of check-ins slightly over the photo pipeline's capacity
+is absorbed rather than turned away.
+
+Starts a threaded server with the deployed photo settings (PHOTO_WORKERS,
+PHOTO_QUEUE_SIZE and PHOTO_SUBMIT_TIMEOUT as configured, by default 2 + 8
+places and 10 s), then has PHOTO_WORKERS + PHOTO_QUEUE_SIZE + --extra users
+check in at the same moment with camera-sized photos. Every check-in must
+succeed; the uploads beyond the queue wait for a place instead of getting a
+503. Run from the backend folder:
+
+    python benchmarks/check_photo_burst.py [--extra 4]
+"""
+
+import argparse
+import base64
+import io
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from common import use_scratch_database, reset_database
+
+use_scratch_database()
+
+import requests
+from PIL import Image
+from werkzeug.serving import make_server
+
+import app as backend
+from models import db, User
+
+
+def camera_photo(seed):
+    """A 1280x960 JPEG data URL with enough detail to take a while to re-encode."""
+    rng = random.Random(seed)
+    img = Image.frombytes('RGB', (1280, 960), rng.randbytes(1280 * 960 * 3))
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=90)
+    return 'data:image/jpeg;base64,' + base64.b64encode(out.getvalue()).decode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--extra', type=int, default=4, help='Check-ins beyond the pipeline capacity.')
+    args = parser.parse_args()
+
+    app = backend.create_app()
+    capacity = app.config['PHOTO_WORKERS'] + app.config['PHOTO_QUEUE_SIZE']
+    n = capacity + args.extra
+    with app.app_context():
+        location = dict(zip(('latitude', 'longitude'), backend.venues().venues[0].center))
+        reset_database(db)
+        db.session.execute(User.__table__.insert(), [
+            {'id': f'u{i}', 'email': f'u{i}@example.com', 'name': f'User {i}', 'picture': None} for i in range(n)
+        ])
+        db.session.commit()
+        tokens = [backend.token_store().issue(f'u{i}', timedelta(hours=1)) for i in range(n)]
+    # Distinct photos, so none is deduplicated by the blob store
+    photos = [camera_photo(i) for i in range(n)]
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    barrier = threading.Barrier(n)
+
+    def check_in(i):
+        body = dict(location, photo=photos[i])
+        barrier.wait(timeout=30)
+        start = time.perf_counter()
+        response = requests.post(f'{base_url}/api/checkin', json=body,
+                                 headers={'Authorization': f'Bearer {tokens[i]}'})
+        return response.status_code, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        results = list(pool.map(check_in, range(n)))
+    server.shutdown()
+
+    statuses = Counter(status for status, _ in results)
+    slowest = max(seconds for _, seconds in results)
+    ok = statuses == Counter({200: n})
+    codes = ', '.join(f'{code}: {count}' for code, count in sorted(statuses.items()))
+    print(f"{'ok' if ok else 'FAIL':<5}{n} check-ins at once, capacity {capacity}: {codes}; "
+          f"slowest {slowest * 1000:.0f} ms (PHOTO_SUBMIT_TIMEOUT {app.config['PHOTO_SUBMIT_TIMEOUT']:g} s)")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Check that the hot queries are served from indexes.
+
+Builds the schema by running the migrations, seeds a few months of
+check-ins, reactions and secrets, then runs EXPLAIN on the leaderboard,
+history, reaction, secret and standings lookups and fails if any of them
+scans one of its tables in full. The standings read user_stats whole, one
+row per user, and must not touch checkins or reactions. Run from the backend folder:
+
+    python benchmarks/check_query_plans.py [--users 200] [--days 90]
+"""
+
+import argparse
+import random
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+from common import use_scratch_database, reset_database, seed_day
+
+use_scratch_database()
+
+from sqlalchemy import select, text
+
+from app import create_app
+from models import db, CheckIn, Reaction, UserSecret
+from leaderboard import leaderboard_query, history_query, reaction_counts_subquery
+from secret_codes import rebuild_secret_progress, secret_leaderboard_query
+from standings import rebuild_standings, standings_query
+
+
+def seed_history(users, days):
+    """Past days on which a random half of the users checked in and reacted."""
+    rng = random.Random(days)
+    checkins, reactions = [], []
+    next_id = len(users) + 1
+    for offset in range(1, days + 1):
+        day = date.today() - timedelta(days=offset)
+        start = datetime.combine(day, datetime.min.time()) + timedelta(hours=8)
+        present = rng.sample(users, len(users) // 2)
+        first_id = next_id
+        for i, user in enumerate(present):
+            checkins.append({
+                'id': next_id,
+                'user_id': user['id'],
+                'check_in_date': day,
+                'check_in_time': start + timedelta(seconds=i),
+                'latitude': 52.3547,
+                'longitude': 4.9543,
+                'like_count': 0,
+                'dislike_count': 0
+            })
+            next_id += 1
+        for user in present:
+            target = rng.randrange(first_id, next_id)
+            reaction_type = rng.choice(['like', 'dislike'])
+            checkins[target - len(users) - 1][f'{reaction_type}_count'] += 1
+            reactions.append({'user_id': user['id'], 'checkin_id': target,
+                              'reaction_type': reaction_type, 'reaction_date': day})
+    db.session.execute(CheckIn.__table__.insert(), checkins)
+    db.session.execute(Reaction.__table__.insert(), reactions)
+    db.session.execute(UserSecret.__table__.insert(), [
+        {'user_id': user['id'], 'secret_code': code}
+        for user in users for code in ('job_click', 'chess', 'ian') if rng.random() < 0.5
+    ])
+    db.session.commit()
+
+
+def explain(statement):
+    """Plan lines for a statement, using the dialect's EXPLAIN."""
+    compiled = statement.compile(dialect=db.engine.dialect)
+    sqlite = db.engine.dialect.name == 'sqlite'
+    if sqlite:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        sql = 'EXPLAIN QUERY PLAN ' + str(compiled)
+    else:
+        params = compiled.params
+        sql = 'EXPLAIN ' + str(compiled)
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(sql, params).fetchall()
+    return [row[-1] if sqlite else row[0] for row in rows]
+
+
+def full_scans(plan, tables):
+    """Tables from `tables` that the plan reads without an index."""
+    found = set()
+    for line in plan:
+        # SQLite: "SEARCH t USING INDEX" seeks; "SCAN t" and "SCAN t USING
+        # INDEX" walk the whole table. An index-only walk (COVERING INDEX) is
+        # allowed, the history date list stops after a few entries of it.
+        match = re.search(r'\bSCAN (\w+)', line)
+        if match and match.group(1) in tables and 'COVERING INDEX' not in line:
+            found.add(match.group(1))
+        # Postgres: "Seq Scan on checkins"
+        match = re.search(r'Seq Scan on (\w+)', line)
+        if match and match.group(1) in tables:
+            found.add(match.group(1))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--days', type=int, default=90)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        reset_database(db, migrate=True)
+        users = seed_day(db, args.users)
+        seed_history(users, args.days)
+        rebuild_secret_progress()
+        rebuild_standings()
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+
+        today = date.today()
+        user_id = users[0]['id']
+        counts = reaction_counts_subquery(today)
+        checks = [
+            ('leaderboard', leaderboard_query(today), {'checkins'}),
+            ('history', history_query(30), {'checkins'}),
+            ('history for one user', history_query(30, user_id=user_id), {'checkins'}),
+            ('reaction tallies', select(counts), {'reactions'}),
+            ("user's reaction of the day",
+             Reaction.query.filter_by(user_id=user_id, reaction_date=today), {'reactions'}),
+            ("user's secrets", UserSecret.query.filter_by(user_id=user_id), {'user_secrets'}),
+            ('secret leaderboard', secret_leaderboard_query(), {'users'}),
+            ('standings', standings_query('checkins', today), {'users', 'checkins', 'reactions'}),
+        ]
+
+        failures = 0
+        for name, query, tables in checks:
+            statement = getattr(query, 'statement', query)
+            plan = explain(statement)
+            scanned = full_scans(plan, tables)
+            print(f"{'FAIL' if scanned else 'ok':<5}{name}")
+            for line in plan:
+                print(f'       {line}')
+            if scanned:
+                print(f"       full scan of {', '.join(sorted(scanned))}")
+                failures += 1
+
+    print(f'\n{len(checks) - failures}/{len(checks)} queries use indexes')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
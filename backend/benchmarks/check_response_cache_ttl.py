@@ -0,0 +1,112 @@
+"""
+Check that RESPONSE_CACHE_TTL bounds how stale a worker's leaderboard gets
+when workers share no pub/sub backend.
+
+Starts two app processes on the same database with PUBSUB_BACKEND=inprocess,
+so neither hears about the other's writes. A client reads the leaderboard from
+worker A, likes a check-in through worker B, then keeps revalidating with A
+using its ETag. A may answer 304 until its TTL window ends, but must serve
+the new like count within RESPONSE_CACHE_TTL (plus a little slack); a worker
+that keeps answering 304 fails the check. Run from the backend folder:
+
+    python benchmarks/check_response_cache_ttl.py [--ttl 2]
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+from common import use_scratch_database, reset_database, seed_day
+
+use_scratch_database()
+os.environ['PUBSUB_BACKEND'] = 'inprocess'
+
+import requests
+
+# Polling interval and allowance on top of the TTL
+POLL_INTERVAL = 0.1
+SLACK = 1.0
+
+
+def serve():
+    """Run one worker and print its port once it listens."""
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+def start_worker():
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve'],
+                               stdout=subprocess.PIPE, text=True, env=os.environ.copy())
+    port = int(process.stdout.readline())
+    return process, f'http://127.0.0.1:{port}'
+
+
+def like_count(response, checkin_id):
+    return next(row['likes'] for row in response.json()['leaderboard'] if row['checkin_id'] == checkin_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ttl', type=int, default=2, help='RESPONSE_CACHE_TTL of both workers, in seconds.')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    os.environ['RESPONSE_CACHE_TTL'] = str(args.ttl)
+    if args.serve:
+        return serve()
+
+    from app import create_app, token_store
+    from models import db
+    from standings import rebuild_standings
+
+    app = create_app()
+    with app.app_context():
+        reset_database(db)
+        users = seed_day(db, 3, reactions=False)
+        rebuild_standings()
+        token = token_store().issue(users[0]['id'], timedelta(hours=1))
+    # users[1]'s check-in, which users[0] likes through the other worker
+    checkin_id = 2
+
+    workers = [start_worker(), start_worker()]
+    try:
+        (_, worker_a), (_, worker_b) = workers
+        first = requests.get(f'{worker_a}/api/leaderboard')
+        before = like_count(first, checkin_id)
+        liked = requests.post(f'{worker_b}/api/react', json={'checkin_id': checkin_id, 'reaction_type': 'like'},
+                              headers={'Authorization': f'Bearer {token}'})
+        assert liked.status_code == 200, liked.text
+        written = time.monotonic()
+
+        etag, statuses = first.headers['ETag'], []
+        deadline = written + args.ttl + SLACK
+        while time.monotonic() < deadline:
+            response = requests.get(f'{worker_a}/api/leaderboard', headers={'If-None-Match': etag})
+            statuses.append(response.status_code)
+            if response.status_code == 200:
+                break
+            time.sleep(POLL_INTERVAL)
+        stale = time.monotonic() - written
+    finally:
+        for process, _ in workers:
+            process.terminate()
+            process.wait()
+
+    after = like_count(response, checkin_id) if response.status_code == 200 else before
+    ok = after == before + 1 and stale <= args.ttl + SLACK
+    print(f"{'ok' if ok else 'FAIL':<5}worker A after a like on worker B: {statuses.count(304)} x 304, "
+          f"then {response.status_code} after {stale:.2f} s (likes {before} -> {after}, "
+          f"RESPONSE_CACHE_TTL {args.ttl} s)")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
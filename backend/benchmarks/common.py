@@ -0,0 +1,135 @@
+"""
+Shared helpers for the backend benchmarks.
+
+Benchmarks run against a throwaway SQLite database unless DATABASE_URL is
+set, so they can also be pointed at a local Postgres.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import random
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def use_scratch_database():
+    """Point the app at a fresh SQLite file unless DATABASE_URL is set."""
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(prefix='jochies-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    return os.environ['DATABASE_URL']
+
+
+def reset_database(db, migrate=False):
+    """
+    Drop and recreate all tables (local databases only).
+
+    With migrate=True the schema is built by running the migrations instead
+    of db.create_all(), so it is exactly what production gets.
+    """
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' and url.host not in ('localhost', '127.0.0.1', '::1'):
+        raise SystemExit(f'Refusing to reset non-local database {url.host}')
+    db.drop_all()
+    if migrate:
+        from flask import current_app
+        from flask_migrate import upgrade
+        from sqlalchemy import text
+        from app import init_migrate
+        init_migrate(current_app._get_current_object())
+        db.session.execute(text('DROP TABLE IF EXISTS alembic_version'))
+        db.session.commit()
+        upgrade(directory=os.path.join(BACKEND_DIR, 'migrations'))
+    else:
+        db.create_all()
+    # Responses cached for the previous dataset are stale now
+    from flask import current_app
+    if 'response_cache' in current_app.extensions:
+        current_app.extensions['response_cache'].invalidate_all()
+
+
+def seed_day(db, n_checkins, day=None, photo_bytes=0, reactions=True):
+    """Seed one day with n users who all checked in and reacted to someone else."""
+    from models import User, CheckIn, Reaction
+
+    day = day or date.today()
+    start = datetime.combine(day, datetime.min.time()) + timedelta(hours=8)
+    photo = 'data:image/jpeg;base64,' + 'A' * photo_bytes if photo_bytes else None
+
+    users = [{
+        'id': f'bench-user-{i}',
+        'email': f'bench{i}@example.com',
+        'name': f'Bench User {i}',
+        'picture': f'https://example.com/{i}.png'
+    } for i in range(n_checkins)]
+    db.session.execute(User.__table__.insert(), users)
+
+    checkins = [{
+        'id': i + 1,
+        'user_id': users[i]['id'],
+        'check_in_date': day,
+        'check_in_time': start + timedelta(seconds=i),
+        'latitude': 52.3547,
+        'longitude': 4.9543,
+        'photo_data': photo,
+        'like_count': 0,
+        'dislike_count': 0
+    } for i in range(n_checkins)]
+
+    rows = []
+    if reactions and n_checkins > 1:
+        rng = random.Random(n_checkins)
+        for i in range(n_checkins):
+            target = rng.randrange(n_checkins - 1)
+            if target >= i:
+                target += 1
+            reaction_type = rng.choice(['like', 'like', 'dislike'])
+            checkins[target][f'{reaction_type}_count'] += 1
+            rows.append({
+                'user_id': users[i]['id'],
+                'checkin_id': target + 1,
+                'reaction_type': reaction_type,
+                'reaction_date': day
+            })
+
+    db.session.execute(CheckIn.__table__.insert(), checkins)
+    if rows:
+        db.session.execute(Reaction.__table__.insert(), rows)
+
+    db.session.commit()
+    return users
+
+
+class QueryCounter:
+    """Counts statements executed on an engine while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+@contextmanager
+def timed():
+    """Yield a dict whose 'seconds' key is filled in on exit."""
+    result = {}
+    start = time.perf_counter()
+    yield result
+    result['seconds'] = time.perf_counter() - start
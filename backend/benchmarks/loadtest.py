@@ -0,0 +1,205 @@
+"""
+Load test for the morning check-in rush.
+
+Seeds N users, issues them bearer tokens directly (no Google OAuth), then has
+every user go through the real flow concurrently over HTTP:
+
+    verify-location -> checkin (with a phone-sized photo) -> leaderboard
+    -> react to someone else -> poll the leaderboard a few more times
+
+and reports per-endpoint latency percentiles, throughput, SQL queries per
+request, response status codes and the peak RSS of the process. Exits
+non-zero if any request got a 5xx. By default the app is served
+in-process by a threaded WSGI server on a scratch SQLite database; set
+DATABASE_URL to run against a local Postgres. Run from the backend folder:
+
+    python benchmarks/loadtest.py --users 200 --concurrency 32
+"""
+
+import argparse
+import base64
+import io
+import logging
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from common import use_scratch_database, reset_database
+
+use_scratch_database()
+
+import requests
+from flask import has_request_context, request
+from PIL import Image, ImageDraw
+from sqlalchemy import event
+from werkzeug.serving import make_server
+
+import app as backend
+from models import db, User
+
+ENDPOINTS = ['verify_location', 'checkin', 'give_reaction', 'get_leaderboard']
+
+
+def make_photo(seed, size=(1280, 960), quality=70):
+    """A photo-like JPEG data URL of a few hundred KB, unique per seed."""
+    rng = random.Random(seed)
+    img = Image.effect_noise(size, 64).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for _ in range(20):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse((x, y, x + rng.randrange(40, 300), y + rng.randrange(40, 300)),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=quality)
+    return 'data:image/jpeg;base64,' + base64.b64encode(out.getvalue()).decode()
+
+
+def seed_users(n):
+    """Create n users and return a bearer token for each."""
+    db.session.execute(User.__table__.insert(), [{
+        'id': f'load-user-{i}',
+        'email': f'load{i}@example.com',
+        'name': f'Load User {i}',
+        'picture': None
+    } for i in range(n)])
+    db.session.commit()
+    return [backend.token_store().issue(f'load-user-{i}', timedelta(hours=1)) for i in range(n)]
+
+
+class QueryStats:
+    """SQL statements per Flask endpoint, counted on the engine."""
+
+    def __init__(self, engine):
+        self.counts = defaultdict(int)
+        self.lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        if has_request_context():
+            with self.lock:
+                # View name without the blueprint, e.g. 'checkin'
+                self.counts[request.endpoint.rpartition('.')[2]] += 1
+
+
+class Recorder:
+    """Latencies and status codes per endpoint."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+    def call(self, session, endpoint, method, url, **kwargs):
+        start = time.perf_counter()
+        response = session.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            self.statuses[endpoint][response.status_code] += 1
+        return response
+
+
+def user_flow(base_url, token, location, photo, recorder, polls):
+    session = requests.Session()
+    session.headers['Authorization'] = f'Bearer {token}'
+    recorder.call(session, 'verify_location', 'POST', f'{base_url}/api/verify-location', json=location)
+    recorder.call(session, 'checkin', 'POST', f'{base_url}/api/checkin', json=dict(location, photo=photo))
+    board = recorder.call(session, 'get_leaderboard', 'GET', f'{base_url}/api/leaderboard').json()
+
+    me = session.get(f'{base_url}/auth/user').json()['user']['name']
+    others = [e for e in board['leaderboard'] if e['name'] != me]
+    if others:
+        target = random.choice(others)
+        recorder.call(session, 'give_reaction', 'POST', f'{base_url}/api/react',
+                      json={'checkin_id': target['checkin_id'], 'reaction_type': random.choice(['like', 'dislike'])})
+    etag = None
+    for _ in range(polls):
+        headers = {'If-None-Match': etag} if etag else {}
+        response = recorder.call(session, 'get_leaderboard', 'GET', f'{base_url}/api/leaderboard', headers=headers)
+        etag = response.headers.get('ETag', etag)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def report(recorder, queries, wall_time):
+    """Print the results and return the number of 5xx responses."""
+    print(f"\n{'endpoint':<18} {'requests':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'req/s':>8} {'queries/req':>11}  statuses")
+    total = 0
+    for endpoint in ENDPOINTS:
+        samples = recorder.latencies[endpoint]
+        if not samples:
+            continue
+        total += len(samples)
+        per_request = queries.counts[endpoint] / len(samples) if queries else float('nan')
+        statuses = ' '.join(f'{code}:{count}' for code, count in sorted(recorder.statuses[endpoint].items()))
+        print(f"{endpoint:<18} {len(samples):>8} "
+              f"{percentile(samples, 50) * 1000:>8.1f} {percentile(samples, 95) * 1000:>8.1f} "
+              f"{percentile(samples, 99) * 1000:>8.1f} {len(samples) / wall_time:>8.1f} {per_request:>11.2f}  {statuses}")
+    all_samples = [s for samples in recorder.latencies.values() for s in samples]
+    print(f"\n{total} requests in {wall_time:.2f}s ({total / wall_time:.1f} req/s), "
+          f"mean latency {statistics.mean(all_samples) * 1000:.1f} ms")
+    # ru_maxrss is in KB on Linux; it includes the load generator itself
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    return sum(count for statuses in recorder.statuses.values()
+               for code, count in statuses.items() if code >= 500)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100, help='Users checking in.')
+    parser.add_argument('--concurrency', type=int, default=16, help='Users active at the same time.')
+    parser.add_argument('--polls', type=int, default=3, help='Leaderboard polls per user after reacting.')
+    parser.add_argument('--url', help='Drive an already running server on the same DATABASE_URL instead '
+                                      '(no query counts).')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    app = backend.create_app()
+    with app.app_context():
+        reset_database(db)
+        tokens = seed_users(args.users)
+        location = dict(zip(('latitude', 'longitude'), backend.venues().venues[0].center))
+        queries = None if args.url else QueryStats(db.engine)
+
+    print(f'Generating {args.users} photos...')
+    photos = [make_photo(i) for i in range(args.users)]
+    print(f'Average photo upload: {statistics.mean(len(p) for p in photos) / 1024:.0f} KB')
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(user_flow, base_url, token, location, photo, recorder, args.polls)
+                   for token, photo in zip(tokens, photos)]
+        for future in futures:
+            future.result()
+    wall_time = time.perf_counter() - start
+
+    if server is not None:
+        server.shutdown()
+    server_errors = report(recorder, queries, wall_time)
+    if server_errors:
+        print(f'FAIL: {server_errors} requests got a 5xx')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
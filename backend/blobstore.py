@@ -0,0 +1,163 @@
+"""
+Content-addressed blob storage for check-in photos.
+
+Blobs are keyed by the SHA-256 of their content, so storing the same photo
+twice is free and a key never changes meaning, which makes stored blobs safe
+to cache forever. Variants such as thumbnails are keyed by a hash of the
+original key and the variant name. Two backends are provided:
+
+- LocalBlobStore keeps blobs as files under a directory (fan-out by the
+  first two hex characters of the key).
+- DatabaseBlobStore keeps blobs in their own table, away from `checkins`,
+  for hosts without a persistent disk.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+
+from models import db, Blob, insert_many_unless_exist
+
+
+def content_key(data):
+    """Content address for a blob."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def derived_key(key, variant):
+    """Key of a variant (e.g. a thumbnail) derived from a stored blob."""
+    return hashlib.sha256(f'{key}:{variant}'.encode()).hexdigest()
+
+
+def is_valid_key(key):
+    """Keys are 64 lowercase hex characters."""
+    return len(key) == 64 and all(c in '0123456789abcdef' for c in key)
+
+
+def guess_image_mimetype(head):
+    """Guess an image mimetype from its first bytes."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    return 'application/octet-stream'
+
+
+class BlobStore:
+    """Interface for blob storage backends."""
+
+    def put(self, data):
+        """Store bytes and return their content key."""
+        key = content_key(data)
+        if not self.exists(key):
+            self._write(key, data)
+        return key
+
+    def put_variant(self, key, variant, data):
+        """Store a variant of the blob `key` and return the variant's key."""
+        vkey = derived_key(key, variant)
+        if not self.exists(vkey):
+            self._write(vkey, data)
+        return vkey
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def open(self, key):
+        """Open a blob for reading as a seekable binary file."""
+        raise NotImplementedError
+
+    def size(self, key):
+        """Size of a blob in bytes."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def verify(self, key):
+        """True if the blob stored under a content key reads back intact."""
+        try:
+            with self.open(key) as f:
+                return content_key(f.read()) == key
+        except OSError:
+            return False
+
+    def _write(self, key, data):
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs stored as files on the local filesystem."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def size(self, key):
+        return os.path.getsize(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def _write(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class DatabaseBlobStore(BlobStore):
+    """Blobs stored in the `blobs` table."""
+
+    def exists(self, key):
+        return db.session.query(Blob.key).filter_by(key=key).first() is not None
+
+    def open(self, key):
+        blob = db.session.get(Blob, key)
+        if blob is None:
+            raise FileNotFoundError(key)
+        return io.BytesIO(blob.data)
+
+    def size(self, key):
+        size = db.session.query(Blob.size).filter_by(key=key).scalar()
+        if size is None:
+            raise FileNotFoundError(key)
+        return size
+
+    def delete(self, key):
+        Blob.query.filter_by(key=key).delete()
+        db.session.commit()
+
+    def _write(self, key, data):
+        # The same content may be stored concurrently; the first write wins
+        insert_many_unless_exist(Blob, ['key'], [{'key': key, 'data': data, 'size': len(data)}], Blob.key)
+        db.session.commit()
+
+
+def create_blob_store(app):
+    """Create the blob store configured for the app."""
+    backend = app.config['BLOB_STORE']
+    if backend == 'local':
+        return LocalBlobStore(app.config['PHOTO_STORAGE_DIR'])
+    if backend == 'database':
+        return DatabaseBlobStore()
+    raise ValueError(f'Unknown BLOB_STORE: {backend}')
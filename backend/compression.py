@@ -0,0 +1,122 @@
+"""
+Response compression.
+
+JSON (and /metrics) responses of at least COMPRESS_MIN_SIZE bytes are
+compressed with the best coding the client accepts: brotli if the `brotli`
+package is installed, else gzip. Smaller ones aren't worth the CPU. Streamed
+responses (see json_stream.py) are compressed chunk by chunk as they are
+sent; they are only streamed when they are large. Server-Sent Events are
+never compressed, a compressor would hold events back until its buffer fills.
+
+Compressing changes the bytes but not the content, so a strong ETag is made
+weak, as nginx does. If-None-Match compares weakly, so it still matches.
+The response cache stores each coding's body separately (see http_cache.py).
+"""
+
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/plain'}
+GZIP_LEVEL = 6
+# Brotli's highest qualities are meant for static files; 5 compresses better
+# than gzip -6 at about the same speed
+BROTLI_QUALITY = 5
+# A 256 KB window instead of the default 4 MB, the compressor's memory
+# scales with it
+BROTLI_WINDOW_BITS = 18
+
+
+class _Gzip:
+    def __init__(self):
+        # wbits 16 + 15: gzip header and trailer around deflate
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self.compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY, lgwin=BROTLI_WINDOW_BITS)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+# Preferred first when the client accepts several equally
+CODINGS = {'br': _Brotli, 'gzip': _Gzip} if brotli is not None else {'gzip': _Gzip}
+
+
+def compress(data, coding):
+    """`data` compressed with `coding` in one go."""
+    compressor = CODINGS[coding]()
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_chunks(chunks, coding):
+    """Compress an iterable of byte chunks as it is consumed."""
+    compressor = CODINGS[coding]()
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+class Compression:
+    """Compresses responses in the coding negotiated with Accept-Encoding."""
+
+    def __init__(self, app=None):
+        self.min_size = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        app.after_request(self._after_request)
+        app.extensions['compression'] = self
+
+    def negotiate(self):
+        """The coding for this request's response, or None to send it as is."""
+        return request.accept_encodings.best_match(list(CODINGS))
+
+    def compress(self, response, coding):
+        """Compress a response in place with `coding` if it is worth it. Returns the response."""
+        if response.status_code != 200 or 'Content-Encoding' in response.headers \
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        if not response.is_streamed and response.calculate_content_length() < self.min_size:
+            return response
+        # Large enough that the body depends on Accept-Encoding
+        response.vary.add('Accept-Encoding')
+        if coding is None:
+            return response
+        if response.is_streamed:
+            response.response = compress_chunks(response.response, coding)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(compress(response.get_data(), coding))
+        response.content_encoding = coding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _after_request(self, response):
+        return self.compress(response, self.negotiate())
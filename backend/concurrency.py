@@ -0,0 +1,46 @@
+"""
+Running under gevent.
+
+With GUNICORN_WORKER_CLASS=gevent (see gunicorn.conf.py) each worker serves
+its requests as greenlets on one OS thread, and the standard library is
+monkey patched before the app is imported: sockets, locks, queues and
+threading.Thread all become cooperative. Two things are not covered by that:
+
+- psycopg2 talks to Postgres in C, so a query would block every greenlet of
+  the worker. make_cooperative() installs psycogreen's wait callback, which
+  waits on the connection's socket through gevent instead.
+- CPU-bound work (photo ingest, morph rendering) on a patched
+  ThreadPoolExecutor would run on the worker's only OS thread and stall all
+  requests. background_executor() gives those pools real OS threads from
+  gevent's thread pool, whose futures can still be waited on cooperatively.
+
+Outside gevent both are no-ops, and gevent is never imported.
+"""
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+def gevent_patched():
+    """Whether the standard library has been monkey patched by gevent."""
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+def make_cooperative():
+    """Make psycopg2 yield to other greenlets while waiting on Postgres. Returns whether it did."""
+    if not gevent_patched():
+        return False
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+    return True
+
+
+def background_executor(max_workers, thread_name_prefix):
+    """A ThreadPoolExecutor for CPU-bound work, on OS threads even under gevent."""
+    if gevent_patched():
+        from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+        return GeventThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
@@ -0,0 +1,162 @@
+"""
+Database connection pooling.
+
+Every gunicorn worker has its own pool, so the server sees up to workers x
+(DB_POOL_SIZE + DB_MAX_OVERFLOW) connections; keep that below its limit.
+DB_POOL_MODE picks the pool:
+
+- 'queue' (default): SQLAlchemy's QueuePool. DB_POOL_SIZE connections stay
+  open, DB_MAX_OVERFLOW more are opened under load, and a request beyond
+  that waits up to DB_POOL_TIMEOUT seconds for one. Connections are
+  replaced after DB_POOL_RECYCLE seconds and, with DB_POOL_PRE_PING, tested
+  before use, so one dropped by the server doesn't fail a request.
+- 'null': no pooling in the app, each checkout opens a connection. For
+  PgBouncer (or another pooler) in transaction mode, which keeps the real
+  connections and hands them to another client between transactions. That
+  is safe because the app keeps no session state on a connection: no
+  prepared statements (psycopg2 has none), SET, advisory locks or LISTEN.
+
+SQLite, for local runs, is switched to WAL so readers and the writer don't
+block each other, and waits up to SQLITE_BUSY_TIMEOUT ms for a lock
+instead of failing with "database is locked".
+
+The time each checkout takes (waiting for a free connection, or opening
+one) and the connections in use are kept in PoolStats for /metrics.
+"""
+
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+from metrics import Histogram
+
+POOL_MODES = {
+    'queue': QueuePool,
+    'null': NullPool,
+}
+CHECKOUT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class PoolStats:
+    """Checkout times and connections in use of one pool."""
+
+    def __init__(self, capacity):
+        # None when the app doesn't bound the connections (NullPool)
+        self.capacity = capacity
+        self.checkout_time = Histogram(CHECKOUT_BUCKETS)
+        self.timeouts = 0
+        self.in_use = 0
+        self.lock = threading.Lock()
+
+    def checked_out(self, seconds):
+        with self.lock:
+            self.checkout_time.observe(seconds)
+
+    def timed_out(self):
+        with self.lock:
+            self.timeouts += 1
+
+    def saturation(self):
+        """Share of the pool's connections in use, or None if unbounded."""
+        return self.in_use / self.capacity if self.capacity else None
+
+
+class _TimedPool:
+    """Mixin recording how long getting a connection from the pool takes."""
+
+    stats = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timed_out()
+            raise
+        self.stats.checked_out(time.perf_counter() - start)
+        return connection
+
+
+def _count_in_use(pool_class, stats):
+    def on_checkout(dbapi_connection, record, proxy):
+        with stats.lock:
+            stats.in_use += 1
+
+    def on_checkin(dbapi_connection, record):
+        with stats.lock:
+            stats.in_use -= 1
+
+    event.listen(pool_class, 'checkout', on_checkout)
+    event.listen(pool_class, 'checkin', on_checkin)
+
+
+def _sqlite_pragmas(busy_timeout):
+    def on_connect(dbapi_connection, record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        cursor.close()
+    return on_connect
+
+
+class DatabasePool:
+    """Builds the engine's pool from the config. Must be set up before db.init_app()."""
+
+    def __init__(self, app=None):
+        self.stats = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        mode = config['DB_POOL_MODE']
+        if mode not in POOL_MODES:
+            raise ValueError(f'Unknown DB_POOL_MODE: {mode}')
+        url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+        sqlite = url.get_backend_name() == 'sqlite'
+        self.mode = mode
+
+        options = {}
+        if mode == 'queue':
+            options.update(
+                pool_size=config['DB_POOL_SIZE'],
+                max_overflow=config['DB_MAX_OVERFLOW'],
+                pool_timeout=config['DB_POOL_TIMEOUT'],
+                pool_recycle=config['DB_POOL_RECYCLE'],
+                pool_pre_ping=config['DB_POOL_PRE_PING'],
+            )
+            self.stats = PoolStats(config['DB_POOL_SIZE'] + config['DB_MAX_OVERFLOW'])
+        else:
+            self.stats = PoolStats(None)
+
+        if sqlite and url.database in (None, '', ':memory:'):
+            # In-memory databases live in their one connection; Flask-SQLAlchemy
+            # pools them itself
+            options = {}
+        else:
+            # A subclass per app, so the events and stats below are its own
+            pool_class = type(f'Timed{POOL_MODES[mode].__name__}', (_TimedPool, POOL_MODES[mode]),
+                              {'stats': self.stats})
+            _count_in_use(pool_class, self.stats)
+            if sqlite:
+                event.listen(pool_class, 'connect', _sqlite_pragmas(config['SQLITE_BUSY_TIMEOUT']))
+            options['poolclass'] = pool_class
+
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(options, **config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        app.extensions['db_pool'] = self
+
+    def status(self):
+        """Connections in use and how saturated the pool is, for /health/db."""
+        saturation = self.stats.saturation()
+        return {
+            'mode': self.mode,
+            'in_use': self.stats.in_use,
+            'capacity': self.stats.capacity,
+            'saturation': round(saturation, 3) if saturation is not None else None,
+            'checkouts': self.stats.checkout_time.count,
+            'checkout_seconds': round(self.stats.checkout_time.sum, 3),
+            'timeouts': self.stats.timeouts,
+        }
@@ -0,0 +1,165 @@
+"""
+Live leaderboard events.
+
+The write paths publish small delta events (a new check-in, changed reaction
+tallies) and /api/leaderboard/stream forwards them to browsers as
+Server-Sent Events, so clients don't have to poll the leaderboard.
+
+Publishing goes through a pluggable pub/sub backend:
+
+- InProcessPubSub fans out to the streams of the current process only. It
+  is enough for a single gunicorn worker (threaded or async).
+- RedisPubSub fans out across workers and machines through Redis PUBLISH/
+  SUBSCRIBE. Any Redis-compatible server works, including a local one for
+  development. Needs the `redis` package.
+"""
+
+import json
+import queue
+import threading
+import time
+
+LEADERBOARD_CHANNEL = 'leaderboard'
+
+
+class Subscription:
+    """Iterator over the messages of one channel."""
+
+    def get(self, timeout):
+        """Next message, or None if nothing arrived within `timeout` seconds."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PubSub:
+    """Interface for pub/sub backends. Messages are JSON-serializable dicts."""
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+
+class _QueueSubscription(Subscription):
+    def __init__(self, pubsub, channel, maxsize):
+        self.pubsub = pubsub
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.pubsub._unsubscribe(self)
+
+
+class InProcessPubSub(PubSub):
+    """Fan-out to subscribers in this process."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait(message)
+            except queue.Full:
+                # A client that stopped reading must not block the writers;
+                # tell it to refetch instead once it catches up. Clearing and
+                # queueing the resync under one lock keeps other publishers
+                # from refilling the queue in between
+                with sub.queue.mutex:
+                    sub.queue.queue.clear()
+                    sub.queue.queue.append({'type': 'resync'})
+                    sub.queue.not_empty.notify()
+
+    def subscribe(self, channel):
+        sub = _QueueSubscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(sub)
+        return sub
+
+    def _unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.get(sub.channel, set()).discard(sub)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+
+class _RedisSubscription(Subscription):
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    def get(self, timeout):
+        message = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None or message['type'] != 'message':
+            return None
+        return json.loads(message['data'])
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisPubSub(PubSub):
+    """Fan-out across processes through Redis PUBLISH/SUBSCRIBE."""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self.client.publish(channel, json.dumps(message))
+
+    def subscribe(self, channel):
+        pubsub = self.client.pubsub()
+        pubsub.subscribe(channel)
+        return _RedisSubscription(pubsub)
+
+
+def create_pubsub(app):
+    """Create the pub/sub backend configured for the app."""
+    backend = app.config['PUBSUB_BACKEND']
+    if backend == 'inprocess':
+        return InProcessPubSub()
+    if backend == 'redis':
+        return RedisPubSub(app.config['REDIS_URL'])
+    raise ValueError(f'Unknown PUBSUB_BACKEND: {backend}')
+
+
+def format_sse(message):
+    """Encode a message as one Server-Sent Event."""
+    return f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+
+def event_stream(pubsub, channel, keepalive=15, max_duration=None):
+    """
+    Yield SSE chunks for a channel until max_duration seconds have passed.
+
+    A comment line is sent every `keepalive` seconds of silence so proxies
+    keep the connection open and dead clients are noticed.
+    """
+    subscription = pubsub.subscribe(channel)
+    deadline = time.monotonic() + max_duration if max_duration else None
+    try:
+        # Reconnect after 3s when the stream ends
+        yield 'retry: 3000\n\n'
+        while deadline is None or time.monotonic() < deadline:
+            message = subscription.get(timeout=keepalive)
+            if message is None:
+                yield ': keepalive\n\n'
+            else:
+                yield format_sse(message)
+    finally:
+        subscription.close()
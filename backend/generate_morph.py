@@ -1,16 +1,29 @@
 """
-Generate a morph GIF from two images using the node mapping.
-Run this once to create the GIF, then serve it statically.
+Generate the morph GIF from IAN1.jpg and IAN2.jpg using the node mapping.
+Run this once to create the GIF, then serve it statically. The morph itself
+is rendered by morph.py; the backend renders other morphs on demand (see
+morph_service.py).
+
+Frames are rendered and quantized to the global GIF palette in a process
+pool, then handed in order to the encoder stage (morph_encoder.py), so only
+the frames in flight are held in memory:
+
+    python generate_morph.py [--frames 40] [--size 800] [--zoom 1.4] [--workers 4] [--preset balanced]
+
+To pick a preset, compare the size and SSIM of all of them:
+
+    python generate_morph.py --report /tmp/morph-report
 """
 
-import json
-import numpy as np
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
-import imageio
-from scipy.interpolate import griddata
-from scipy.ndimage import map_coordinates
 import os
 
+from morph import NUM_FRAMES, FRAME_DURATION, OUTPUT_SIZE, ZOOM_FACTOR, MorphEngine, load_nodes, palette_for
+from morph_encoder import (DEFAULT_PRESET, PRESETS, AnimationEncoder, luminance, quality_report, quantize)
+
 # Paths
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IANMORPH_DIR = os.path.join(SCRIPT_DIR, '..', 'frontend', 'public', 'ianmorph')
@@ -19,186 +32,155 @@ IMG1_PATH = os.path.join(IANMORPH_DIR, 'IAN1.jpg')
 IMG2_PATH = os.path.join(IANMORPH_DIR, 'IAN2.jpg')
 NODES_PATH = os.path.join(IANMORPH_DIR, 'nodes (1).json')
 OUTPUT_PATH = os.path.join(IANMORPH_DIR, 'ian_morph.gif')
+WEBP_PATH = os.path.join(IANMORPH_DIR, 'ian_morph.webp')
 
-# Settings
-NUM_FRAMES = 40  # More frames = smoother animation
-FRAME_DURATION = 0.05  # 20fps, total 2 seconds
-OUTPUT_SIZE = (800, 800)  # Higher resolution for quality
-
-# Zoom/crop settings - zoom into center to remove sidebars
-ZOOM_FACTOR = 1.4  # 1.0 = no zoom, higher = more zoomed in
-
-
-def load_nodes(path):
-    """Load the node mapping from JSON."""
-    with open(path, 'r') as f:
-        data = json.load(f)
-    return data[0], data[1]  # nodes1, nodes2
-
-
-def create_mesh_grid(nodes, size):
-    """Convert node list to mesh grid coordinates."""
-    points = []
-    values_x = []
-    values_y = []
-    
-    for node in nodes:
-        points.append([node['u'], node['v']])
-        values_x.append(node['x'])
-        values_y.append(node['y'])
-    
-    return np.array(points), np.array(values_x), np.array(values_y)
-
-
-def warp_image_bilinear(img, nodes, size):
-    """Warp an image with bilinear interpolation for smooth results."""
-    h, w = size
-    
-    # Create output coordinate grid
-    y_coords, x_coords = np.mgrid[0:h, 0:w]
-    y_norm = y_coords / h
-    x_norm = x_coords / w
-    
-    # Get node mapping
-    points, dest_x, dest_y = create_mesh_grid(nodes, size)
-    
-    grid_points = np.column_stack([x_norm.ravel(), y_norm.ravel()])
-    
-    # Map destination -> source
-    source_x = griddata(
-        np.column_stack([dest_x, dest_y]), 
-        points[:, 0], 
-        grid_points, 
-        method='cubic',
-        fill_value=0.5
-    ).reshape(h, w)
-    
-    source_y = griddata(
-        np.column_stack([dest_x, dest_y]), 
-        points[:, 1], 
-        grid_points, 
-        method='cubic',
-        fill_value=0.5
-    ).reshape(h, w)
-    
-    # Convert to pixel coordinates
-    img_h, img_w = img.shape[:2]
-    sample_x = source_x * (img_w - 1)
-    sample_y = source_y * (img_h - 1)
-    
-    # Clip to valid range
-    sample_x = np.clip(sample_x, 0, img_w - 1)
-    sample_y = np.clip(sample_y, 0, img_h - 1)
-    
-    # Use bilinear interpolation for each channel
-    warped = np.zeros((h, w, 3), dtype=np.uint8)
-    for c in range(3):
-        warped[:, :, c] = map_coordinates(
-            img[:, :, c].astype(np.float64),
-            [sample_y, sample_x],
-            order=1,  # Bilinear
-            mode='nearest'
-        ).astype(np.uint8)
-    
-    return warped
-
-
-def interpolate_nodes(nodes1, nodes2, t):
-    """Interpolate between two node sets."""
-    interpolated = []
-    for n1, n2 in zip(nodes1, nodes2):
-        interpolated.append({
-            'x': n1['x'] * (1 - t) + n2['x'] * t,
-            'y': n1['y'] * (1 - t) + n2['y'] * t,
-            'u': n1['u'],
-            'v': n1['v']
-        })
-    return interpolated
-
-
-def crop_center_zoom(img, zoom_factor):
-    """Crop and zoom into center of image."""
-    h, w = img.shape[:2]
-    
-    # Calculate crop region
-    crop_h = int(h / zoom_factor)
-    crop_w = int(w / zoom_factor)
-    
-    start_y = (h - crop_h) // 2
-    start_x = (w - crop_w) // 2
-    
-    # Crop
-    cropped = img[start_y:start_y+crop_h, start_x:start_x+crop_w]
-    
-    # Resize back to original size
-    cropped_pil = Image.fromarray(cropped)
-    resized = cropped_pil.resize((w, h), Image.Resampling.LANCZOS)
-    
-    return np.array(resized)
+# Frames rendered ahead of the writers, per worker
+FRAMES_IN_FLIGHT = 2
 
+_engine = None
+_palette = None
 
-def generate_morph_gif():
-    """Generate the morph GIF."""
-    print("Loading images...")
+
+def load_engine(size, zoom_factor):
+    """A MorphEngine for the Ian images and node mapping."""
     img1 = Image.open(IMG1_PATH).convert('RGB')
     img2 = Image.open(IMG2_PATH).convert('RGB')
-    
-    # Resize to output size (high quality)
-    img1 = img1.resize(OUTPUT_SIZE, Image.Resampling.LANCZOS)
-    img2 = img2.resize(OUTPUT_SIZE, Image.Resampling.LANCZOS)
-    
-    img1_np = np.array(img1)
-    img2_np = np.array(img2)
-    
-    print("Loading node mapping...")
     nodes1, nodes2 = load_nodes(NODES_PATH)
-    
-    print(f"Generating {NUM_FRAMES} frames at {OUTPUT_SIZE[0]}x{OUTPUT_SIZE[1]}...")
-    frames = []
-    
-    for i in range(NUM_FRAMES):
-        t = i / (NUM_FRAMES - 1)
-        print(f"  Frame {i+1}/{NUM_FRAMES} (t={t:.2f})")
-        
-        # Warp both images to interpolated positions
-        warped1 = warp_image_bilinear(img1_np, interpolate_nodes(nodes1, nodes2, t), OUTPUT_SIZE)
-        warped2 = warp_image_bilinear(img2_np, interpolate_nodes(nodes2, nodes1, 1-t), OUTPUT_SIZE)
-        
-        # Cross-fade between warped images
-        alpha = t
-        blended = (warped1.astype(np.float64) * (1 - alpha) + warped2.astype(np.float64) * alpha).astype(np.uint8)
-        
-        # Zoom into center to remove sidebars
-        zoomed = crop_center_zoom(blended, ZOOM_FACTOR)
-        
-        frames.append(zoomed)
-    
-    # Save as GIF - play ONCE (loop=1 means play once then stop... but for GIF we need a different approach)
-    # GIF loop: 0 = infinite, 1+ = play that many times. But most browsers ignore this.
-    # We'll set loop=1 but note that browser support varies
-    print(f"Saving GIF to {OUTPUT_PATH}...")
-    imageio.mimsave(
-        OUTPUT_PATH, 
-        frames, 
-        duration=FRAME_DURATION,
-        loop=1  # Play once (though browser support varies)
-    )
-    
-    # Also save as WebP - better quality and supports loop control
-    webp_path = OUTPUT_PATH.replace('.gif', '.webp')
-    print(f"Saving WebP to {webp_path}...")
-    imageio.mimsave(
-        webp_path,
-        frames,
-        duration=FRAME_DURATION,
-        loop=1  # Play once
-    )
-    
+    return MorphEngine(img1, img2, nodes1, nodes2, size=size, zoom_factor=zoom_factor)
+
+
+def _init_worker(size, zoom_factor, palette):
+    """Load the images and build the engine once per worker process."""
+    global _engine, _palette
+    _engine = load_engine(size, zoom_factor)
+    _palette = palette
+
+
+def _render_frame(t):
+    """Render the frame at time t, and quantize it to the GIF palette if there is one."""
+    frame = _engine.frame(t)
+    return frame, quantize(frame, _palette) if _palette else None
+
+
+def rendered_frames(num_frames, size, zoom_factor, workers, palette=None):
+    """
+    Yield (frame, palette indices or None) in order.
+
+    With several workers, at most FRAMES_IN_FLIGHT frames per worker are
+    queued or finished but not yet consumed.
+    """
+    ts = [i / (num_frames - 1) for i in range(num_frames)]
+    if workers <= 1:
+        _init_worker(size, zoom_factor, palette)
+        for t in ts:
+            yield _render_frame(t)
+        return
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(size, zoom_factor, palette)) as pool:
+        pending = deque()
+        remaining = iter(ts)
+        for t in remaining:
+            pending.append(pool.submit(_render_frame, t))
+            if len(pending) >= workers * FRAMES_IN_FLIGHT:
+                break
+        while pending:
+            rendered = pending.popleft().result()
+            for t in remaining:
+                pending.append(pool.submit(_render_frame, t))
+                break
+            yield rendered
+
+
+def generate_morph(num_frames=NUM_FRAMES, size=OUTPUT_SIZE, zoom_factor=ZOOM_FACTOR, workers=1,
+                   preset=DEFAULT_PRESET, gif_path=OUTPUT_PATH, webp_path=WEBP_PATH):
+    """Render the morph and stream it into the GIF and WebP files."""
+    settings = PRESETS[preset]
+    print(f"Building the {settings['gif_colors']} color palette...")
+    palette = palette_for(load_engine(size, zoom_factor), settings['gif_colors'])
+
+    print(f"Generating {num_frames} frames at {size[0]}x{size[1]} with {workers} worker(s), "
+          f"preset {preset}...")
+    encoder = AnimationEncoder(size, int(FRAME_DURATION * 1000), palette, preset,
+                               gif_path=gif_path, webp_path=webp_path)
+    try:
+        for i, (frame, indices) in enumerate(
+                rendered_frames(num_frames, size, zoom_factor, workers, palette)):
+            print(f"  Frame {i+1}/{num_frames} (t={i / (num_frames - 1):.2f})")
+            encoder.add(frame, indices)
+    finally:
+        encoder.close()
+
     print("Done!")
-    print(f"GIF size: {os.path.getsize(OUTPUT_PATH) / 1024:.1f} KB")
-    if os.path.exists(webp_path):
-        print(f"WebP size: {os.path.getsize(webp_path) / 1024:.1f} KB")
+    print(f"Kept {encoder.frames_out} of {encoder.frames_in} frames")
+    for name, path in [('GIF', gif_path), ('WebP', webp_path)]:
+        if path:
+            print(f"{name} size: {os.path.getsize(path) / 1024:.1f} KB")
+
+
+def report(num_frames, size, zoom_factor, workers, directory):
+    """Encode the morph with every preset and print size against SSIM."""
+    duration_ms = int(FRAME_DURATION * 1000)
+    engine = load_engine(size, zoom_factor)
+    formats = ['gif', 'webp']
+    encoders = {}
+    for preset, settings in PRESETS.items():
+        paths = {f'{fmt}_path': os.path.join(directory, f'{preset}.{fmt}') for fmt in formats}
+        encoders[preset] = (AnimationEncoder(size, duration_ms, palette_for(engine, settings['gif_colors']),
+                                             preset, **paths), paths)
+
+    print(f"Rendering {num_frames} frames at {size[0]}x{size[1]} into {directory}...")
+    references = []
+    try:
+        for frame, _ in rendered_frames(num_frames, size, zoom_factor, workers):
+            references.append(luminance(frame))
+            for encoder, _ in encoders.values():
+                encoder.add(frame)
+    finally:
+        for encoder, _ in encoders.values():
+            encoder.close()
+
+    rows = []
+    for preset, (_, paths) in encoders.items():
+        for path in paths.values():
+            rows.append((os.path.splitext(path)[1][1:], preset, quality_report(path, references, duration_ms)))
+    print(f"\n{'format':<7} {'preset':<10} {'KB':>9} {'frames':>7} {'mean SSIM':>10} {'min SSIM':>9}")
+    for fmt, preset, result in sorted(rows, key=lambda row: (row[0], row[2]['bytes'])):
+        print(f"{fmt:<7} {preset:<10} {result['bytes'] / 1024:>9.1f} {result['frames']:>7} "
+              f"{result['mean_ssim']:>10.4f} {result['min_ssim']:>9.4f}")
+
+
+def generate_morph_gif():
+    """Generate the morph GIF and WebP with the default settings."""
+    generate_morph(workers=os.cpu_count() or 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate the morph GIF and WebP.')
+    parser.add_argument('--frames', type=int, default=NUM_FRAMES)
+    parser.add_argument('--size', type=int, nargs='+', default=list(OUTPUT_SIZE), metavar='PX',
+                        help='Output size: one value for a square, or width and height.')
+    parser.add_argument('--zoom', type=float, default=ZOOM_FACTOR, help='Center zoom, 1.0 = none.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Render processes; 1 renders in this process.')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default=DEFAULT_PRESET,
+                        help='Encoder quality preset (see morph_encoder.py).')
+    parser.add_argument('--gif', default=OUTPUT_PATH, help='GIF output path.')
+    parser.add_argument('--webp', default=WEBP_PATH, help='WebP output path.')
+    parser.add_argument('--report', metavar='DIR',
+                        help='Instead, encode with every preset into DIR and print size against SSIM.')
+    args = parser.parse_args()
+    if args.frames < 2:
+        parser.error('--frames must be at least 2')
+    if len(args.size) > 2:
+        parser.error('--size takes one or two values')
+    size = (args.size[0], args.size[-1])
+    if args.report:
+        os.makedirs(args.report, exist_ok=True)
+        report(args.frames, size, args.zoom, args.workers, args.report)
+    else:
+        generate_morph(args.frames, size, args.zoom, args.workers, args.preset, args.gif, args.webp)
 
 
 if __name__ == '__main__':
-    generate_morph_gif()
+    main()
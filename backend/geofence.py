@@ -0,0 +1,309 @@
+"""
+Geofences for check-in venues.
+
+Venues are circles (center and radius) or polygons, loaded from the VENUES
+setting: a JSON list, or the path of a JSON file holding one.
+
+    [
+        {"id": "science-park", "name": "Science Park",
+         "circle": {"lat": 52.3547, "lng": 4.9543, "radius": 10000}},
+        {"id": "lab42", "name": "LAB42",
+         "polygon": [[52.3551, 4.9508], [52.3551, 4.9530], [52.3540, 4.9530], [52.3540, 4.9508]]}
+    ]
+
+VenueIndex buckets venues into a lat/lng grid by bounding box, so a lookup
+only tests the few venues whose box overlaps the caller's grid cell. When
+venues overlap, the one listed first wins.
+
+VenueIndex.match_many() checks arrays of coordinates at once with NumPy, for
+validating historical check-ins in bulk (`flask check-venues`). It uses the
+same grid, testing the points of each cell against that cell's venues only. NumPy is
+only imported there, the request path doesn't need it.
+"""
+
+import json
+import math
+from collections import defaultdict
+
+EARTH_RADIUS = 6371000  # meters
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+DEFAULT_VENUES = [{
+    'id': 'science-park',
+    'name': 'Science Park',
+    'circle': {'lat': 52.3547, 'lng': 4.9543, 'radius': 10000},
+}]
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Calculate distance between two coordinates in meters using Haversine formula."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_phi / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return EARTH_RADIUS * c
+
+
+def haversine_distance_many(lats, lngs, lat, lng):
+    """Distances in meters from arrays of coordinates to one point."""
+    import numpy as np
+    phi1 = np.radians(lats)
+    phi2 = math.radians(lat)
+    a = np.sin((phi2 - phi1) / 2) ** 2 + \
+        np.cos(phi1) * math.cos(phi2) * np.sin(np.radians(lng - lngs) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class Venue:
+    """A named geofence."""
+
+    # Radius to report to clients that are too far away, if the shape has one
+    radius = None
+
+    def __init__(self, venue_id, name):
+        self.id = venue_id
+        self.name = name
+
+    def contains(self, lat, lng):
+        raise NotImplementedError
+
+    def distance(self, lat, lng):
+        """Meters between a point and the venue, as shown to the user."""
+        raise NotImplementedError
+
+    def distance_to_fence(self, lat, lng):
+        """Meters from a point to the edge of the fence, 0 inside."""
+        return self.distance(lat, lng)
+
+    def bounds(self):
+        """(min_lat, min_lng, max_lat, max_lng) of the fence."""
+        raise NotImplementedError
+
+    @property
+    def center(self):
+        """(lat, lng) of a representative point of the venue."""
+        raise NotImplementedError
+
+    def contains_many(self, lats, lngs):
+        """Boolean NumPy array: which of the coordinates lie inside."""
+        raise NotImplementedError
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name}
+
+
+class CircleVenue(Venue):
+    """Everything within `radius` meters of a center point."""
+
+    def __init__(self, venue_id, name, lat, lng, radius):
+        super().__init__(venue_id, name)
+        self.lat = lat
+        self.lng = lng
+        self.radius = radius
+
+    def contains(self, lat, lng):
+        return haversine_distance(lat, lng, self.lat, self.lng) <= self.radius
+
+    def distance(self, lat, lng):
+        # Distance to the center, which is what `radius` is compared against
+        return haversine_distance(lat, lng, self.lat, self.lng)
+
+    def distance_to_fence(self, lat, lng):
+        return max(0.0, self.distance(lat, lng) - self.radius)
+
+    def bounds(self):
+        # Slightly generous: the box only has to contain the circle
+        dlat = self.radius / METERS_PER_DEGREE * 1.01
+        dlng = dlat / max(math.cos(math.radians(min(abs(self.lat) + dlat, 90))), 1e-6)
+        return self.lat - dlat, self.lng - dlng, self.lat + dlat, self.lng + dlng
+
+    @property
+    def center(self):
+        return self.lat, self.lng
+
+    def contains_many(self, lats, lngs):
+        return haversine_distance_many(lats, lngs, self.lat, self.lng) <= self.radius
+
+
+class PolygonVenue(Venue):
+    """
+    A polygon of (lat, lng) vertices.
+
+    Venues span at most a few kilometers, so the vertices are projected onto
+    a flat plane in meters around the polygon's center, where a ray casting
+    test decides containment.
+    """
+
+    def __init__(self, venue_id, name, points):
+        super().__init__(venue_id, name)
+        if len(points) < 3:
+            raise ValueError(f'Venue {venue_id}: a polygon needs at least 3 points')
+        self.points = [(float(lat), float(lng)) for lat, lng in points]
+        self.ref_lat = sum(lat for lat, _ in self.points) / len(self.points)
+        self.ref_lng = sum(lng for _, lng in self.points) / len(self.points)
+        self.lng_scale = METERS_PER_DEGREE * math.cos(math.radians(self.ref_lat))
+        self.vertices = [self._project(lat, lng) for lat, lng in self.points]
+
+    def _project(self, lat, lng):
+        return (lng - self.ref_lng) * self.lng_scale, (lat - self.ref_lat) * METERS_PER_DEGREE
+
+    def _edges(self):
+        return zip(self.vertices, self.vertices[1:] + self.vertices[:1])
+
+    def contains(self, lat, lng):
+        x, y = self._project(lat, lng)
+        inside = False
+        for (x1, y1), (x2, y2) in self._edges():
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return inside
+
+    def distance(self, lat, lng):
+        """0 inside, otherwise the distance to the nearest edge."""
+        if self.contains(lat, lng):
+            return 0.0
+        x, y = self._project(lat, lng)
+        best = math.inf
+        for (x1, y1), (x2, y2) in self._edges():
+            dx, dy = x2 - x1, y2 - y1
+            length = dx * dx + dy * dy
+            t = 0 if length == 0 else max(0, min(1, ((x - x1) * dx + (y - y1) * dy) / length))
+            best = min(best, math.hypot(x - x1 - t * dx, y - y1 - t * dy))
+        return best
+
+    def bounds(self):
+        lats = [lat for lat, _ in self.points]
+        lngs = [lng for _, lng in self.points]
+        return min(lats), min(lngs), max(lats), max(lngs)
+
+    @property
+    def center(self):
+        # Mean of the vertices, inside unless the polygon is very concave
+        return self.ref_lat, self.ref_lng
+
+    def contains_many(self, lats, lngs):
+        import numpy as np
+        x = (np.asarray(lngs) - self.ref_lng) * self.lng_scale
+        y = (np.asarray(lats) - self.ref_lat) * METERS_PER_DEGREE
+        inside = np.zeros(x.shape, dtype=bool)
+        # One vectorized ray casting step per edge
+        for (x1, y1), (x2, y2) in self._edges():
+            if y1 == y2:
+                continue
+            crosses = ((y1 > y) != (y2 > y)) & (x < x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+            inside ^= crosses
+        return inside
+
+
+def venue_from_dict(data):
+    """Build a venue from its config entry."""
+    try:
+        if 'circle' in data:
+            circle = data['circle']
+            return CircleVenue(data['id'], data.get('name', data['id']),
+                               float(circle['lat']), float(circle['lng']), float(circle['radius']))
+        if 'polygon' in data:
+            return PolygonVenue(data['id'], data.get('name', data['id']), data['polygon'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f'Invalid venue {data.get("id", data)}: {e}')
+    raise ValueError(f'Venue {data.get("id", data)} needs a "circle" or a "polygon"')
+
+
+def load_venues(setting):
+    """Venues from a JSON list, or from the JSON file at that path."""
+    if setting is None:
+        return [venue_from_dict(v) for v in DEFAULT_VENUES]
+    if not setting.lstrip().startswith('['):
+        with open(setting) as f:
+            setting = f.read()
+    venues = [venue_from_dict(v) for v in json.loads(setting)]
+    if not venues:
+        raise ValueError('At least one venue is required')
+    ids = [venue.id for venue in venues]
+    if len(set(ids)) != len(ids):
+        raise ValueError('Venue ids must be unique')
+    return venues
+
+
+class VenueIndex:
+    """Grid index over venue bounding boxes."""
+
+    def __init__(self, venues, cell_size=0.05):
+        self.venues = list(venues)
+        self.by_id = {venue.id: venue for venue in self.venues}
+        self.cell_size = cell_size
+        self.grid = defaultdict(list)
+        for venue in self.venues:
+            min_lat, min_lng, max_lat, max_lng = venue.bounds()
+            for i in range(self._cell(min_lat), self._cell(max_lat) + 1):
+                for j in range(self._cell(min_lng), self._cell(max_lng) + 1):
+                    self.grid[(i, j)].append(venue)
+
+    def _cell(self, degrees):
+        return math.floor(degrees / self.cell_size)
+
+    def candidates(self, lat, lng):
+        """Venues whose bounding box may contain the point, in config order."""
+        return self.grid.get((self._cell(lat), self._cell(lng)), ())
+
+    def match(self, lat, lng):
+        """(venue, distance) for the venue containing the point, or None."""
+        for venue in self.candidates(lat, lng):
+            if venue.contains(lat, lng):
+                return venue, venue.distance(lat, lng)
+        return None
+
+    def nearest(self, lat, lng):
+        """(venue, distance) of the venue with the closest fence. Checks every
+        venue, so only meant for explaining a failed match."""
+        venue = min(self.venues, key=lambda v: v.distance_to_fence(lat, lng))
+        return venue, venue.distance(lat, lng)
+
+    def match_many(self, lats, lngs):
+        """
+        Vectorized match for arrays of coordinates.
+
+        Returns an integer array with, for each point, the position of the
+        matched venue in self.venues, or -1. Points are sorted by grid cell,
+        and the points of each cell are only tested against that cell's
+        candidates, in config order, like match() does.
+        """
+        import numpy as np
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        result = np.full(lats.shape, -1, dtype=np.int64)
+        points = np.flatnonzero(np.isfinite(lats) & np.isfinite(lngs))
+        if not len(points):
+            return result
+        rows = np.floor(lats[points] / self.cell_size).astype(np.int64)
+        cols = np.floor(lngs[points] / self.cell_size).astype(np.int64)
+        # One sortable key per cell
+        min_col, span = cols.min(), cols.max() - cols.min() + 1
+        keys = rows * span + (cols - min_col)
+        order = np.argsort(keys, kind='stable')
+        points, keys = points[order], keys[order]
+
+        cells = [cell for cell in self.grid if min_col <= cell[1] < min_col + span]
+        cell_keys = np.array([i * span + (j - min_col) for i, j in cells], dtype=np.int64)
+        starts = np.searchsorted(keys, cell_keys, side='left')
+        ends = np.searchsorted(keys, cell_keys, side='right')
+        positions = {venue: position for position, venue in enumerate(self.venues)}
+        for cell, start, end in zip(cells, starts, ends):
+            pending = points[start:end]
+            for venue in self.grid[cell]:
+                if not len(pending):
+                    break
+                inside = venue.contains_many(lats[pending], lngs[pending])
+                result[pending[inside]] = positions[venue]
+                pending = pending[~inside]
+        return result
+
+
+def create_venue_index(app):
+    """Load the venues configured for the app and index them."""
+    return VenueIndex(load_venues(app.config['VENUES']), cell_size=app.config['VENUE_GRID_SIZE'])
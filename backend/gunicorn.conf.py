@@ -0,0 +1,29 @@
+"""
+Gunicorn settings. Gunicorn reads this file from the working directory, so
+`gunicorn 'app:create_app()'` in the backend folder picks it up. Everything can be
+overridden from the environment:
+
+- GUNICORN_WORKER_CLASS=gthread (default): each of WEB_CONCURRENCY worker
+  processes serves GUNICORN_THREADS requests at a time. A client that
+  uploads slowly or holds an SSE stream keeps one thread for as long as it
+  takes.
+- GUNICORN_WORKER_CLASS=gevent: each worker serves up to
+  GUNICORN_WORKER_CONNECTIONS requests as greenlets, so slow clients and
+  long-lived streams only cost a greenlet. Needs gevent and psycogreen
+  (both in requirements.txt); see concurrency.py for what the app does
+  differently under gevent.
+
+See "Serving" in RENDER_SETUP.md for sizing.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+# A worker silent for this long is restarted. SSE streams send keepalives
+# every 15s, and under gevent the CPU-bound work runs on OS threads, so a
+# busy worker still checks in.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
@@ -0,0 +1,175 @@
+"""
+Conditional GET and server-side response caching for read endpoints.
+
+Every cached endpoint declares a revision scope, e.g. 'leaderboard:<date>'.
+The write paths bump the scopes they change. A read then:
+
+- answers 304 straight away when the client's If-None-Match matches the
+  current revision, without touching the database;
+- otherwise serves the body cached for (endpoint, arguments, scope,
+  revision, content coding) if another client already asked for it;
+- and only rebuilds the response when the scope changed since.
+
+Bodies are cached as sent, compressed (see compression.py) and, for
+streamed responses, collected while they are sent and stored once the last
+chunk went out. ETags are weak: they name a revision of the content, which
+is the same in every coding.
+
+Revisions are counted per process. ETags carry a random per-process id so a
+client that moves between workers always gets a fresh response rather than
+a wrong 304. With several workers, bumps are also broadcast on the pub/sub
+backend so every worker invalidates its copy. Without one, a worker never
+hears about writes handled by another, so ETags also carry the current
+RESPONSE_CACHE_TTL time window: once it ends, the next read revalidates
+against the database, which bounds staleness by the TTL.
+"""
+
+import hashlib
+import secrets
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request, make_response
+
+from cache import TTLCache, MISSING
+
+REVISIONS_CHANNEL = 'revisions'
+ALL_SCOPES = '*'
+# Headers of a cached response that depend on how its body was encoded
+CACHED_HEADERS = ('Content-Encoding', 'Vary')
+
+
+class RevisionTracker:
+    """Per-scope revision counters for this process."""
+
+    def __init__(self):
+        self.process_id = secrets.token_hex(4)
+        self._revisions = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope):
+        # The '*' counter is part of every revision, bumping it invalidates all
+        return self._revisions.get(ALL_SCOPES, 0), self._revisions.get(scope, 0)
+
+    def bump(self, *scopes):
+        with self._lock:
+            for scope in scopes:
+                self._revisions[scope] = self._revisions.get(scope, 0) + 1
+
+
+class ResponseCache:
+    """ETags and cached bodies for endpoints keyed by revision scope."""
+
+    def __init__(self, app=None, pubsub=None):
+        self.revisions = RevisionTracker()
+        self.pubsub = None
+        self.cache = None
+        self.ttl = 0
+        if app is not None:
+            self.init_app(app, pubsub)
+
+    def init_app(self, app, pubsub=None):
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+        self.cache = TTLCache(maxsize=app.config['RESPONSE_CACHE_SIZE'], ttl=self.ttl)
+        if pubsub is not None and app.config['PUBSUB_BACKEND'] != 'inprocess':
+            # Other workers' bumps arrive over pub/sub
+            self.pubsub = pubsub
+            threading.Thread(target=self._listen, name='revision-listener', daemon=True).start()
+        app.extensions['response_cache'] = self
+
+    def _listen(self):
+        subscription = self.pubsub.subscribe(REVISIONS_CHANNEL)
+        while True:
+            try:
+                message = subscription.get(timeout=30)
+                if message:
+                    self.revisions.bump(*message['scopes'])
+            except Exception as e:
+                print(f"Revision listener error: {e}")
+                # Anything may have changed while we weren't listening
+                self.revisions.bump(ALL_SCOPES)
+
+    def bump(self, *scopes):
+        """Mark scopes as changed, here and on every other worker."""
+        self.revisions.bump(*scopes)
+        if self.pubsub is not None:
+            try:
+                self.pubsub.publish(REVISIONS_CHANNEL, {'type': 'bump', 'scopes': list(scopes)})
+            except Exception as e:
+                print(f"Publish error: {e}")
+
+    def invalidate_all(self):
+        self.bump(ALL_SCOPES)
+
+    def etag_for(self, scope, revision):
+        args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        # Writes on other workers may go unnoticed here, so no ETag (and no
+        # cached body, which is keyed by it) outlives its TTL window
+        window = int(time.time() // self.ttl) if self.ttl > 0 else None
+        key = f'{self.revisions.process_id}:{request.endpoint}:{args}:{scope}:{revision}:{window}'
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def cached(self, scope_fn, private=False):
+        """
+        Decorator for GET views whose response only depends on a scope.
+
+        `scope_fn` is called inside the request and returns the scope name.
+        Private responses (per-user data) are only stored by the browser.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                scope = scope_fn()
+                revision = self.revisions.get(scope)
+                etag = self.etag_for(scope, revision)
+
+                if request.if_none_match.contains_weak(etag):
+                    response = make_response('', 304)
+                else:
+                    compression = current_app.extensions.get('compression')
+                    coding = compression.negotiate() if compression else None
+                    key = f'{etag}:{coding}'
+                    body = self.cache.get(key)
+                    if body is MISSING:
+                        response = make_response(f(*args, **kwargs))
+                        if response.status_code != 200:
+                            return response
+                        if compression:
+                            compression.compress(response, coding)
+                        headers = [(name, response.headers[name]) for name in CACHED_HEADERS
+                                   if name in response.headers]
+                        if response.is_streamed:
+                            response.response = self._tee(key, response.response, response.mimetype, headers)
+                        else:
+                            self.cache.set(key, (response.get_data(), response.mimetype, headers))
+                    else:
+                        response = make_response(body[0])
+                        response.mimetype = body[1]
+                        response.headers.extend(body[2])
+
+                response.set_etag(etag, weak=True)
+                # Always revalidate; a matching ETag makes that a cheap 304
+                response.cache_control.no_cache = True
+                if private:
+                    response.cache_control.private = True
+                    response.vary.add('Authorization')
+                    response.vary.add('Cookie')
+                return response
+            return decorated_function
+        return decorator
+
+    def _tee(self, key, chunks, mimetype, headers):
+        """Pass a streamed body through, and cache it once it was sent in full."""
+        body = []
+        try:
+            for chunk in chunks:
+                body.append(chunk)
+                yield chunk
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        self.cache.set(key, (b''.join(body), mimetype, headers))
+
+    def stats(self):
+        return self.cache.stats()
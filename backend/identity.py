@@ -0,0 +1,95 @@
+"""
+Cross-request cache of user identities and today's check-ins.
+
+Every authenticated request needs the user behind its session or token, and
+most also ask whether that user already checked in today. Both answers are
+kept in bounded TTL caches as plain snapshots (never live ORM objects, which
+are bound to one request's session).
+
+Only existing check-ins are cached: a check-in row never changes once
+written, so a cached one cannot go stale, while "not checked in yet" can be
+invalidated by a check-in on another worker.
+"""
+
+from collections import namedtuple
+
+from flask_login import UserMixin
+
+from cache import TTLCache, MISSING
+from models import db, User, CheckIn
+
+CachedCheckIn = namedtuple('CachedCheckIn', ['id', 'user_id', 'check_in_date', 'check_in_time'])
+
+
+class CachedUser(UserMixin):
+    """Detached snapshot of a User row."""
+
+    def __init__(self, id, email, name, picture):
+        self.id = id
+        self.email = email
+        self.name = name
+        self.picture = picture
+
+    @classmethod
+    def from_model(cls, user):
+        return cls(user.id, user.email, user.name, user.picture)
+
+
+class IdentityCache:
+    """User and today's check-in lookups with a TTL cache in front."""
+
+    def __init__(self, app=None):
+        self.users = None
+        self.checkins = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.users = TTLCache(
+            maxsize=app.config['USER_CACHE_SIZE'],
+            ttl=app.config['USER_CACHE_TTL']
+        )
+        self.checkins = TTLCache(
+            maxsize=app.config['USER_CACHE_SIZE'],
+            ttl=app.config['CHECKIN_CACHE_TTL']
+        )
+        app.extensions['identity_cache'] = self
+
+    def get_user(self, user_id):
+        """Snapshot of a user, or None if there is no such user."""
+        cached = self.users.get(user_id)
+        if cached is not MISSING:
+            return cached
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        cached = CachedUser.from_model(user)
+        self.users.set(user_id, cached)
+        return cached
+
+    def invalidate_user(self, user_id):
+        """Drop a user after their name or picture changed."""
+        self.users.invalidate(user_id)
+
+    def get_today_checkin(self, user_id, day):
+        """The user's check-in on `day`, or None."""
+        key = (user_id, day)
+        cached = self.checkins.get(key)
+        if cached is not MISSING:
+            return cached
+        checkin = CheckIn.query.filter_by(user_id=user_id, check_in_date=day).first()
+        if checkin is None:
+            return None
+        return self.remember_checkin(checkin)
+
+    def remember_checkin(self, checkin):
+        """Cache a check-in that was just read or written."""
+        cached = CachedCheckIn(checkin.id, checkin.user_id, checkin.check_in_date, checkin.check_in_time)
+        self.checkins.set((checkin.user_id, checkin.check_in_date), cached)
+        return cached
+
+    def stats(self):
+        return {
+            'users': self.users.stats(),
+            'checkins': self.checkins.stats(),
+        }
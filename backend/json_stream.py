@@ -0,0 +1,82 @@
+"""
+Streaming JSON responses.
+
+jsonify() needs the whole payload as Python objects, and then the whole
+encoded body, before it sends a byte. json_response() instead encodes a
+payload whose long lists are iterators (e.g. rows read with yield_per())
+an item at a time, and sends the body in chunks of STREAM_CHUNK_SIZE. A
+request then holds one batch of rows and one chunk, however long the list.
+
+Small payloads, those that fit in one chunk, still go out as an ordinary
+response with a Content-Length. The output is the same as jsonify's outside
+debug mode (compact, keys sorted).
+"""
+
+from collections.abc import Iterator
+from itertools import chain
+
+from flask import Response, current_app, stream_with_context
+
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def _dumps(value):
+    return current_app.json.dumps(value, separators=(',', ':'))
+
+
+def iter_json(value):
+    """
+    Encode `value` as JSON, in pieces.
+
+    Iterators in it become arrays, encoded an item at a time. Callables are
+    called when their turn comes, so a value can depend on what was encoded
+    before it, such as a pagination cursor found while reading the rows.
+    """
+    if callable(value):
+        value = value()
+    if isinstance(value, dict):
+        items = sorted(value.items()) if current_app.json.sort_keys else value.items()
+        yield '{'
+        for i, (key, item) in enumerate(items):
+            yield f'{"," if i else ""}{_dumps(key)}:'
+            yield from iter_json(item)
+        yield '}'
+    elif isinstance(value, Iterator):
+        yield '['
+        for i, item in enumerate(value):
+            if i:
+                yield ','
+            yield _dumps(item)
+        yield ']'
+    else:
+        yield _dumps(value)
+
+
+def _chunks(pieces, size):
+    buffer, length = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(buffer).encode()
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def json_response(value):
+    """A JSON response for `value`, streamed if it is larger than one chunk. See iter_json()."""
+    # jsonify ends the body with a newline too
+    chunks = _chunks(chain(iter_json(value), ['\n']), STREAM_CHUNK_SIZE)
+    first = next(chunks, b'')
+    second = next(chunks, None)
+    if second is None:
+        return Response(first, mimetype='application/json')
+
+    def body():
+        yield first
+        yield second
+        yield from chunks
+
+    # The rest is read from the database while the body is sent
+    return Response(stream_with_context(body()), mimetype='application/json')
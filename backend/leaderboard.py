@@ -0,0 +1,280 @@
+"""
+Leaderboard queries.
+
+Like/dislike tallies are materialized on each check-in (`like_count`,
+`dislike_count`) and updated incrementally by the reaction write path, so the
+daily leaderboard is a single range read over the day's check-ins joined to
+their users, with no aggregation over `reactions`.
+
+History is served from one windowed query as well: ROW_NUMBER() ranks each
+day's check-ins, so any number of days costs a single round trip.
+
+Both are generators reading their rows in batches of STREAM_BATCH_SIZE
+(a server-side cursor on Postgres), for json_stream.json_response().
+
+The tallies can always be recomputed from the raw reactions; the consistency
+checker compares both and can repair drift (`flask check-leaderboard`).
+"""
+
+from sqlalchemy import func, case
+
+from models import db, User, CheckIn, Reaction, insert_unless_exists
+from photos import photo_url
+from standings import record_reaction_change
+
+TALLY_COLUMNS = {
+    'like': 'like_count',
+    'dislike': 'dislike_count',
+}
+
+# Attempts at changing a reaction that concurrent requests keep changing
+REACTION_WRITE_ATTEMPTS = 3
+# Rows fetched from the database at a time by the streamed reads
+STREAM_BATCH_SIZE = 200
+
+
+class ReactionConflict(Exception):
+    """The user's reaction kept changing underneath a write."""
+
+
+def reaction_counts_subquery(day):
+    """Like/dislike tallies per check-in for the given day, from raw reactions."""
+    return db.session.query(
+        Reaction.checkin_id.label('checkin_id'),
+        func.count(case((Reaction.reaction_type == 'like', 1))).label('likes'),
+        func.count(case((Reaction.reaction_type == 'dislike', 1))).label('dislikes')
+    ).join(CheckIn, CheckIn.id == Reaction.checkin_id)\
+        .filter(CheckIn.check_in_date == day)\
+        .group_by(Reaction.checkin_id)\
+        .subquery()
+
+
+def leaderboard_query(day):
+    """Check-ins of the day joined to their user, in rank order."""
+    return db.session.query(
+        CheckIn.id,
+        CheckIn.check_in_time,
+        CheckIn.photo_id,
+        User.name,
+        User.picture,
+        CheckIn.like_count.label('likes'),
+        CheckIn.dislike_count.label('dislikes')
+    ).join(User, User.id == CheckIn.user_id)\
+        .filter(CheckIn.check_in_date == day)\
+        .order_by(CheckIn.check_in_time.asc(), CheckIn.id.asc())
+
+
+def iter_leaderboard(day):
+    """Yield the leaderboard entries for a day, in rank order."""
+    return ({
+        'rank': i + 1,
+        'checkin_id': row.id,
+        'name': row.name,
+        'picture': row.picture,
+        'check_in_time': row.check_in_time.isoformat(),
+        'photo_id': row.photo_id,
+        'photo_url': photo_url(row.photo_id),
+        'photo_full_url': photo_url(row.photo_id, size=None),
+        'likes': row.likes,
+        'dislikes': row.dislikes
+    } for i, row in enumerate(leaderboard_query(day).yield_per(STREAM_BATCH_SIZE)))
+
+
+def checkin_event(checkin, user, rank):
+    """Leaderboard delta for a new check-in: its full leaderboard entry."""
+    return {
+        'type': 'checkin',
+        'date': checkin.check_in_date.isoformat(),
+        'entry': {
+            'rank': rank,
+            'checkin_id': checkin.id,
+            'name': user.name,
+            'picture': user.picture,
+            'check_in_time': checkin.check_in_time.isoformat(),
+            'photo_id': checkin.photo_id,
+            'photo_url': photo_url(checkin.photo_id),
+            'photo_full_url': photo_url(checkin.photo_id, size=None),
+            'likes': 0,
+            'dislikes': 0
+        }
+    }
+
+
+def reaction_event(day, checkin_ids):
+    """Leaderboard delta for changed reactions: current tallies of the affected check-ins."""
+    rows = db.session.query(CheckIn.id, CheckIn.like_count, CheckIn.dislike_count)\
+        .filter(CheckIn.id.in_(set(checkin_ids)))\
+        .all()
+    return {
+        'type': 'reaction',
+        'date': day.isoformat(),
+        'counts': [{'checkin_id': i, 'likes': likes, 'dislikes': dislikes}
+                   for i, likes, dislikes in rows]
+    }
+
+
+def history_query(days, before=None, user_id=None):
+    """
+    Ranked check-ins of the most recent `days + 1` days before `before`.
+
+    One extra day is fetched so the caller can tell whether another page
+    exists. Ranks are computed over everyone who checked in that day, and
+    only then narrowed down to `user_id` if given.
+    """
+    dates = db.session.query(CheckIn.check_in_date)
+    if before is not None:
+        dates = dates.filter(CheckIn.check_in_date < before)
+    if user_id is not None:
+        dates = dates.filter(CheckIn.user_id == user_id)
+    dates = dates.distinct()\
+        .order_by(CheckIn.check_in_date.desc())\
+        .limit(days + 1)\
+        .subquery()
+
+    rank = func.row_number().over(
+        partition_by=CheckIn.check_in_date,
+        order_by=(CheckIn.check_in_time.asc(), CheckIn.id.asc())
+    )
+    ranked = db.session.query(
+        CheckIn.check_in_date.label('check_in_date'),
+        CheckIn.check_in_time.label('check_in_time'),
+        CheckIn.user_id.label('user_id'),
+        rank.label('rank')
+    ).filter(CheckIn.check_in_date.in_(db.session.query(dates.c.check_in_date)))\
+        .subquery()
+
+    query = db.session.query(
+        ranked.c.check_in_date,
+        ranked.c.rank,
+        ranked.c.check_in_time,
+        User.name,
+        User.picture
+    ).join(User, User.id == ranked.c.user_id)
+    if user_id is not None:
+        query = query.filter(ranked.c.user_id == user_id)
+    return query.order_by(ranked.c.check_in_date.desc(), ranked.c.rank.asc())
+
+
+def iter_history(page, days=30, before=None, user_id=None):
+    """
+    Yield one page of history a day at a time, newest day first.
+
+    Once the days are read, page['next_cursor'] holds the `before` of the
+    next page, or None on the last page.
+    """
+    page['next_cursor'] = None
+    day = None
+    yielded = 0
+    for row in history_query(days, before, user_id).yield_per(STREAM_BATCH_SIZE):
+        if day is None or day['date'] != row.check_in_date.isoformat():
+            if day is not None:
+                yield day
+                yielded += 1
+                if yielded == days:
+                    # The extra day only tells us there is another page
+                    page['next_cursor'] = day['date']
+                    return
+            day = {'date': row.check_in_date.isoformat(), 'entries': []}
+        day['entries'].append({
+            'rank': row.rank,
+            'name': row.name,
+            'picture': row.picture,
+            'check_in_time': row.check_in_time.isoformat()
+        })
+    if day is not None:
+        yield day
+
+
+def apply_reaction_change(old, new):
+    """
+    Move tallies for a reaction that changed from `old` to `new`.
+
+    Both are (checkin_id, reaction_type) tuples or None. The updates are
+    relative (count = count + 1) so concurrent writers don't overwrite each
+    other; the caller commits them together with the reaction itself. The
+    net likes in the standings move along (see standings.py).
+    """
+    if old == new:
+        return
+    if old is not None:
+        column = TALLY_COLUMNS[old[1]]
+        CheckIn.query.filter_by(id=old[0])\
+            .update({column: getattr(CheckIn, column) - 1}, synchronize_session=False)
+    if new is not None:
+        column = TALLY_COLUMNS[new[1]]
+        CheckIn.query.filter_by(id=new[0])\
+            .update({column: getattr(CheckIn, column) + 1}, synchronize_session=False)
+    record_reaction_change(old, new)
+
+
+def set_reaction(user_id, day, checkin_id, reaction_type):
+    """
+    Make (checkin_id, reaction_type) the user's reaction of the day and move
+    the tallies accordingly.
+
+    The first reaction of the day is a single INSERT ... ON CONFLICT DO
+    NOTHING. A change is a compare-and-swap: the UPDATE only matches if the
+    reaction is still the one we read, so two concurrent changes can never
+    both move the tallies away from the same old reaction. Returns the
+    previous reaction as (checkin_id, reaction_type), or None. The caller
+    commits.
+    """
+    new = (checkin_id, reaction_type)
+    for _ in range(REACTION_WRITE_ATTEMPTS):
+        created = insert_unless_exists(
+            Reaction, ['user_id', 'reaction_date'],
+            user_id=user_id, reaction_date=day, checkin_id=checkin_id, reaction_type=reaction_type
+        )
+        if created is not None:
+            apply_reaction_change(None, new)
+            return None
+
+        old = db.session.query(Reaction.checkin_id, Reaction.reaction_type)\
+            .filter_by(user_id=user_id, reaction_date=day)\
+            .first()
+        if old is None:
+            # Deleted in the meantime, insert again
+            continue
+        old = tuple(old)
+        if old == new:
+            return old
+        updated = Reaction.query.filter_by(
+            user_id=user_id, reaction_date=day, checkin_id=old[0], reaction_type=old[1]
+        ).update({'checkin_id': checkin_id, 'reaction_type': reaction_type}, synchronize_session=False)
+        if updated:
+            apply_reaction_change(old, new)
+            return old
+    raise ReactionConflict('Reaction changed concurrently, please try again')
+
+
+def check_consistency(day, fix=False):
+    """
+    Compare the materialized tallies of a day against a full recompute.
+
+    Returns a list of (checkin_id, stored, recomputed) for every mismatch,
+    where the tallies are (likes, dislikes). With fix=True the stored
+    tallies are overwritten with the recomputed ones.
+    """
+    counts = reaction_counts_subquery(day)
+    rows = db.session.query(
+        CheckIn.id,
+        CheckIn.like_count,
+        CheckIn.dislike_count,
+        func.coalesce(counts.c.likes, 0),
+        func.coalesce(counts.c.dislikes, 0)
+    ).outerjoin(counts, counts.c.checkin_id == CheckIn.id)\
+        .filter(CheckIn.check_in_date == day)\
+        .all()
+
+    mismatches = []
+    for checkin_id, likes, dislikes, true_likes, true_dislikes in rows:
+        if (likes, dislikes) != (true_likes, true_dislikes):
+            mismatches.append((checkin_id, (likes, dislikes), (true_likes, true_dislikes)))
+            if fix:
+                CheckIn.query.filter_by(id=checkin_id).update(
+                    {'like_count': true_likes, 'dislike_count': true_dislikes},
+                    synchronize_session=False
+                )
+    if fix:
+        db.session.commit()
+    return mismatches
@@ -0,0 +1,232 @@
+"""
+Per-route request instrumentation.
+
+For every request this records the number of SQL statements, time spent in
+the database, time spent serializing JSON, total latency and response size,
+aggregated per route. The numbers are served at /metrics in the Prometheus
+text format and, when SERVER_TIMING is on, returned to the caller in a
+Server-Timing header. Requests issuing more than QUERY_WARNING_THRESHOLD
+statements are logged, which makes N+1 patterns visible right away.
+
+Metrics are per process; with several gunicorn workers each one reports its
+own numbers.
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, request, has_app_context, Response
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that adds the time spent in dumps() to the request."""
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            if has_app_context() and '_metrics' in g:
+                g._metrics['serialize_time'] += time.perf_counter() - start
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+class Metrics:
+    """Collects per-route request metrics and renders them for Prometheus."""
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.db_time = defaultdict(float)
+        self.serialize_time = defaultdict(float)
+        self.response_bytes = defaultdict(int)
+        self.slow_requests = defaultdict(int)
+        self.collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.threshold = app.config['QUERY_WARNING_THRESHOLD']
+        self.server_timing = app.config['SERVER_TIMING']
+        self.logger = app.logger
+        app.json = TimedJSONProvider(app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        # A failing statement never reaches after_cursor_execute
+        event.listen(Engine, 'handle_error', self._on_execute_error)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        app.extensions['metrics'] = self
+
+    def register(self, name, kind, help_text, collect):
+        """
+        Add a metric owned by another component, read on every scrape.
+
+        `kind` is 'gauge', 'counter' or 'histogram'. `collect` returns a dict
+        mapping labels (as tuples of pairs) to values, e.g.
+        {(('cache', 'users'),): 12}, or to Histograms.
+        """
+        self.collectors.append((name, kind, help_text, collect))
+
+    # Request lifecycle
+
+    def _before_request(self):
+        g._metrics = {
+            'start': time.perf_counter(),
+            'queries': 0,
+            'db_time': 0.0,
+            'serialize_time': 0.0,
+        }
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_app_context() and '_metrics' in g:
+            conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._end_execute(conn)
+
+    def _on_execute_error(self, exception_context):
+        if exception_context.connection is not None:
+            self._end_execute(exception_context.connection)
+
+    def _end_execute(self, conn):
+        starts = conn.info.get('_query_start')
+        if not starts:
+            return
+        # Popped even outside a request, so the start times can't pile up
+        start = starts.pop()
+        if has_app_context() and '_metrics' in g:
+            g._metrics['queries'] += 1
+            g._metrics['db_time'] += time.perf_counter() - start
+
+    def _after_request(self, response):
+        stats = g.pop('_metrics', None)
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats['start']
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        if response.is_streamed:
+            # No length up front (SSE, large JSON); counted as it is sent
+            response.response = self._count_bytes(route, response.response)
+            size = 0
+        else:
+            size = response.calculate_content_length() or 0
+
+        with self.lock:
+            self.requests[(route, request.method, response.status_code)] += 1
+            self.latency[route].observe(total)
+            self.queries[route].observe(stats['queries'])
+            self.db_time[route] += stats['db_time']
+            self.serialize_time[route] += stats['serialize_time']
+            self.response_bytes[route] += size
+            if stats['queries'] > self.threshold:
+                self.slow_requests[route] += 1
+
+        if stats['queries'] > self.threshold:
+            self.logger.warning(
+                '%s %s issued %d SQL queries (threshold %d)',
+                request.method, request.path, stats['queries'], self.threshold
+            )
+        if self.server_timing:
+            response.headers.add('Server-Timing', ', '.join([
+                f'db;dur={stats["db_time"] * 1000:.1f};desc="{stats["queries"]} queries"',
+                f'serialize;dur={stats["serialize_time"] * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ]))
+        return response
+
+    def _count_bytes(self, route, chunks):
+        try:
+            for chunk in chunks:
+                with self.lock:
+                    self.response_bytes[route] += len(chunk)
+                yield chunk
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    # Exposition
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram_lines(name, labels, h):
+            for bound, count in zip(h.buckets, h.counts):
+                lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {count}')
+            lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {h.count}')
+            lines.append(f'{name}_sum{_labels(**labels)} {h.sum}')
+            lines.append(f'{name}_count{_labels(**labels)} {h.count}')
+
+        def histogram(name, help_text, histograms):
+            header(name, 'histogram', help_text)
+            for route, h in sorted(histograms.items()):
+                histogram_lines(name, {'route': route}, h)
+
+        def counter(name, help_text, values):
+            header(name, 'counter', help_text)
+            for route, value in sorted(values.items()):
+                lines.append(f'{name}{_labels(route=route)} {value}')
+
+        with self.lock:
+            header('http_requests_total', 'counter', 'Requests handled, by route, method and status.')
+            for (route, method, status), value in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{_labels(route=route, method=method, status=status)} {value}')
+            histogram('http_request_duration_seconds', 'Request latency.', self.latency)
+            histogram('db_queries_per_request', 'SQL statements issued per request.', self.queries)
+            counter('db_query_seconds_total', 'Time spent executing SQL.', self.db_time)
+            counter('json_serialize_seconds_total', 'Time spent serializing JSON responses.', self.serialize_time)
+            counter('http_response_bytes_total', 'Response body bytes, as sent (compressed).',
+                    self.response_bytes)
+            counter('db_query_threshold_exceeded_total',
+                    'Requests issuing more SQL statements than QUERY_WARNING_THRESHOLD.', self.slow_requests)
+
+        for name, kind, help_text, collect in self.collectors:
+            header(name, kind, help_text)
+            for labels, value in sorted(collect().items(), key=lambda item: item[0]):
+                if kind == 'histogram':
+                    histogram_lines(name, dict(labels), value)
+                else:
+                    lines.append(f'{name}{_labels(**dict(labels))} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
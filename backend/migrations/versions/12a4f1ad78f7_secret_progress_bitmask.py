@@ -0,0 +1,44 @@
+"""secret progress bitmask
+
+Adds users.secrets_mask and fills it from user_secrets. The bit of each code
+is frozen here as it was when the column was added; later secrets get their
+bits from secret_codes.py.
+
+Revision ID: 12a4f1ad78f7
+Revises: 41d88d20d52d
+Create Date: 2026-10-16 21:12:40.511208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '12a4f1ad78f7'
+down_revision = '41d88d20d52d'
+branch_labels = None
+depends_on = None
+
+SECRETS = [
+    'b_drag', 'job_spawn', 'job_click', 'chess', 'chess_victory', 'ian', 'smiling_friends',
+    'ranking', 'brainrot', 'fnaf', 'six_seven', 'monkey_cursor', 'counter', 'theme_kabouter',
+    'bar_explosion', 'hollow_knight', 'tweak_game', 'simo_peek', 'sacha_names', 'fortnite',
+    'legendary_theme',
+]
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('secrets_mask', sa.BigInteger(), nullable=False, server_default='0'))
+
+    # One UPDATE per secret; bitwise OR works the same on SQLite and Postgres
+    for bit, code in enumerate(SECRETS):
+        op.execute(sa.text(
+            'UPDATE users SET secrets_mask = secrets_mask | :bit '
+            'WHERE id IN (SELECT user_id FROM user_secrets WHERE secret_code = :code)'
+        ).bindparams(bit=1 << bit, code=code))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('secrets_mask')
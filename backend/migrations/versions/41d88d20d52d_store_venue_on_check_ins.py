@@ -0,0 +1,29 @@
+"""store venue on check-ins
+
+Existing check-ins keep a NULL venue until `flask check-venues --fix`
+matches their coordinates against the configured venues.
+
+Revision ID: 41d88d20d52d
+Revises: b6921a05162c
+Create Date: 2026-10-16 19:54:52.039533
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '41d88d20d52d'
+down_revision = 'b6921a05162c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('checkins', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('venue', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('checkins', schema=None) as batch_op:
+        batch_op.drop_column('venue')
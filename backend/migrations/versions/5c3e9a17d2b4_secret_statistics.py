@@ -0,0 +1,63 @@
+"""secret statistics
+
+Adds the per-secret discovery counts (secret_stats) and each user's number
+of secrets found, filled from user_secrets. As in 12a4f1ad78f7, the secret
+codes are frozen here as they were when the tables were added.
+
+Revision ID: 5c3e9a17d2b4
+Revises: 12a4f1ad78f7
+Create Date: 2026-10-16 22:03:17.284615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c3e9a17d2b4'
+down_revision = '12a4f1ad78f7'
+branch_labels = None
+depends_on = None
+
+SECRETS = [
+    'b_drag', 'job_spawn', 'job_click', 'chess', 'chess_victory', 'ian', 'smiling_friends',
+    'ranking', 'brainrot', 'fnaf', 'six_seven', 'monkey_cursor', 'counter', 'theme_kabouter',
+    'bar_explosion', 'hollow_knight', 'tweak_game', 'simo_peek', 'sacha_names', 'fortnite',
+    'legendary_theme',
+]
+# Rewards don't count towards a user's number of secrets found
+COUNTED = [code for code in SECRETS if code != 'legendary_theme']
+
+
+def upgrade():
+    op.create_table('secret_stats',
+    sa.Column('secret_code', sa.String(length=50), nullable=False),
+    sa.Column('found_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('secret_code')
+    )
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('secret_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('last_secret_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_users_secret_count', [sa.text('secret_count DESC'), 'last_secret_at'],
+                              unique=False)
+
+    op.execute(sa.text(
+        'INSERT INTO secret_stats (secret_code, found_count) '
+        'SELECT secret_code, COUNT(*) FROM user_secrets WHERE secret_code IN :codes GROUP BY secret_code'
+    ).bindparams(sa.bindparam('codes', SECRETS, expanding=True)))
+    op.execute(sa.text(
+        'UPDATE users SET '
+        'secret_count = (SELECT COUNT(*) FROM user_secrets '
+        'WHERE user_id = users.id AND secret_code IN :codes), '
+        'last_secret_at = (SELECT MAX(discovered_at) FROM user_secrets '
+        'WHERE user_id = users.id AND secret_code IN :codes)'
+    ).bindparams(sa.bindparam('codes', COUNTED, expanding=True)))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_secret_count')
+        batch_op.drop_column('last_secret_at')
+        batch_op.drop_column('secret_count')
+
+    op.drop_table('secret_stats')
@@ -0,0 +1,121 @@
+"""initial schema
+
+The schema as db.create_all() used to create it at startup. Databases that
+predate migrations already have some or all of these tables, so existing
+tables are left alone and only the columns that were added to them later
+are filled in, with their tallies backfilled.
+
+Revision ID: 81cd78ba4eee
+Revises:
+Create Date: 2026-10-16 19:48:57.921151
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '81cd78ba4eee'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Columns added to existing tables before migrations, with their backfill
+ADDED_COLUMNS = [
+    ('checkins', sa.Column('photo_id', sa.String(length=64), nullable=True), None),
+    ('checkins', sa.Column('like_count', sa.Integer(), nullable=False, server_default='0'),
+     "UPDATE checkins SET like_count = (SELECT COUNT(*) FROM reactions "
+     "WHERE reactions.checkin_id = checkins.id AND reactions.reaction_type = 'like')"),
+    ('checkins', sa.Column('dislike_count', sa.Integer(), nullable=False, server_default='0'),
+     "UPDATE checkins SET dislike_count = (SELECT COUNT(*) FROM reactions "
+     "WHERE reactions.checkin_id = checkins.id AND reactions.reaction_type = 'dislike')"),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = set(inspector.get_table_names())
+
+    if 'users' not in existing:
+        op.create_table('users',
+            sa.Column('id', sa.String(length=255), nullable=False),
+            sa.Column('email', sa.String(length=255), nullable=False),
+            sa.Column('name', sa.String(length=255), nullable=False),
+            sa.Column('picture', sa.String(length=500), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email')
+        )
+    if 'blobs' not in existing:
+        op.create_table('blobs',
+            sa.Column('key', sa.String(length=64), nullable=False),
+            sa.Column('data', sa.LargeBinary(), nullable=False),
+            sa.Column('size', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('key')
+        )
+    if 'auth_tokens' not in existing:
+        op.create_table('auth_tokens',
+            sa.Column('token_hash', sa.String(length=64), nullable=False),
+            sa.Column('user_id', sa.String(length=255), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('token_hash')
+        )
+        op.create_index('ix_auth_tokens_user_id', 'auth_tokens', ['user_id'])
+        op.create_index('ix_auth_tokens_expires_at', 'auth_tokens', ['expires_at'])
+    if 'checkins' not in existing:
+        op.create_table('checkins',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.String(length=255), nullable=False),
+            sa.Column('check_in_date', sa.Date(), nullable=False),
+            sa.Column('check_in_time', sa.DateTime(), nullable=False),
+            sa.Column('latitude', sa.Float(), nullable=False),
+            sa.Column('longitude', sa.Float(), nullable=False),
+            sa.Column('photo_data', sa.Text(), nullable=True),
+            sa.Column('photo_id', sa.String(length=64), nullable=True),
+            sa.Column('like_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('dislike_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'check_in_date', name='unique_user_date')
+        )
+    if 'reactions' not in existing:
+        op.create_table('reactions',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.String(length=255), nullable=False),
+            sa.Column('checkin_id', sa.Integer(), nullable=False),
+            sa.Column('reaction_type', sa.String(length=10), nullable=False),
+            sa.Column('reaction_date', sa.Date(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['checkin_id'], ['checkins.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'reaction_date', name='unique_user_reaction_per_day')
+        )
+    if 'user_secrets' not in existing:
+        op.create_table('user_secrets',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.String(length=255), nullable=False),
+            sa.Column('secret_code', sa.String(length=50), nullable=False),
+            sa.Column('discovered_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'secret_code', name='unique_user_secret')
+        )
+
+    for table, column, backfill in ADDED_COLUMNS:
+        if table in existing and column.name not in {c['name'] for c in inspector.get_columns(table)}:
+            op.add_column(table, column)
+            if backfill:
+                op.execute(backfill)
+
+
+def downgrade():
+    op.drop_table('user_secrets')
+    op.drop_table('reactions')
+    op.drop_table('checkins')
+    op.drop_table('auth_tokens')
+    op.drop_table('blobs')
+    op.drop_table('users')
@@ -0,0 +1,86 @@
+"""all-time standings
+
+Adds the per-user standings (user_stats) and the per-day check-in counters
+(checkin_days), filled from checkins and reactions. Streaks are walked in
+Python, the same way `flask rebuild-standings` does it.
+
+Revision ID: 8e2b7d41c9a6
+Revises: 5c3e9a17d2b4
+Create Date: 2026-10-16 23:41:52.907316
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2b7d41c9a6'
+down_revision = '5c3e9a17d2b4'
+branch_labels = None
+depends_on = None
+
+checkins = sa.table('checkins', sa.column('user_id', sa.String), sa.column('check_in_date', sa.Date))
+user_stats = sa.table(
+    'user_stats',
+    sa.column('user_id', sa.String),
+    sa.column('current_streak', sa.Integer),
+    sa.column('longest_streak', sa.Integer)
+)
+
+
+def upgrade():
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.String(length=255), nullable=False),
+    sa.Column('total_checkins', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rank_sum', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('current_streak', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('longest_streak', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('last_checkin_date', sa.Date(), nullable=True),
+    sa.Column('net_likes', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table('checkin_days',
+    sa.Column('check_in_date', sa.Date(), nullable=False),
+    sa.Column('checkin_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('check_in_date')
+    )
+
+    op.execute(sa.text(
+        'INSERT INTO checkin_days (check_in_date, checkin_count) '
+        'SELECT check_in_date, COUNT(*) FROM checkins GROUP BY check_in_date'
+    ))
+    op.execute(sa.text(
+        'INSERT INTO user_stats (user_id, total_checkins, rank_sum, last_checkin_date, net_likes) '
+        'SELECT ranked.user_id, COUNT(*), SUM(ranked.daily_rank), MAX(ranked.check_in_date), '
+        'COALESCE((SELECT SUM(CASE reactions.reaction_type WHEN \'like\' THEN 1 WHEN \'dislike\' THEN -1 '
+        'ELSE 0 END) FROM reactions JOIN checkins ON checkins.id = reactions.checkin_id '
+        'WHERE checkins.user_id = ranked.user_id), 0) '
+        'FROM (SELECT user_id, check_in_date, ROW_NUMBER() OVER ('
+        'PARTITION BY check_in_date ORDER BY check_in_time, id) AS daily_rank FROM checkins) AS ranked '
+        'GROUP BY ranked.user_id'
+    ))
+
+    conn = op.get_bind()
+    streaks = {}
+    previous = {}
+    rows = conn.execute(sa.select(checkins.c.user_id, checkins.c.check_in_date)
+                        .order_by(checkins.c.user_id, checkins.c.check_in_date))
+    for user_id, day in rows:
+        current, longest = streaks.get(user_id, (0, 0))
+        current = current + 1 if previous.get(user_id) == day - timedelta(days=1) else 1
+        streaks[user_id] = (current, max(longest, current))
+        previous[user_id] = day
+    if streaks:
+        conn.execute(
+            user_stats.update().where(user_stats.c.user_id == sa.bindparam('uid')),
+            [{'uid': user_id, 'current_streak': current, 'longest_streak': longest}
+             for user_id, (current, longest) in streaks.items()]
+        )
+
+
+def downgrade():
+    op.drop_table('checkin_days')
+    op.drop_table('user_stats')
@@ -0,0 +1,34 @@
+"""index hot lookup columns
+
+- checkins (check_in_date, check_in_time): the leaderboard reads one day in
+  time order, history ranks each day by time.
+- reactions (checkin_id, reaction_type): tallies per check-in, used by the
+  consistency check and the tally backfill.
+
+user_secrets needs nothing new: the unique (user_id, secret_code)
+constraint already serves lookups by user_id.
+
+Revision ID: b6921a05162c
+Revises: 81cd78ba4eee
+Create Date: 2026-10-16 19:49:13.904324
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6921a05162c'
+down_revision = '81cd78ba4eee'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_checkins_date_time', 'checkins', ['check_in_date', 'check_in_time'])
+    op.create_index('ix_reactions_checkin_type', 'reactions', ['checkin_id', 'reaction_type'])
+
+
+def downgrade():
+    op.drop_index('ix_reactions_checkin_type', table_name='reactions')
+    op.drop_index('ix_checkins_date_time', table_name='checkins')
@@ -1,6 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
 
 db = SQLAlchemy()
 
@@ -12,8 +13,15 @@ class User(UserMixin, db.Model):
     name = db.Column(db.String(255), nullable=False)
     picture = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    secrets_mask = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')  # Bits from secret_codes.py
+    secret_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Secrets in the mask, rewards excluded
+    last_secret_at = db.Column(db.DateTime, nullable=True)  # When secret_count last went up
     
     checkins = db.relationship('CheckIn', backref='user', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_users_secret_count', secret_count.desc(), last_secret_at),  # Secret leaderboard order
+    )
 
 class CheckIn(db.Model):
     __tablename__ = 'checkins'
@@ -24,12 +32,17 @@ class CheckIn(db.Model):
     check_in_time = db.Column(db.DateTime, nullable=False)
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
-    photo_data = db.Column(db.Text, nullable=True)  # Base64 encoded photo
+    venue = db.Column(db.String(64), nullable=True)  # Id of the matched venue, see geofence.py
+    photo_data = db.Column(db.Text, nullable=True)  # Legacy base64 photo, moved out by `flask migrate-photos`
+    photo_id = db.Column(db.String(64), nullable=True)  # Content key in the blob store
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Materialized tallies
+    dislike_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     reactions_received = db.relationship('Reaction', backref='checkin', lazy=True)
     
     __table_args__ = (
         db.UniqueConstraint('user_id', 'check_in_date', name='unique_user_date'),
+        db.Index('ix_checkins_date_time', 'check_in_date', 'check_in_time'),  # Leaderboard and history order
     )
 
 class Reaction(db.Model):
@@ -46,6 +59,7 @@ class Reaction(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('user_id', 'reaction_date', name='unique_user_reaction_per_day'),
+        db.Index('ix_reactions_checkin_type', 'checkin_id', 'reaction_type'),  # Tallies per check-in
     )
 
 class UserSecret(db.Model):
@@ -62,3 +76,111 @@ class UserSecret(db.Model):
         db.UniqueConstraint('user_id', 'secret_code', name='unique_user_secret'),
     )
 
+
+class SecretStat(db.Model):
+    __tablename__ = 'secret_stats'
+    
+    secret_code = db.Column(db.String(50), primary_key=True)
+    found_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Users who found it, materialized
+
+
+class UserStats(db.Model):
+    __tablename__ = 'user_stats'  # All-time standings, kept up to date by standings.py
+
+    user_id = db.Column(db.String(255), db.ForeignKey('users.id'), primary_key=True)
+    total_checkins = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rank_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Sum of daily ranks, for the average
+    current_streak = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Days in a row up to last_checkin_date
+    longest_streak = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_checkin_date = db.Column(db.Date, nullable=True)
+    net_likes = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Likes minus dislikes received
+
+    user = db.relationship('User', backref=db.backref('stats', uselist=False))
+
+
+class CheckInDay(db.Model):
+    __tablename__ = 'checkin_days'
+
+    check_in_date = db.Column(db.Date, primary_key=True)
+    checkin_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Also the rank of the latest check-in
+
+
+class Blob(db.Model):
+    __tablename__ = 'blobs'
+    
+    key = db.Column(db.String(64), primary_key=True)  # SHA-256 of the content
+    data = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class AuthToken(db.Model):
+    __tablename__ = 'auth_tokens'
+    
+    token_hash = db.Column(db.String(64), primary_key=True)  # SHA-256 of the bearer token
+    user_id = db.Column(db.String(255), db.ForeignKey('users.id'), nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def insert_unless_exists(model, conflict_columns, **values):
+    """
+    Insert a row in one statement, unless one with the same `conflict_columns`
+    (a unique constraint) already exists.
+
+    Runs INSERT ... ON CONFLICT DO NOTHING RETURNING and returns the new
+    instance, or None on conflict. Unlike a SELECT followed by an INSERT this
+    cannot race with a concurrent request into an IntegrityError.
+    """
+    stmt = _dialect_insert(model).values(**values)\
+        .on_conflict_do_nothing(index_elements=conflict_columns)\
+        .returning(model)
+    return db.session.scalars(stmt).first()
+
+
+def insert_many_unless_exist(model, conflict_columns, rows, returning):
+    """
+    Insert several rows in one statement, skipping those that conflict on
+    `conflict_columns`. Returns the `returning` column of the rows that were
+    actually inserted.
+    """
+    if not rows:
+        return []
+    stmt = _dialect_insert(model).values(rows)\
+        .on_conflict_do_nothing(index_elements=conflict_columns)\
+        .returning(returning)
+    return db.session.scalars(stmt).all()
+
+
+def increment_counters(model, key_column, counter_column, keys):
+    """
+    Add one to `counter_column` of the rows with the given keys, creating
+    the missing ones, in one INSERT ... ON CONFLICT DO UPDATE statement.
+    """
+    if not keys:
+        return
+    # A fixed order, so concurrent transactions lock the rows in the same order
+    stmt = _dialect_insert(model).values([{key_column: key, counter_column: 1} for key in sorted(keys)])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[key_column],
+        set_={counter_column: getattr(model, counter_column) + stmt.excluded[counter_column]}
+    )
+    db.session.execute(stmt)
+
+
+def upsert(model, conflict_columns, values, set_):
+    """
+    INSERT ... ON CONFLICT DO UPDATE statement for one row. `set_` is called
+    with the statement's `excluded` row and returns the columns to update.
+    Add .returning() to read the row back.
+    """
+    stmt = _dialect_insert(model).values(**values)
+    return stmt.on_conflict_do_update(index_elements=conflict_columns, set_=set_(stmt.excluded))
+
+
+def _dialect_insert(model):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model)
+    if dialect == 'sqlite':
+        return sqlite.insert(model)
+    raise NotImplementedError(f'No upsert support for {dialect}')
@@ -0,0 +1,186 @@
+"""
+Morph animations between two images, driven by a node mapping.
+
+A node mapping is a pair of node lists, one per image. Each node has a
+position (x, y) in the animation frame and mesh coordinates (u, v) in its
+image, all normalized to [0, 1]; node i of both lists is the same feature.
+
+Per frame, the nodes move linearly from their positions in the first image
+to those in the second. A smooth (Clough-Tocher) warp field maps every
+output pixel back to the source mesh. Both images and both axes share the
+triangulation of the moved nodes, so each frame needs one triangulation.
+The field is evaluated on a coarse grid and upsampled with interpolation
+weights computed once for all frames. The center zoom is folded into that
+grid, so only the visible pixels are warped. Sampling gathers all color
+channels in one pass.
+
+Frames are handed to the encoder stage (morph_encoder.py) one at a time as
+they are rendered, so a morph never has to be held in memory as a whole.
+"""
+
+import json
+
+import numpy as np
+from PIL import Image
+from scipy.interpolate import CloughTocher2DInterpolator
+from scipy.spatial import Delaunay
+
+from morph_encoder import DEFAULT_PRESET, PRESETS, AnimationEncoder, build_palette
+
+# Default settings
+NUM_FRAMES = 40  # More frames = smoother animation
+FRAME_DURATION = 0.05  # 20fps, total 2 seconds
+OUTPUT_SIZE = (800, 800)  # Higher resolution for quality
+
+# Zoom/crop settings - zoom into center to remove sidebars
+ZOOM_FACTOR = 1.4  # 1.0 = no zoom, higher = more zoomed in
+
+# The warp field is smooth; evaluating it every FIELD_STEP pixels and
+# interpolating in between is visually identical and much cheaper
+FIELD_STEP = 4
+
+# Frames the global GIF palette is built from
+PALETTE_SAMPLES = 5
+
+
+def load_nodes(path):
+    """Load the node mapping from JSON."""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return data[0], data[1]  # nodes1, nodes2
+
+
+def node_arrays(nodes):
+    """(positions, sources) as (N, 2) arrays of the nodes' x/y and u/v."""
+    positions = np.array([[node['x'], node['y']] for node in nodes], dtype=np.float64)
+    sources = np.array([[node['u'], node['v']] for node in nodes], dtype=np.float64)
+    return positions, sources
+
+
+def interpolation_matrix(coarse, fine):
+    """
+    Matrix M such that M @ values_at(coarse) linearly interpolates the
+    values at `fine`. Both are increasing 1-D coordinate arrays.
+    """
+    upper = np.clip(np.searchsorted(coarse, fine, side='right'), 1, len(coarse) - 1)
+    lower = upper - 1
+    weight = np.clip((fine - coarse[lower]) / (coarse[upper] - coarse[lower]), 0, 1)
+    matrix = np.zeros((len(fine), len(coarse)))
+    rows = np.arange(len(fine))
+    matrix[rows, lower] = 1 - weight
+    matrix[rows, upper] += weight
+    return matrix
+
+
+def zoomed_axis(length, zoom_factor):
+    """
+    Normalized frame coordinates of the output pixels along one axis after
+    cropping the center 1/zoom_factor and scaling it back to `length`.
+    """
+    crop = int(length / zoom_factor)
+    start = (length - crop) // 2
+    # Pixel centers of the output, mapped into the cropped region
+    pixels = start + (np.arange(length) + 0.5) * crop / length - 0.5
+    return pixels / length
+
+
+class MorphEngine:
+    """Renders the frames of a morph between two images."""
+
+    def __init__(self, img1, img2, nodes1, nodes2, size=OUTPUT_SIZE, zoom_factor=ZOOM_FACTOR,
+                 field_step=FIELD_STEP):
+        w, h = size
+        self.size = size
+        # Both images are resized to the output size, so they share one sampling grid
+        self.img1 = np.asarray(img1.resize(size, Image.Resampling.LANCZOS), dtype=np.float32)
+        self.img2 = np.asarray(img2.resize(size, Image.Resampling.LANCZOS), dtype=np.float32)
+
+        self.positions1, sources1 = node_arrays(nodes1)
+        self.positions2, sources2 = node_arrays(nodes2)
+        # When both node sets point at the same mesh coordinates (the usual
+        # case) one warp field serves both images
+        self.shared_mesh = np.array_equal(sources1, sources2)
+        self.sources = sources1 if self.shared_mesh else np.hstack([sources1, sources2])
+
+        # Output pixel grid in normalized frame coordinates, zoom included
+        xs = zoomed_axis(w, zoom_factor)
+        ys = zoomed_axis(h, zoom_factor)
+        coarse_xs = np.append(xs[::field_step], xs[-1]) if (w - 1) % field_step else xs[::field_step]
+        coarse_ys = np.append(ys[::field_step], ys[-1]) if (h - 1) % field_step else ys[::field_step]
+        grid_x, grid_y = np.meshgrid(coarse_xs, coarse_ys)
+        self.coarse_shape = grid_x.shape
+        self.coarse_points = np.column_stack([grid_x.ravel(), grid_y.ravel()])
+        # Coarse -> full resolution weights, the same for every frame
+        self.upsample_x = interpolation_matrix(coarse_xs, xs)
+        self.upsample_y = interpolation_matrix(coarse_ys, ys)
+
+    def positions(self, t):
+        """Node positions at time t, moving linearly between the two sets."""
+        return self.positions1 + (self.positions2 - self.positions1) * t
+
+    def warp_field(self, t):
+        """
+        Source mesh coordinates (u, v) of every output pixel at time t, as an
+        (h, w, 2) array, or (h, w, 4) when the images use different meshes.
+        """
+        # One triangulation for all columns; same as griddata(method='cubic')
+        interpolator = CloughTocher2DInterpolator(Delaunay(self.positions(t)), self.sources, fill_value=0.5)
+        coarse = interpolator(self.coarse_points).reshape(*self.coarse_shape, -1)
+        return np.einsum('yi,ijc,xj->yxc', self.upsample_y, coarse, self.upsample_x, optimize=True)
+
+    def sample(self, image, u, v):
+        """
+        Bilinearly sample all channels of `image` at mesh coordinates (u, v).
+
+        Same result as map_coordinates(order=1, mode='nearest') per channel,
+        but the four neighbours are gathered for all channels at once.
+        """
+        img_h, img_w = image.shape[:2]
+        x = np.clip(u * (img_w - 1), 0, img_w - 1)
+        y = np.clip(v * (img_h - 1), 0, img_h - 1)
+        # Clamping the corner to the second to last pixel keeps x0 + 1 in
+        # range; the weight then becomes 1 on the last pixel
+        x0 = np.minimum(x.astype(np.intp), img_w - 2)
+        y0 = np.minimum(y.astype(np.intp), img_h - 2)
+        wx = (x - x0).astype(np.float32)[..., None]
+        wy = (y - y0).astype(np.float32)[..., None]
+        top = image[y0, x0] + (image[y0, x0 + 1] - image[y0, x0]) * wx
+        bottom = image[y0 + 1, x0] + (image[y0 + 1, x0 + 1] - image[y0 + 1, x0]) * wx
+        return top + (bottom - top) * wy
+
+    def frame(self, t):
+        """The morph at time t in [0, 1] as an (h, w, 3) uint8 array."""
+        field = self.warp_field(t)
+        if self.shared_mesh:
+            # Bilinear sampling is linear in the image, so sampling the
+            # cross-faded images equals cross-fading the two warps
+            blended = self.sample(self.img1 * (1 - t) + self.img2 * t, field[..., 0], field[..., 1])
+        else:
+            warped1 = self.sample(self.img1, field[..., 0], field[..., 1])
+            warped2 = self.sample(self.img2, field[..., 2], field[..., 3])
+            blended = warped1 * (1 - t) + warped2 * t
+        return blended.astype(np.uint8)
+
+    def frames(self, num_frames):
+        """Yield the frames for t evenly spaced from 0 to 1."""
+        for i in range(num_frames):
+            yield self.frame(i / (num_frames - 1))
+
+
+def palette_for(engine, colors, samples=PALETTE_SAMPLES):
+    """Global GIF palette for a morph, from frames sampled evenly over it."""
+    return build_palette([engine.frame(t) for t in np.linspace(0, 1, samples)], colors)
+
+
+def render_morph(img1, img2, nodes1, nodes2, gif_path, webp_path, num_frames=NUM_FRAMES,
+                 size=OUTPUT_SIZE, zoom_factor=ZOOM_FACTOR, preset=DEFAULT_PRESET):
+    """Render a morph on the calling thread and stream it into a GIF and a WebP file."""
+    engine = MorphEngine(img1, img2, nodes1, nodes2, size=size, zoom_factor=zoom_factor)
+    palette = palette_for(engine, PRESETS[preset]['gif_colors'])
+    encoder = AnimationEncoder(size, int(FRAME_DURATION * 1000), palette, preset,
+                               gif_path=gif_path, webp_path=webp_path)
+    try:
+        for frame in engine.frames(num_frames):
+            encoder.add(frame)
+    finally:
+        encoder.close()
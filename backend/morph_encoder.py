@@ -0,0 +1,298 @@
+"""
+Encoding rendered morph frames into GIF and WebP animations.
+
+- One global GIF palette is built from a few frames sampled over the whole
+  morph, so frames share the header's color table instead of each carrying
+  (and flickering between) their own.
+- Every frame is compared with what is currently on screen. A frame that
+  barely differs (mean absolute difference below the preset's `dedupe`) is
+  dropped and the previous frame is shown longer instead. Otherwise only the
+  bounding box of the changed pixels is written; in the GIF, the pixels in
+  that box that did not change are transparent, which LZW compresses to
+  almost nothing.
+- Quality settings come in named PRESETS; quality_report() measures what a
+  preset costs in size and SSIM against the rendered frames.
+
+GIF and WebP are written one frame at a time, the two formats encoded
+concurrently on a small thread pool.
+"""
+
+import io
+import os
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, GifImagePlugin
+from scipy.ndimage import uniform_filter
+
+LOOP = 1  # Play once (GIF browser support varies, WebP respects it)
+
+# gif_colors: GIF palette size (at most 255, the last index is transparency)
+# webp_quality: lossy WebP quality, 0-100
+# dedupe: mean absolute difference (0-255) below which a frame is dropped
+# tolerance: per-pixel difference (0-255) below which a pixel counts as unchanged
+PRESETS = {
+    'small': {'gif_colors': 128, 'webp_quality': 60, 'dedupe': 1.0, 'tolerance': 6},
+    'balanced': {'gif_colors': 255, 'webp_quality': 80, 'dedupe': 0.5, 'tolerance': 3},
+    'high': {'gif_colors': 255, 'webp_quality': 92, 'dedupe': 0.0, 'tolerance': 0},
+}
+DEFAULT_PRESET = 'balanced'
+GIF_TRANSPARENT = 255
+# Frames whose encoding may be in progress before the writers wait for them
+ENCODES_IN_FLIGHT = 4
+
+
+def build_palette(samples, colors):
+    """A global palette (flat RGB list) for frames like the sampled ones."""
+    mosaic = np.concatenate([np.asarray(Image.fromarray(s).reduce(2)) for s in samples], axis=1)
+    # A few k-means passes over the median cut fit the skin tones noticeably better
+    quantized = Image.fromarray(mosaic).quantize(min(colors, GIF_TRANSPARENT), method=Image.Quantize.MEDIANCUT,
+                                                 kmeans=3)
+    return quantized.getpalette()[:min(colors, GIF_TRANSPARENT) * 3]
+
+
+def palette_image(palette):
+    image = Image.new('P', (1, 1))
+    image.putpalette(palette)
+    return image
+
+
+def quantize(frame, palette):
+    """
+    Palette indices of an RGB frame, as a uint8 array. Not dithered: the
+    dither noise differs from frame to frame, which defeats the diffing and
+    measured worse on SSIM.
+    """
+    return np.asarray(Image.fromarray(frame).quantize(palette=palette_image(palette), dither=Image.Dither.NONE))
+
+
+def _uint24(value):
+    return struct.pack('<I', value)[:3]
+
+
+class GifStreamWriter:
+    """Writes an animated GIF with a global palette one frame at a time."""
+
+    def __init__(self, path, size, palette, loop=LOOP):
+        self.file = open(path, 'wb')
+        self.palette = palette
+        # Pad to 256 entries so the transparent index is inside the table
+        header_image = Image.new('P', size)
+        header_image.putpalette(palette + palette[:3] * (256 - len(palette) // 3))
+        header, _ = GifImagePlugin.getheader(header_image, info={'loop': loop})
+        self.file.write(b''.join(header))
+
+    def encode(self, indices, offset, duration_ms, transparent):
+        """One image block: a frame (or part of one) at offset, left on screen afterwards."""
+        image = Image.frombytes('P', indices.shape[::-1], indices.tobytes())
+        image.putpalette(self.palette)
+        params = {'duration': duration_ms, 'disposal': 1}
+        if transparent:
+            params['transparency'] = GIF_TRANSPARENT
+        return b''.join(GifImagePlugin.getdata(image, offset, **params))
+
+    def append(self, data):
+        self.file.write(data)
+
+    def close(self):
+        self.file.write(b';')  # trailer
+        self.file.close()
+
+
+class WebPStreamWriter:
+    """
+    Writes an animated WebP one frame at a time.
+
+    Each frame is a still WebP bitstream wrapped in an ANMF chunk; the RIFF
+    size in the header is filled in on close.
+    """
+
+    def __init__(self, path, size, quality, loop=LOOP):
+        self.file = open(path, 'wb')
+        self.quality = quality
+        width, height = size
+        self.file.write(b'RIFF\0\0\0\0WEBP')
+        # VP8X with the animation flag, then the canvas size
+        self._chunk(b'VP8X', b'\x02\0\0\0' + _uint24(width - 1) + _uint24(height - 1))
+        # Background color, loop count (0 = forever)
+        self._chunk(b'ANIM', b'\0\0\0\0' + struct.pack('<H', loop))
+
+    def _chunk(self, fourcc, payload):
+        self.file.write(fourcc + struct.pack('<I', len(payload)) + payload)
+        if len(payload) & 1:
+            self.file.write(b'\0')
+
+    def encode(self, pixels, offset, duration_ms):
+        """ANMF payload for RGB pixels at offset (even x and y)."""
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='WEBP', quality=self.quality)
+        data = buffer.getvalue()
+        chunks = []
+        position = 12  # RIFF header
+        while position < len(data):
+            fourcc, size = data[position:position + 4], struct.unpack('<I', data[position + 4:position + 8])[0]
+            end = position + 8 + size + (size & 1)
+            if fourcc in (b'ALPH', b'VP8 ', b'VP8L'):
+                chunks.append(data[position:end])
+            position = end
+        height, width = pixels.shape[:2]
+        # No blending with the previous frame, no disposal
+        header = _uint24(offset[0] // 2) + _uint24(offset[1] // 2) + _uint24(width - 1) + \
+            _uint24(height - 1) + _uint24(duration_ms) + b'\x02'
+        return header + b''.join(chunks)
+
+    def append(self, data):
+        self._chunk(b'ANMF', data)
+
+    def close(self):
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', os.path.getsize(self.file.name) - 8))
+        self.file.close()
+
+
+class AnimationEncoder:
+    """
+    The encoder stage: takes rendered frames in order and writes them to the
+    requested formats, deduplicated and diffed against the previous frame.
+    """
+
+    def __init__(self, size, frame_duration_ms, palette, preset=DEFAULT_PRESET,
+                 gif_path=None, webp_path=None):
+        self.settings = PRESETS[preset]
+        self.frame_duration_ms = frame_duration_ms
+        self.palette = palette
+        self.gif = GifStreamWriter(gif_path, size, palette) if gif_path else None
+        self.webp = WebPStreamWriter(webp_path, size, self.settings['webp_quality']) if webp_path else None
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='morph-encode')
+        self.encoding = deque()
+        # RGB of what is on screen, and the palette indices the GIF shows
+        self.shown = None
+        self.shown_indices = None
+        self.pending = None
+        self.frames_in = 0
+        self.frames_out = 0
+
+    def add(self, frame, indices=None):
+        """Add the next frame; `indices` are its palette indices, if already quantized."""
+        self.frames_in += 1
+        if self.gif and indices is None:
+            indices = quantize(frame, self.palette)
+        if self.shown is None:
+            changed = np.ones(frame.shape[:2], dtype=bool)
+        else:
+            difference = np.abs(frame.astype(np.int16) - self.shown)
+            changed = difference.max(axis=2) > self.settings['tolerance']
+            if difference.mean() < self.settings['dedupe'] or not changed.any():
+                self.pending['duration'] += self.frame_duration_ms
+                return
+        self._flush()
+
+        rows = np.flatnonzero(changed.any(axis=1))
+        cols = np.flatnonzero(changed.any(axis=0))
+        # WebP frame offsets are stored halved, so they must be even
+        top, left = rows[0] & ~1, cols[0] & ~1
+        box = (slice(top, rows[-1] + 1), slice(left, cols[-1] + 1))
+        pending = {'offset': (int(left), int(top)), 'duration': self.frame_duration_ms,
+                   'first': self.shown is None}
+        if self.gif:
+            gif_indices = indices[box].copy()
+            if not pending['first']:
+                # Unchanged pixels, and changed ones that map to the color
+                # already shown, let the previous frame show through
+                gif_indices[~changed[box] | (gif_indices == self.shown_indices[box])] = GIF_TRANSPARENT
+                self.shown_indices[changed] = indices[changed]
+            else:
+                self.shown_indices = indices.copy()
+            pending['gif'] = gif_indices
+        if self.webp:
+            pending['webp'] = frame[box].copy()
+        if self.shown is None:
+            self.shown = frame.astype(np.int16)
+        else:
+            self.shown[changed] = frame[changed]
+        self.pending = pending
+
+    def _flush(self):
+        """Hand the pending frame, whose duration is now final, to the encoders."""
+        pending = self.pending
+        if pending is None:
+            return
+        self.pending = None
+        self.frames_out += 1
+        gif = webp = None
+        if self.gif:
+            gif = self.executor.submit(self.gif.encode, pending['gif'], pending['offset'], pending['duration'],
+                                       not pending['first'])
+        if self.webp:
+            webp = self.executor.submit(self.webp.encode, pending['webp'], pending['offset'], pending['duration'])
+        self.encoding.append((gif, webp))
+        self._write(ENCODES_IN_FLIGHT)
+
+    def _write(self, max_in_flight):
+        """Write finished frames in order, waiting while more than max_in_flight are encoding."""
+        while self.encoding and (len(self.encoding) > max_in_flight or
+                                 all(f is None or f.done() for f in self.encoding[0])):
+            gif, webp = self.encoding.popleft()
+            if gif:
+                self.gif.append(gif.result())
+            if webp:
+                self.webp.append(webp.result())
+
+    def close(self):
+        try:
+            self._flush()
+            self._write(0)
+        finally:
+            self.executor.shutdown()
+            for writer in (self.gif, self.webp):
+                if writer:
+                    writer.close()
+
+
+# ---- Quality report ----
+
+def luminance(frame):
+    return np.asarray(Image.fromarray(frame).convert('L'), dtype=np.float64)
+
+
+def ssim(a, b, window=7):
+    """Mean structural similarity of two grayscale images (float arrays, 0-255)."""
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mu_a, mu_b = uniform_filter(a, window), uniform_filter(b, window)
+    var_a = uniform_filter(a * a, window) - mu_a ** 2
+    var_b = uniform_filter(b * b, window) - mu_b ** 2
+    covariance = uniform_filter(a * b, window) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * covariance + c2)) / \
+        ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def quality_report(path, references, frame_duration_ms):
+    """
+    Compare an animation with the luminance of the frames it was made from.
+
+    Each reference frame is compared with the frame shown at its time, so
+    dropped frames count against the animation. Returns a dict with the file
+    size, the number of frames and the mean and minimum SSIM.
+    """
+    scores = []
+    with Image.open(path) as animation:
+        frames = getattr(animation, 'n_frames', 1)
+        shown_until = 0
+        frame_index = -1
+        for i, reference in enumerate(references):
+            time = i * frame_duration_ms
+            while time >= shown_until and frame_index + 1 < frames:
+                frame_index += 1
+                animation.seek(frame_index)
+                shown = luminance(np.asarray(animation.convert('RGB')))
+                shown_until += animation.info.get('duration') or frame_duration_ms
+            scores.append(ssim(reference, shown))
+    return {
+        'bytes': os.path.getsize(path),
+        'frames': frames,
+        'mean_ssim': float(np.mean(scores)),
+        'min_ssim': float(np.min(scores)),
+    }
@@ -0,0 +1,380 @@
+"""
+Morphs between two check-in photos, rendered on demand.
+
+A morph request names two photos by photo_id, a node mapping (see morph.py)
+and optional settings. Results are content addressed: the key is derived
+from a hash of the inputs (the photo_ids are content hashes themselves, plus
+the canonical node mapping) and the settings, so the same request always
+maps to the same files and a stored morph never changes meaning.
+
+MorphCache keeps the rendered GIF and WebP of each key on disk and evicts
+the least recently used morphs once they take more than
+MORPH_CACHE_MAX_BYTES. Recency is the file mtime, touched on every hit, so
+gunicorn workers sharing the directory share one cache. Eviction walks the
+whole directory, so a worker runs its first pass when the morph endpoints
+are first used rather than while it starts.
+
+Rendering takes seconds, so it runs on a small bounded thread pool: the
+request is answered with 202 and the client polls the morph until it is
+ready. A key that is already rendering is not queued twice. Rendering and
+failed morphs are marked by `<key>.pending` and `<key>.failed` files next
+to the output, so a poll answered by another worker sees the same state.
+"""
+
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from flask import current_app, url_for
+
+from blobstore import derived_key, is_valid_key
+from concurrency import background_executor
+
+# Bump when rendering changes, so morphs cached by older code are not served
+RENDER_VERSION = 2
+FORMATS = {
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+MAX_NODES = 500
+MIN_ZOOM, MAX_ZOOM = 1.0, 4.0
+# Failed renders are reported this long (seconds), a new request renders again
+FAILURE_TTL = 600
+# A pending marker older than this (seconds) was left by a worker that died
+# mid-render; queue waits plus a render stay well below it
+PENDING_TTL = 600
+
+
+class InvalidMorph(ValueError):
+    """Raised when a morph request is malformed."""
+
+
+class MorphServiceBusy(RuntimeError):
+    """Raised when the render pool has no room for another morph."""
+
+
+def _canonical_nodes(nodes):
+    """Validate a node list and reduce it to [[x, y, u, v], ...]."""
+    if not isinstance(nodes, list) or not 3 <= len(nodes) <= MAX_NODES:
+        raise InvalidMorph(f'Each node list needs 3 to {MAX_NODES} nodes')
+    canonical = []
+    for node in nodes:
+        try:
+            values = [float(node[k]) for k in ('x', 'y', 'u', 'v')]
+        except (KeyError, TypeError, ValueError):
+            raise InvalidMorph('Nodes need numeric x, y, u and v')
+        if not all(math.isfinite(value) for value in values):
+            raise InvalidMorph('Node coordinates must be finite')
+        canonical.append(values)
+    return canonical
+
+
+class MorphSpec:
+    """A validated morph request."""
+
+    def __init__(self, photo_ids, nodes1, nodes2, frames, size, zoom):
+        self.photo_ids = photo_ids
+        self.nodes1 = nodes1
+        self.nodes2 = nodes2
+        self.frames = frames
+        self.size = size
+        self.zoom = zoom
+
+    @classmethod
+    def from_json(cls, data, config, store):
+        """Build a spec from a request body, checking it against the configured limits."""
+        # morph.py pulls in numpy and scipy, so it is imported on the first
+        # morph request rather than when the app starts
+        from morph import NUM_FRAMES, OUTPUT_SIZE, ZOOM_FACTOR
+
+        photo_ids = data.get('photo_ids')
+        if not isinstance(photo_ids, list) or len(photo_ids) != 2 or \
+                not all(isinstance(p, str) and is_valid_key(p) for p in photo_ids):
+            raise InvalidMorph('photo_ids must be two photo ids')
+        for photo_id in photo_ids:
+            if not store.exists(photo_id):
+                raise InvalidMorph(f'Unknown photo {photo_id}')
+
+        nodes = data.get('nodes')
+        if not isinstance(nodes, list) or len(nodes) != 2:
+            raise InvalidMorph('nodes must be a pair of node lists')
+        nodes1, nodes2 = _canonical_nodes(nodes[0]), _canonical_nodes(nodes[1])
+        if len(nodes1) != len(nodes2):
+            raise InvalidMorph('Both node lists need the same number of nodes')
+
+        try:
+            frames = int(data.get('frames', NUM_FRAMES))
+            size = int(data.get('size', OUTPUT_SIZE[0]))
+            zoom = round(float(data.get('zoom', ZOOM_FACTOR)), 3)
+        except (TypeError, ValueError):
+            raise InvalidMorph('frames, size and zoom must be numbers')
+        if not 2 <= frames <= config['MORPH_MAX_FRAMES']:
+            raise InvalidMorph(f"frames must be between 2 and {config['MORPH_MAX_FRAMES']}")
+        if not 16 <= size <= config['MORPH_MAX_SIZE']:
+            raise InvalidMorph(f"size must be between 16 and {config['MORPH_MAX_SIZE']}")
+        if not MIN_ZOOM <= zoom <= MAX_ZOOM:
+            raise InvalidMorph(f'zoom must be between {MIN_ZOOM} and {MAX_ZOOM}')
+        return cls(photo_ids, nodes1, nodes2, frames, (size, size), zoom)
+
+    @property
+    def key(self):
+        """Cache key: the inputs hash combined with the settings."""
+        inputs = json.dumps([self.photo_ids, self.nodes1, self.nodes2], separators=(',', ':'))
+        inputs_hash = hashlib.sha256(inputs.encode()).hexdigest()
+        settings = f'morph-v{RENDER_VERSION}:{self.frames}:{self.size[0]}x{self.size[1]}:{self.zoom}'
+        return derived_key(inputs_hash, settings)
+
+    def node_dicts(self):
+        """Both node lists in the dict form MorphEngine takes."""
+        return [[dict(zip('xyuv', node)) for node in nodes] for nodes in (self.nodes1, self.nodes2)]
+
+
+class MorphCache:
+    """Rendered morphs on disk, evicted least recently used first."""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.entries = 0
+        self.total_bytes = 0
+        self.evicted = False
+        self._lock = threading.Lock()
+
+    def path(self, key, fmt):
+        return os.path.join(self.root, key[:2], f'{key}.{fmt}')
+
+    def contains(self, key):
+        return all(os.path.exists(self.path(key, fmt)) for fmt in FORMATS)
+
+    def _fresh(self, path, ttl):
+        try:
+            return time.time() - os.stat(path).st_mtime < ttl
+        except FileNotFoundError:
+            return False
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def claim(self, key):
+        """Mark a morph as rendering. False if a live render, in any worker, already has."""
+        path = self.path(key, 'pending')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            if self._fresh(path, PENDING_TTL):
+                return False
+            # Two workers may both take over a stale marker; rendering the
+            # same key twice is only wasted work
+            os.utime(path)
+        self._remove(self.path(key, 'failed'))
+        return True
+
+    def is_pending(self, key):
+        return self._fresh(self.path(key, 'pending'), PENDING_TTL)
+
+    def release(self, key, error=None):
+        """End a claimed render, recording `error` if it failed."""
+        if error is not None:
+            path = self.path(key, 'failed')
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(error)
+            os.replace(tmp_path, path)
+        self._remove(self.path(key, 'pending'))
+
+    def failure(self, key):
+        """The error of a recently failed render, or None."""
+        path = self.path(key, 'failed')
+        if not self._fresh(path, FAILURE_TTL):
+            return None
+        try:
+            with open(path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get(self, key, fmt):
+        """Path of a cached morph file, or None. Marks the morph as recently used."""
+        path = self.path(key, fmt)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def add(self, key, render):
+        """Call render(gif_path, webp_path) on temp files, then move them into place."""
+        directory = os.path.dirname(self.path(key, 'gif'))
+        os.makedirs(directory, exist_ok=True)
+        tmp_paths = {}
+        try:
+            for fmt in FORMATS:
+                fd, tmp_paths[fmt] = tempfile.mkstemp(dir=directory, suffix='.tmp')
+                os.close(fd)
+            render(tmp_paths['gif'], tmp_paths['webp'])
+            # Readers never see a partial file; the WebP, which marks the
+            # morph as complete for contains(), goes last
+            for fmt in FORMATS:
+                os.replace(tmp_paths.pop(fmt), self.path(key, fmt))
+        finally:
+            for tmp_path in tmp_paths.values():
+                os.remove(tmp_path)
+        self.evict()
+
+    def _scan(self):
+        """{key: (last used, bytes)} of the morphs on disk."""
+        morphs = {}
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                key, _, fmt = name.partition('.')
+                if fmt not in FORMATS:
+                    path = os.path.join(directory, name)
+                    if fmt == 'failed' and not self._fresh(path, FAILURE_TTL):
+                        self._remove(path)
+                    # Temp files left by a worker that died mid-render
+                    elif fmt == 'tmp' and not self._fresh(path, PENDING_TTL):
+                        self._remove(path)
+                    continue
+                try:
+                    st = os.stat(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+                used, size = morphs.get(key, (0, 0))
+                morphs[key] = (max(used, st.st_mtime), size + st.st_size)
+        return morphs
+
+    def evict(self):
+        """Delete least recently used morphs until the cache fits in max_bytes."""
+        with self._lock:
+            morphs = self._scan()
+            total = sum(size for _, size in morphs.values())
+            for key, (_, size) in sorted(morphs.items(), key=lambda item: item[1][0]):
+                if total <= self.max_bytes:
+                    break
+                for fmt in FORMATS:
+                    try:
+                        os.remove(self.path(key, fmt))
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                del morphs[key]
+            self.entries = len(morphs)
+            self.total_bytes = total
+            self.evicted = True
+
+    def evict_once(self):
+        """Run the first eviction pass, if none ran yet."""
+        # Racing first requests may both scan, which is only wasted work
+        if not self.evicted:
+            self.evict()
+
+    def stats(self):
+        """Hit/miss counters, and the size as of the last eviction pass."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': self.entries,
+            'bytes': self.total_bytes,
+            'maxbytes': self.max_bytes,
+        }
+
+
+class MorphService:
+    """Bounded render pool in front of the morph cache."""
+
+    def __init__(self, app=None):
+        self.cache = None
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config['MORPH_WORKERS']
+        self.cache = MorphCache(app.config['MORPH_CACHE_DIR'], app.config['MORPH_CACHE_MAX_BYTES'])
+        self.executor = background_executor(workers, 'morph-render')
+        # Running plus waiting renders; beyond this requests are turned away
+        self.max_jobs = workers + app.config['MORPH_QUEUE_SIZE']
+        # Renders queued in this worker
+        self.jobs = {}
+        self._lock = threading.Lock()
+        app.extensions['morph_service'] = self
+
+    def status(self, key):
+        """'ready', 'pending', 'failed' or None for an unknown key, and the error if failed."""
+        self.cache.evict_once()
+        if self.cache.contains(key):
+            return 'ready', None
+        if key in self.jobs or self.cache.is_pending(key):
+            return 'pending', None
+        error = self.cache.failure(key)
+        if error is not None:
+            return 'failed', error
+        return None, None
+
+    def request(self, spec):
+        """Start rendering a morph unless it is cached or already rendering. Returns (key, status)."""
+        key = spec.key
+        self.cache.evict_once()
+        if self.cache.contains(key):
+            return key, 'ready'
+        app = current_app._get_current_object()
+        with self._lock:
+            if key not in self.jobs:
+                if len(self.jobs) >= self.max_jobs:
+                    raise MorphServiceBusy('Too many morphs being rendered, try again')
+                if not self.cache.claim(key):
+                    # Rendering in another worker
+                    return key, 'pending'
+                self.jobs[key] = self.executor.submit(self._render, app, spec)
+        return key, 'pending'
+
+    def _render(self, app, spec):
+        from morph import render_morph
+
+        key = spec.key
+        error = None
+        try:
+            with app.app_context():
+                store = app.extensions['blob_store']
+                img1, img2 = (self._load(store, photo_id) for photo_id in spec.photo_ids)
+            nodes1, nodes2 = spec.node_dicts()
+            self.cache.add(key, lambda gif_path, webp_path: render_morph(
+                img1, img2, nodes1, nodes2, gif_path, webp_path,
+                num_frames=spec.frames, size=spec.size, zoom_factor=spec.zoom))
+        except Exception as e:
+            print(f'Error rendering morph {key}: {e}')
+            error = 'Could not render this morph'
+        finally:
+            self.cache.release(key, error)
+            with self._lock:
+                self.jobs.pop(key, None)
+
+    @staticmethod
+    def _load(store, photo_id):
+        from PIL import Image
+
+        # convert() reads the whole image, so the blob can be closed after it
+        with store.open(photo_id) as f:
+            return Image.open(f).convert('RGB')
+
+
+def morph_service():
+    """The morph service of the current app."""
+    return current_app.extensions['morph_service']
+
+
+def morph_urls(key):
+    """Paths of a morph's files (relative to the API root)."""
+    return {fmt: url_for('api.get_morph_file', key=key, fmt=fmt) for fmt in FORMATS}
@@ -0,0 +1,198 @@
+"""
+Check-in photo handling.
+
+Photos arrive from the frontend as base64 data URLs. The ingest pipeline
+decodes them once, enforces a size cap, re-encodes them as a compressed JPEG
+without EXIF metadata and writes that to the blob store; check-ins only keep
+the resulting photo_id. Thumbnails in THUMBNAIL_SIZES are derived from the
+full-size image afterwards.
+
+Image work runs on a small bounded thread pool (Pillow releases the GIL while
+decoding and encoding; under gevent these are still OS threads, see
+concurrency.py). The request waits for the full-size image only. When the
+pool and its queue are full, an upload waits up to PHOTO_SUBMIT_TIMEOUT for
+a place, so a burst is absorbed, and only gets a 503 if none frees up.
+"""
+
+import base64
+import binascii
+import io
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from flask import current_app, url_for
+
+from blobstore import derived_key
+from concurrency import background_executor
+
+# Longest side of the stored full-size photo and of each thumbnail, in pixels
+FULL_SIZE = 1600
+THUMBNAIL_SIZES = {
+    'small': 160,
+    'medium': 640,
+}
+# The leaderboard links this thumbnail by default
+DEFAULT_THUMBNAIL = 'medium'
+JPEG_QUALITY = 82
+THUMBNAIL_QUALITY = 75
+# Uploads with more pixels than this are rejected before decoding
+MAX_PIXELS = 40_000_000
+
+
+class InvalidPhoto(ValueError):
+    """Raised when an uploaded photo cannot be decoded."""
+
+
+class PhotoPipelineBusy(RuntimeError):
+    """Raised when the ingest pool has no room for another photo."""
+
+
+def decode_data_url(photo, max_bytes=None):
+    """Decode a base64 data URL (or bare base64 string) into bytes."""
+    if not isinstance(photo, str):
+        raise InvalidPhoto('Photo must be a base64 string')
+    if photo.startswith('data:'):
+        header, _, photo = photo.partition(',')
+        if ';base64' not in header:
+            raise InvalidPhoto('Photo must be base64 encoded')
+    # Reject oversized uploads before spending time decoding them
+    if max_bytes is not None and len(photo) * 3 // 4 > max_bytes:
+        raise InvalidPhoto(f'Photo is larger than {max_bytes / (1024 * 1024):.1f} MB')
+    try:
+        return base64.b64decode(photo, validate=True)
+    except (binascii.Error, ValueError):
+        raise InvalidPhoto('Photo is not valid base64')
+
+
+def _downscale(img, longest_side):
+    """Copy of img scaled down to fit longest_side."""
+    from PIL import Image
+
+    img = img.copy()
+    img.thumbnail((longest_side, longest_side), Image.Resampling.LANCZOS)
+    return img
+
+
+def _encode_jpeg(img, longest_side, quality):
+    """Downscale to fit longest_side and encode as JPEG without metadata."""
+    img = _downscale(img, longest_side)
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _open_image(data):
+    """Open uploaded bytes as an upright RGB image."""
+    # Pillow is imported with the first photo rather than when the app starts
+    from PIL import Image, ImageOps
+
+    try:
+        img = Image.open(io.BytesIO(data))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise InvalidPhoto('Photo is not a valid image')
+    if img.width * img.height > MAX_PIXELS:
+        raise InvalidPhoto('Photo has too many pixels')
+    try:
+        # Apply the EXIF orientation before the metadata is dropped
+        img = ImageOps.exif_transpose(img)
+        return img.convert('RGB')
+    except (OSError, ValueError):
+        raise InvalidPhoto('Photo is not a valid image')
+
+
+def process_photo(data, store):
+    """Store the full-size photo and return (photo_id, image at FULL_SIZE)."""
+    # Only the FULL_SIZE copy is kept for the thumbnail job, so a queued job
+    # never holds on to a full-resolution decode of up to MAX_PIXELS
+    img = _downscale(_open_image(data), FULL_SIZE)
+    photo_id = store.put(_encode_jpeg(img, FULL_SIZE, JPEG_QUALITY))
+    return photo_id, img
+
+
+def make_thumbnails(photo_id, img, store):
+    """Store every thumbnail size of a photo."""
+    for name, size in THUMBNAIL_SIZES.items():
+        store.put_variant(photo_id, name, _encode_jpeg(img, size, THUMBNAIL_QUALITY))
+
+
+def ingest_photo_sync(data, store):
+    """Run the whole pipeline on the calling thread."""
+    photo_id, img = process_photo(data, store)
+    make_thumbnails(photo_id, img, store)
+    return photo_id
+
+
+class PhotoPipeline:
+    """Bounded worker pool that turns uploads into stored photos."""
+
+    def __init__(self, app=None):
+        self.executor = None
+        self.slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config['PHOTO_WORKERS']
+        self.executor = background_executor(workers, 'photo-ingest')
+        # Running plus waiting jobs; beyond this uploads wait for a place
+        self.slots = threading.BoundedSemaphore(workers + app.config['PHOTO_QUEUE_SIZE'])
+        self.submit_timeout = app.config['PHOTO_SUBMIT_TIMEOUT']
+        self.timeout = app.config['PHOTO_INGEST_TIMEOUT']
+        app.extensions['photo_pipeline'] = self
+
+    def _submit(self, fn, *args, bounded=True):
+        if bounded and not self.slots.acquire(timeout=self.submit_timeout):
+            raise PhotoPipelineBusy('Too many photos being processed, try again')
+        app = current_app._get_current_object()
+
+        def run():
+            try:
+                with app.app_context():
+                    return fn(*args)
+            finally:
+                if bounded:
+                    self.slots.release()
+
+        return self.executor.submit(run)
+
+    def ingest(self, photo):
+        """Decode, validate and store an uploaded photo, returning its photo_id."""
+        data = decode_data_url(photo, max_bytes=current_app.config['MAX_PHOTO_BYTES'])
+        if not data:
+            raise InvalidPhoto('Photo is empty')
+        store = blob_store()
+        try:
+            photo_id, img = self._submit(process_photo, data, store).result(timeout=self.timeout)
+        except FutureTimeout:
+            raise PhotoPipelineBusy('Photo processing is taking too long, try again')
+        # Thumbnails are not needed to answer the request; until they exist
+        # the photo endpoint falls back to the full-size image. The job holds
+        # at most a FULL_SIZE image, so it does not take one of the slots
+        self._submit(make_thumbnails, photo_id, img, store, bounded=False)
+        return photo_id
+
+
+def blob_store():
+    """The blob store of the current app."""
+    return current_app.extensions['blob_store']
+
+
+def store_photo(photo):
+    """Run an uploaded photo through the ingest pipeline and return its photo_id."""
+    return current_app.extensions['photo_pipeline'].ingest(photo)
+
+
+def photo_blob_key(photo_id, size=None):
+    """Blob key of a photo or one of its thumbnails."""
+    if size is None:
+        return photo_id
+    return derived_key(photo_id, size)
+
+
+def photo_url(photo_id, size=DEFAULT_THUMBNAIL):
+    """Path of the photo endpoint for a photo_id (relative to the API root)."""
+    if not photo_id:
+        return None
+    if size is None:
+        return url_for('api.get_photo', photo_id=photo_id)
+    return url_for('api.get_photo', photo_id=photo_id, size=size)
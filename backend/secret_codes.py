@@ -0,0 +1,214 @@
+"""
+The secrets hidden in the frontend, and each user's progress as a bitmask.
+
+Every secret has a fixed bit: its position in ALL_SECRETS. Bits are stored
+in users.secrets_mask, so never reorder or remove entries; add new secrets
+at the end. The mask is kept in step with the user_secrets rows (which
+remember when each secret was found), so progress is one integer read and
+validating a code is a dict lookup.
+
+Recording discoveries takes one INSERT ... ON CONFLICT DO NOTHING for all
+codes and one atomic `secrets_mask = secrets_mask | bits`, in one
+transaction. Codes already in the user's mask skip both.
+
+League-wide statistics are materialized in the same transaction: the number
+of users who found each secret (secret_stats) and each user's number of
+secrets found and when it last went up (the secret leaderboard order). Only
+rows the INSERT actually created are counted, so racing requests never count
+a discovery twice. `flask rebuild-secrets` recomputes all of it from
+user_secrets.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import case, func, select, update
+
+from models import db, User, UserSecret, SecretStat, insert_many_unless_exist, increment_counters
+
+ALL_SECRETS = [
+    'b_drag',          # Dragging B to make "Job" in title
+    'job_spawn',       # Typing "job" to spawn flying Job
+    'job_click',       # Clicking flying Job
+    'chess',           # Playing chess
+    'chess_victory',   # Beating the chess AI (unlocks Chess Jobje theme)
+    'ian',             # Ian flashbang
+    'smiling_friends', # Any smiling friends character
+    'ranking',         # Ranking game
+    'brainrot',        # Brainrot videos
+    'fnaf',            # FNAF jumpscare
+    'six_seven',       # 67 tilt
+    'monkey_cursor',   # Triggered monkey cursor punishment
+    'counter',         # Finding the secret counter
+    'theme_kabouter',  # Unlocking Kabouter theme
+    'bar_explosion',   # Shaking the progress bar until it explodes
+    'hollow_knight',   # Playing Hollow Knight game
+    'tweak_game',      # Playing IWBTC (tweak game)
+    'simo_peek',       # SIMO peeking up from bottom
+    'sacha_names',     # Sacha names ramping sequence with applause
+    'fortnite',        # Nickeh30 fortnite video easter egg
+    'legendary_theme'  # Unlocking legendary theme (100% completion)
+]
+
+SECRET_BITS = {code: 1 << i for i, code in enumerate(ALL_SECRETS)}
+
+# Rewards for completion rather than secrets to find; they don't count
+# towards the percentage
+REWARD_SECRETS = {'legendary_theme'}
+COMPLETION_MASK = sum(bit for code, bit in SECRET_BITS.items() if code not in REWARD_SECRETS)
+# Users' masks are BIGINT
+assert len(ALL_SECRETS) <= 63
+
+# Users shown on the secret leaderboard
+SECRET_LEADERBOARD_SIZE = 25
+
+
+def found_count(mask):
+    """Number of secrets in a mask."""
+    return bin(mask).count('1')
+
+
+def secrets_mask(codes):
+    """Mask of some secret codes, which must all be valid."""
+    mask = 0
+    for code in codes:
+        mask |= SECRET_BITS[code]
+    return mask
+
+
+def unknown_secrets(codes):
+    """The codes that are not secrets."""
+    return [code for code in codes if code not in SECRET_BITS]
+
+
+def found_secrets(mask):
+    """Secret codes in a mask, in ALL_SECRETS order."""
+    return [code for code in ALL_SECRETS if mask & SECRET_BITS[code]]
+
+
+def secret_progress(mask):
+    """The progress response for a mask."""
+    total_found = found_count(mask & COMPLETION_MASK)
+    total_secrets = found_count(COMPLETION_MASK)
+    return {
+        'total_found': total_found,
+        'total_secrets': total_secrets,
+        'percentage': round((total_found / total_secrets) * 100),
+        'found_secrets': found_secrets(mask),
+        'all_secrets': ALL_SECRETS
+    }
+
+
+def user_secrets_mask(user_id):
+    return db.session.scalar(select(User.secrets_mask).where(User.id == user_id)) or 0
+
+
+def record_secrets(user_id, codes):
+    """
+    Record that a user found some (valid) secrets. Returns (newly found
+    codes, the user's mask afterwards) and commits if anything changed.
+    """
+    wanted = secrets_mask(codes)
+    mask = user_secrets_mask(user_id)
+    if mask & wanted == wanted:
+        return [], mask
+
+    missing = [code for code in dict.fromkeys(codes) if not mask & SECRET_BITS[code]]
+    now = datetime.utcnow()
+    # Racing requests may both get here; only one of them inserts each row
+    inserted = set(insert_many_unless_exist(
+        UserSecret,
+        ['user_id', 'secret_code'],
+        [{'user_id': user_id, 'secret_code': code, 'discovered_at': now} for code in missing],
+        UserSecret.secret_code
+    ))
+    values = {'secrets_mask': User.secrets_mask.op('|')(wanted)}
+    counted = len(inserted - REWARD_SECRETS)
+    if counted:
+        values['secret_count'] = User.secret_count + counted
+        # A racing request may have committed a later discovery already
+        values['last_secret_at'] = case((User.last_secret_at > now, User.last_secret_at), else_=now)
+    mask = db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(**values)
+        .returning(User.secrets_mask)
+    ).scalar_one()
+    increment_counters(SecretStat, 'secret_code', 'found_count', inserted)
+    db.session.commit()
+    return [code for code in missing if code in inserted], mask
+
+
+def secret_leaderboard_query(limit=SECRET_LEADERBOARD_SIZE):
+    """Users who found any secret, most first; ties go to whoever got there first."""
+    return db.session.query(
+        User.name,
+        User.picture,
+        User.secrets_mask,
+        User.secret_count,
+        User.last_secret_at
+    ).filter(User.secret_count > 0)\
+        .order_by(User.secret_count.desc(), User.last_secret_at.asc(), User.id.asc())\
+        .limit(limit)
+
+
+def secret_stats():
+    """How many users found each secret, and the users who found the most."""
+    players = db.session.scalar(select(func.count()).select_from(User))
+    counts = dict(db.session.execute(select(SecretStat.secret_code, SecretStat.found_count)).all())
+    total_secrets = found_count(COMPLETION_MASK)
+    return {
+        'total_players': players,
+        'total_secrets': total_secrets,
+        'secrets': [{
+            'secret_code': code,
+            'found_count': counts.get(code, 0),
+            'percentage': round(counts.get(code, 0) / players * 100, 1) if players else 0
+        } for code in ALL_SECRETS],
+        'leaderboard': [{
+            'rank': i + 1,
+            'name': row.name,
+            'picture': row.picture,
+            'total_found': row.secret_count,
+            'percentage': round((row.secret_count / total_secrets) * 100),
+            'completed': row.secrets_mask & COMPLETION_MASK == COMPLETION_MASK,
+            'legendary': bool(row.secrets_mask & SECRET_BITS['legendary_theme']),
+            'found_at': row.last_secret_at.isoformat() if row.last_secret_at else None
+        } for i, row in enumerate(secret_leaderboard_query())]
+    }
+
+
+def rebuild_secret_progress():
+    """
+    Recompute every user's mask and counters, and the per-secret counts,
+    from user_secrets. Returns (users changed, secrets whose count changed).
+    """
+    progress = {}
+    counts = dict.fromkeys(ALL_SECRETS, 0)
+    rows = db.session.execute(select(UserSecret.user_id, UserSecret.secret_code, UserSecret.discovered_at))
+    for user_id, code, discovered_at in rows:
+        if code not in SECRET_BITS:
+            continue
+        counts[code] += 1
+        mask, found, found_at = progress.get(user_id, (0, 0, None))
+        if code not in REWARD_SECRETS:
+            found += 1
+            if discovered_at and (found_at is None or discovered_at > found_at):
+                found_at = discovered_at
+        progress[user_id] = (mask | SECRET_BITS[code], found, found_at)
+
+    changed_users = []
+    stored = db.session.execute(select(User.id, User.secrets_mask, User.secret_count, User.last_secret_at))
+    for user_id, *values in stored:
+        mask, found, found_at = progress.get(user_id, (0, 0, None))
+        if tuple(values) != (mask, found, found_at):
+            changed_users.append({'id': user_id, 'secrets_mask': mask, 'secret_count': found,
+                                  'last_secret_at': found_at})
+    if changed_users:
+        db.session.execute(update(User), changed_users)
+
+    stored_counts = dict(db.session.execute(select(SecretStat.secret_code, SecretStat.found_count)).all())
+    changed_codes = [code for code, count in counts.items() if stored_counts.get(code, 0) != count]
+    for code in changed_codes:
+        db.session.merge(SecretStat(secret_code=code, found_count=counts[code]))
+    db.session.commit()
+    return len(changed_users), len(changed_codes)
@@ -0,0 +1,201 @@
+"""
+All-time standings: check-ins, streaks, average rank and net likes per user.
+
+The numbers are materialized in user_stats and updated in the transaction
+of each check-in and reaction, so /api/standings reads one row per user
+however many days of history there are:
+
+- claim_rank() bumps the day's counter in checkin_days before a check-in is
+  stored. The counter is the new check-in's rank, and the row lock queues
+  concurrent check-ins until the one holding it commits, so ranks follow
+  the order check-ins are stored in, which is the leaderboard's order.
+- record_checkin() adds the rank to the user's row and extends or restarts
+  their streak.
+- record_reaction_change() moves the net likes of check-in owners together
+  with the like/dislike tallies (see leaderboard.apply_reaction_change).
+
+A streak is stored as of the user's last check-in. Reads count it as broken
+once that day is older than yesterday. `flask rebuild-standings` recomputes
+everything from checkins and reactions.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import case, func, select, update
+
+from models import db, User, CheckIn, Reaction, UserStats, CheckInDay, upsert
+
+# Rows read from the database at a time by iter_standings()
+STANDINGS_BATCH_SIZE = 200
+REACTION_POINTS = {'like': 1, 'dislike': -1}
+STATS_COLUMNS = ['total_checkins', 'rank_sum', 'current_streak', 'longest_streak', 'last_checkin_date', 'net_likes']
+
+
+def claim_rank(day):
+    """
+    The rank of a check-in about to be stored on `day`.
+
+    Locks the day's counter until the transaction ends; take the check-in
+    time after this, so it sorts after every check-in ranked before it.
+    """
+    stmt = upsert(CheckInDay, ['check_in_date'], {'check_in_date': day, 'checkin_count': 1},
+                  lambda excluded: {'checkin_count': CheckInDay.checkin_count + 1})
+    return db.session.scalar(stmt.returning(CheckInDay.checkin_count))
+
+
+def record_checkin(user_id, day, rank):
+    """Add a check-in with `rank` on `day` to the user's stats. The caller commits."""
+    streak = case((UserStats.last_checkin_date == day - timedelta(days=1), UserStats.current_streak + 1), else_=1)
+    # Every expression in the update reads the row as it was, before the update
+    db.session.execute(upsert(UserStats, ['user_id'], {
+        'user_id': user_id,
+        'total_checkins': 1,
+        'rank_sum': rank,
+        'current_streak': 1,
+        'longest_streak': 1,
+        'last_checkin_date': day,
+        'net_likes': 0
+    }, lambda excluded: {
+        'total_checkins': UserStats.total_checkins + 1,
+        'rank_sum': UserStats.rank_sum + excluded.rank_sum,
+        'current_streak': streak,
+        'longest_streak': case((streak > UserStats.longest_streak, streak), else_=UserStats.longest_streak),
+        'last_checkin_date': excluded.last_checkin_date
+    }))
+
+
+def record_reaction_change(old, new):
+    """
+    Move the net likes of the owners of the check-ins involved in a reaction
+    that changed from `old` to `new`, (checkin_id, reaction_type) tuples or
+    None. The caller commits.
+    """
+    deltas = defaultdict(int)
+    if old is not None:
+        deltas[old[0]] -= REACTION_POINTS[old[1]]
+    if new is not None:
+        deltas[new[0]] += REACTION_POINTS[new[1]]
+    for checkin_id, delta in sorted(deltas.items()):
+        if delta:
+            owner = select(CheckIn.user_id).where(CheckIn.id == checkin_id).scalar_subquery()
+            UserStats.query.filter(UserStats.user_id == owner)\
+                .update({'net_likes': UserStats.net_likes + delta}, synchronize_session=False)
+
+
+STANDINGS_ORDERS = ['checkins', 'streak', 'average_rank', 'likes']
+
+
+def standings_query(order, today):
+    """Every user who checked in at least once, in the given order (one of STANDINGS_ORDERS)."""
+    current_streak = case((UserStats.last_checkin_date >= today - timedelta(days=1), UserStats.current_streak),
+                          else_=0)
+    average_rank = UserStats.rank_sum * 1.0 / UserStats.total_checkins
+    order_by = {
+        'checkins': (UserStats.total_checkins.desc(), average_rank),
+        'streak': (current_streak.desc(), UserStats.longest_streak.desc()),
+        'average_rank': (average_rank, UserStats.total_checkins.desc()),
+        'likes': (UserStats.net_likes.desc(), UserStats.total_checkins.desc()),
+    }[order]
+    return db.session.query(
+        User.name,
+        User.picture,
+        UserStats.total_checkins,
+        average_rank.label('average_rank'),
+        current_streak.label('current_streak'),
+        UserStats.longest_streak,
+        UserStats.net_likes,
+        UserStats.last_checkin_date
+    ).join(User, User.id == UserStats.user_id)\
+        .filter(UserStats.total_checkins > 0)\
+        .order_by(*order_by, User.id)
+
+
+def iter_standings(order, today):
+    """Yield the standings entries in the given order."""
+    return ({
+        'rank': i + 1,
+        'name': row.name,
+        'picture': row.picture,
+        'total_checkins': row.total_checkins,
+        'average_rank': round(row.average_rank, 2),
+        'current_streak': row.current_streak,
+        'longest_streak': row.longest_streak,
+        'net_likes': row.net_likes,
+        'last_checkin_date': row.last_checkin_date.isoformat()
+    } for i, row in enumerate(standings_query(order, today).yield_per(STANDINGS_BATCH_SIZE)))
+
+
+def compute_standings():
+    """
+    Every user's stats and every day's check-in count, recomputed from
+    checkins and reactions. Returns ({user_id: stats}, {date: count}).
+    """
+    rank = func.row_number().over(
+        partition_by=CheckIn.check_in_date,
+        order_by=(CheckIn.check_in_time.asc(), CheckIn.id.asc())
+    )
+    ranked = select(CheckIn.user_id, CheckIn.check_in_date, rank.label('rank')).subquery()
+    rows = db.session.execute(select(ranked.c.user_id, ranked.c.check_in_date, ranked.c.rank)
+                              .order_by(ranked.c.user_id, ranked.c.check_in_date))
+
+    stats = {}
+    days = defaultdict(int)
+    for user_id, day, rank in rows:
+        days[day] += 1
+        user = stats.setdefault(user_id, dict.fromkeys(STATS_COLUMNS, 0))
+        if user['last_checkin_date'] and user['last_checkin_date'] == day - timedelta(days=1):
+            user['current_streak'] += 1
+        else:
+            user['current_streak'] = 1
+        user['longest_streak'] = max(user['longest_streak'], user['current_streak'])
+        user['total_checkins'] += 1
+        user['rank_sum'] += rank
+        user['last_checkin_date'] = day
+
+    points = case(*((Reaction.reaction_type == reaction_type, value)
+                    for reaction_type, value in REACTION_POINTS.items()), else_=0)
+    net_likes = db.session.execute(
+        select(CheckIn.user_id, func.sum(points))
+        .join(Reaction, Reaction.checkin_id == CheckIn.id)
+        .group_by(CheckIn.user_id)
+    )
+    for user_id, net in net_likes:
+        if user_id in stats:
+            stats[user_id]['net_likes'] = net
+    return stats, dict(days)
+
+
+def rebuild_standings():
+    """
+    Overwrite user_stats and checkin_days with a recompute from the raw
+    tables. Returns (users changed, days changed).
+    """
+    stats, days = compute_standings()
+
+    stored = {row.user_id: row for row in db.session.execute(select(UserStats.user_id, *(
+        getattr(UserStats, column) for column in STATS_COLUMNS)))}
+    changed, added = [], []
+    for user_id, values in stats.items():
+        row = stored.pop(user_id, None)
+        if row is None:
+            added.append(dict(values, user_id=user_id))
+        elif any(getattr(row, column) != values[column] for column in STATS_COLUMNS):
+            changed.append(dict(values, user_id=user_id))
+    if changed:
+        db.session.execute(update(UserStats), changed)
+    if added:
+        db.session.add_all(UserStats(**row) for row in added)
+    if stored:
+        # Stats of users without check-ins
+        UserStats.query.filter(UserStats.user_id.in_(list(stored))).delete(synchronize_session=False)
+
+    stored_days = dict(db.session.execute(select(CheckInDay.check_in_date, CheckInDay.checkin_count)).all())
+    changed_days = [day for day in set(days) | set(stored_days) if days.get(day) != stored_days.get(day)]
+    for day in changed_days:
+        if day in days:
+            db.session.merge(CheckInDay(check_in_date=day, checkin_count=days[day]))
+        else:
+            CheckInDay.query.filter_by(check_in_date=day).delete(synchronize_session=False)
+    db.session.commit()
+    return len(changed) + len(added) + len(stored), len(changed_days)
@@ -0,0 +1,131 @@
+"""
+Bearer token store for mobile/cross-origin logins.
+
+Tokens live in the `auth_tokens` table so they survive restarts and are
+shared by every gunicorn worker. Only a SHA-256 of each token is stored.
+CachedTokenStore puts a short-lived in-process cache in front of any store
+so repeat requests with the same token skip the lookup.
+"""
+
+import hashlib
+import secrets
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+
+from cache import TTLCache, MISSING
+from models import db, AuthToken
+
+
+def hash_token(token):
+    """Tokens are random, so a fast hash is enough to keep them out of the DB."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenStore:
+    """Interface for token stores."""
+
+    def issue(self, user_id, ttl):
+        """Create a token for a user, valid for `ttl` (a timedelta)."""
+        raise NotImplementedError
+
+    def lookup(self, token):
+        """Return (user_id, expires) for a valid token, or None."""
+        raise NotImplementedError
+
+    def revoke(self, token):
+        raise NotImplementedError
+
+    def sweep_expired(self, batch_size=500):
+        """Delete up to `batch_size` expired tokens and return how many went."""
+        raise NotImplementedError
+
+
+class DatabaseTokenStore(TokenStore):
+    """Tokens stored in the `auth_tokens` table."""
+
+    def __init__(self, sweep_interval=3600):
+        # Issuing a token also sweeps, at most once per interval per process
+        self.sweep_interval = sweep_interval
+        self._last_sweep = None
+
+    def issue(self, user_id, ttl):
+        token = secrets.token_urlsafe(32)
+        db.session.add(AuthToken(
+            token_hash=hash_token(token),
+            user_id=user_id,
+            expires_at=datetime.utcnow() + ttl
+        ))
+        db.session.commit()
+        if self._last_sweep is None or time.monotonic() - self._last_sweep > self.sweep_interval:
+            self._last_sweep = time.monotonic()
+            self.sweep_expired()
+        return token
+
+    def lookup(self, token):
+        row = db.session.query(AuthToken.user_id, AuthToken.expires_at)\
+            .filter(AuthToken.token_hash == hash_token(token),
+                    AuthToken.expires_at > datetime.utcnow())\
+            .first()
+        return (row.user_id, row.expires_at) if row else None
+
+    def revoke(self, token):
+        AuthToken.query.filter_by(token_hash=hash_token(token)).delete()
+        db.session.commit()
+
+    def sweep_expired(self, batch_size=500):
+        # Bounded delete through the expiry index, so a sweep never has to
+        # touch every token at once
+        expired = select(AuthToken.token_hash)\
+            .where(AuthToken.expires_at < datetime.utcnow())\
+            .limit(batch_size)\
+            .scalar_subquery()
+        deleted = AuthToken.query.filter(AuthToken.token_hash.in_(expired))\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+
+class CachedTokenStore(TokenStore):
+    """Read-through LRU cache with a TTL in front of another token store."""
+
+    def __init__(self, store, maxsize=1024, ttl=60):
+        self.store = store
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def issue(self, user_id, ttl):
+        return self.store.issue(user_id, ttl)
+
+    def lookup(self, token):
+        key = hash_token(token)
+        cached = self.cache.get(key)
+        if cached is not MISSING and cached[1] > datetime.utcnow():
+            return cached
+        result = self.store.lookup(token)
+        if result is not None:
+            # Never cache past the token's own expiry
+            remaining = (result[1] - datetime.utcnow()).total_seconds()
+            self.cache.set(key, result, ttl=min(self.cache.ttl, remaining))
+        return result
+
+    def revoke(self, token):
+        # Other workers may still accept the token from their own cache, for
+        # up to TOKEN_CACHE_TTL seconds
+        self.cache.invalidate(hash_token(token))
+        self.store.revoke(token)
+
+    def sweep_expired(self, batch_size=500):
+        return self.store.sweep_expired(batch_size)
+
+
+def create_token_store(app):
+    """Create the token store configured for the app."""
+    store = DatabaseTokenStore()
+    if app.config['TOKEN_CACHE_TTL'] > 0:
+        store = CachedTokenStore(
+            store,
+            maxsize=app.config['TOKEN_CACHE_SIZE'],
+            ttl=app.config['TOKEN_CACHE_TTL']
+        )
+    return store
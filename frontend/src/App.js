@@ -4,6 +4,9 @@ import { Chess } from 'chess.js';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
 
+// Secrets discovered within this many ms are sent in one request
+const SECRET_BATCH_DELAY = 150;
+
 // Helper to get auth token from localStorage
 const getAuthToken = () => localStorage.getItem('auth_token');
 
@@ -304,6 +307,40 @@ function App() {
   }, []);
 
 
+  // Apply secret progress from the server: found secrets, percentage and
+  // the themes they unlock
+  const applySecretProgress = useCallback((data) => {
+    setSecretProgress(data);
+    
+    // Auto-unlock themes based on secrets
+    const newUnlockedThemes = ['default'];
+    
+    // Check for kabouter theme
+    if (data.found_secrets.includes('theme_kabouter')) {
+      newUnlockedThemes.push('kabouter');
+    }
+    
+    // Check for chess theme
+    if (data.found_secrets.includes('chess_victory')) {
+      newUnlockedThemes.push('chess');
+    }
+    
+    // Check for legendary theme (100% completion!)
+    const justReached100 = data.percentage === 100 && !newUnlockedThemes.includes('legendary');
+    if (data.percentage === 100) {
+      newUnlockedThemes.push('legendary');
+    }
+    
+    // Update unlocked themes
+    setUnlockedThemes(newUnlockedThemes);
+    localStorage.setItem('unlockedThemes', JSON.stringify(newUnlockedThemes));
+    
+    // Flag to celebrate reaching 100% (handled in separate useEffect)
+    if (justReached100) {
+      setShouldCelebrate100(true);
+    }
+  }, []);
+
   // Fetch secret progress
   const fetchSecretProgress = useCallback(async () => {
     if (!user) return;
@@ -316,65 +353,53 @@ function App() {
       
       const data = await res.json();
       if (res.ok) {
-        setSecretProgress(data);
-        
-        // Auto-unlock themes based on secrets
-        const newUnlockedThemes = ['default'];
-        
-        // Check for kabouter theme
-        if (data.found_secrets.includes('theme_kabouter')) {
-          newUnlockedThemes.push('kabouter');
-        }
-        
-        // Check for chess theme
-        if (data.found_secrets.includes('chess_victory')) {
-          newUnlockedThemes.push('chess');
-        }
-        
-        // Check for legendary theme (100% completion!)
-        const justReached100 = data.percentage === 100 && !newUnlockedThemes.includes('legendary');
-        if (data.percentage === 100) {
-          newUnlockedThemes.push('legendary');
-        }
-        
-        // Update unlocked themes
-        setUnlockedThemes(newUnlockedThemes);
-        localStorage.setItem('unlockedThemes', JSON.stringify(newUnlockedThemes));
-        
-        // Flag to celebrate reaching 100% (handled in separate useEffect)
-        if (justReached100) {
-          setShouldCelebrate100(true);
-        }
+        applySecretProgress(data);
       }
     } catch (err) {
       console.error('Error fetching secret progress:', err);
     }
-  }, [user]);
-
-  // Track secret discovery with immediate UI update
-  const discoverSecret = useCallback(async (secretCode) => {
-    if (!user) return;
+  }, [user, applySecretProgress]);
+
+  // Secrets often fire in bursts (theme unlocks, several easter eggs at
+  // once); collect them briefly and record them in one request
+  const pendingSecretsRef = useRef(new Set());
+  const secretFlushTimerRef = useRef(null);
+
+  const flushSecrets = useCallback(async () => {
+    secretFlushTimerRef.current = null;
+    const secretCodes = [...pendingSecretsRef.current];
+    pendingSecretsRef.current.clear();
+    if (!user || secretCodes.length === 0) return;
     
     try {
-      const res = await fetch(`${API_URL}/api/secret/discover`, {
+      const res = await fetch(`${API_URL}/api/secret/discover/batch`, {
         method: 'POST',
         headers: getAuthHeaders(),
         credentials: 'include',
-        body: JSON.stringify({ secret_code: secretCode })
+        body: JSON.stringify({ secret_codes: secretCodes })
       });
       
       const data = await res.json();
       if (res.ok) {
-        if (!data.already_found) {
+        data.new_secrets.forEach(secretCode => {
           console.log(`🎉 New secret discovered: ${secretCode}! (${data.percentage}%)`);
-        }
-        // Immediately refresh progress to update the bar
-        fetchSecretProgress();
+        });
+        // The response carries the updated progress, no need to refetch it
+        applySecretProgress(data);
       }
     } catch (err) {
-      console.error('Error recording secret:', err);
+      console.error('Error recording secrets:', err);
+    }
+  }, [user, applySecretProgress]);
+
+  // Track secret discovery with immediate UI update
+  const discoverSecret = useCallback((secretCode) => {
+    if (!user) return;
+    pendingSecretsRef.current.add(secretCode);
+    if (!secretFlushTimerRef.current) {
+      secretFlushTimerRef.current = setTimeout(flushSecrets, SECRET_BATCH_DELAY);
     }
-  }, [user, fetchSecretProgress]);
+  }, [user, flushSecrets]);
 
   // Fetch check-in status
   const fetchStatus = useCallback(async () => {
@@ -426,6 +451,29 @@ function App() {
     fetchLeaderboard();
   }, [fetchUser, fetchLeaderboard]);
 
+  // Live leaderboard updates instead of polling
+  useEffect(() => {
+    const source = new EventSource(`${API_URL}/api/leaderboard/stream`);
+    // Catch up on anything missed while (re)connecting
+    source.onopen = () => fetchLeaderboard();
+    source.addEventListener('checkin', (e) => {
+      const { entry } = JSON.parse(e.data);
+      setLeaderboard(prev => {
+        if (prev.some(item => item.checkin_id === entry.checkin_id)) return prev;
+        return [...prev, entry].sort((a, b) => a.rank - b.rank);
+      });
+    });
+    source.addEventListener('reaction', (e) => {
+      const { counts } = JSON.parse(e.data);
+      setLeaderboard(prev => prev.map(item => {
+        const count = counts.find(c => c.checkin_id === item.checkin_id);
+        return count ? { ...item, likes: count.likes, dislikes: count.dislikes } : item;
+      }));
+    });
+    source.addEventListener('resync', () => fetchLeaderboard());
+    return () => source.close();
+  }, [fetchLeaderboard]);
+
   useEffect(() => {
     if (user) {
       fetchStatus();
@@ -1447,7 +1495,17 @@ function App() {
     window.location.href = `${API_URL}/auth/login`;
   };
 
-  const handleLogout = () => {
+  const handleLogout = async () => {
+    // Revoke the bearer token server-side, a navigation can't send it
+    try {
+      await fetch(`${API_URL}/auth/logout`, {
+        method: 'POST',
+        headers: getAuthHeaders(),
+        credentials: 'include'
+      });
+    } catch (error) {
+      console.error('Error logging out:', error);
+    }
     localStorage.removeItem('auth_token');
     window.location.href = `${API_URL}/auth/logout`;
   };
@@ -1512,16 +1570,18 @@ function App() {
             setShowCamera(true);
             setMessage({ 
               type: 'success', 
-              text: `📍 Location verified! ${data.distance}m from Science Park` 
+              text: `📍 Location verified! You're at ${data.venue.name}` 
             });
             // Start camera
             await startCamera();
           } else {
             setMessage({ 
               type: 'error', 
-              text: data.error === 'Too far from Science Park' 
-                ? `✗ You're ${data.distance}m away. Get within ${data.allowed_radius}m!`
-                : data.error 
+              text: data.allowed_radius
+                ? `✗ You're ${data.distance}m from ${data.venue.name}. Get within ${data.allowed_radius}m!`
+                : data.venue
+                  ? `✗ You're ${data.distance}m outside ${data.venue.name}.`
+                  : data.error 
             });
           }
         } catch (err) {
@@ -2026,8 +2086,8 @@ function App() {
                 </div>
                 
                 <div className="feed-photo-container">
-                  {entry.photo ? (
-                    <img src={entry.photo} alt={`${entry.name}'s check-in`} className="feed-photo" />
+                  {entry.photo_url ? (
+                    <img src={`${API_URL}${entry.photo_url}`} alt={`${entry.name}'s check-in`} className="feed-photo" loading="lazy" />
                   ) : (
                     <div className="feed-photo-placeholder">
                       <span>📍</span>